@@ -8,16 +8,109 @@ class Settings(BaseSettings):
     secret_key: str = "change-me"
     access_token_expire_minutes: int = 120
     database_url: str = "sqlite:///./image_restore.db"
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout_seconds: float = 30.0
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+    sqlite_wal: bool = True
+    sqlite_busy_timeout_ms: int = 5000
     storage_dir: str = "./storage"
+    upload_max_mb: int = 50
+    upload_max_megapixels: int = 64
+    storage_backend: str = "local"
+    scratch_cache_max_mb: int = 2048
+    s3_bucket: str = ""
+    s3_prefix: str = ""
+    s3_endpoint_url: str = ""
+    s3_region: str = ""
+    s3_max_pool_connections: int = 32
+    s3_multipart_chunk_mb: int = 16
+    s3_presign_downloads: bool = True
+    s3_presign_expiry_seconds: int = 300
+    blob_gc_interval_seconds: int = 3600
+    blob_gc_grace_seconds: int = 3600
+    blob_migrate_legacy: bool = True
 
     realesrgan_cmd: str | None = None
     gfpgan_cmd: str | None = None
     deoldify_cmd: str | None = None
+    realesrgan_timeout_seconds: float = 900.0
+    gfpgan_timeout_seconds: float = 600.0
+    deoldify_timeout_seconds: float = 900.0
+    tool_log_max_bytes: int = 65536
 
     realesrgan_model_path: str | None = None
     gfpgan_model_path: str | None = None
     gfpgan_upsampler_model_path: str | None = None
 
+    face_detect_enabled: bool = True
+    face_detect_max_side: int = 800
+    face_crop_margin: float = 0.5
+    face_crop_max_coverage: float = 0.6
+
+    realesrgan_tile_mode: str = "auto"
+    realesrgan_memory_budget_mb: int = 1024
+    realesrgan_tile_overlap: int = 16
+
+    model_cache_max_mb: int = 2048
+    model_warmup: str = ""
+
+    result_cache_enabled: bool = True
+    result_cache_max_mb: int = 10240
+
+    denoise_workers: int = 0
+
+    intermediate_cache_enabled: bool = True
+    intermediate_cache_max_mb: int = 4096
+    intermediate_cache_max_age_hours: int = 72
+    intermediate_cache_max_entry_mb: int = 256
+
+    admission_memory_budget_mb: int = 6144
+    admission_user_share: float = 0.5
+    admission_user_max_concurrent: int = 2
+    admission_step_wait_seconds: float = 30.0
+    admission_retry_after_seconds: int = 10
+    max_concurrent_deoldify: int = 1
+    max_concurrent_gfpgan: int = 1
+    max_concurrent_realesrgan: int = 1
+    max_concurrent_opencv: int = 4
+
+    job_workers: int = 2
+    job_queue_max: int = 100
+    job_poll_interval_seconds: float = 1.0
+    job_max_attempts: int = 3
+    batch_max_images: int = 500
+    batch_chunk_size: int = 16
+    batch_commit_size: int = 4
+    batch_commit_seconds: float = 2.0
+    batch_stream_max_seconds: float = 3600.0
+
+    derivative_cache_max_mb: int = 1024
+    derivatives_eager: bool = False
+
+    progress_queue_size: int = 64
+    progress_max_subscribers: int = 1000
+    progress_min_interval_seconds: float = 0.25
+    progress_heartbeat_seconds: float = 15.0
+
+    metrics_enabled: bool = True
+    profile_slow_request_ms: float = 0.0
+    profile_sample_interval_ms: float = 10.0
+    profile_history_seconds: float = 300.0
+
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 2
+    password_hash_queue_max: int = 32
+    login_busy_retry_after_seconds: int = 2
+    login_throttle_window_seconds: float = 300.0
+    login_max_failures_per_email: int = 5
+    login_max_failures_per_ip: int = 50
+
+    session_cache_ttl_seconds: int = 30
+    session_cache_max_entries: int = 10000
+    session_invalidation: str = "auto"
+
     model_config = SettingsConfigDict(env_file=".env", case_sensitive=False)
 
 
@@ -7,7 +7,14 @@ from passlib.context import CryptContext
 from app.core.config import get_settings
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes below the configured cost are rehashed on the next successful login; raising
+# BCRYPT_ROUNDS therefore upgrades accounts gradually, without a migration.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=get_settings().bcrypt_rounds,
+    bcrypt__min_rounds=get_settings().bcrypt_rounds,
+)
 ALGORITHM = "HS256"
 
 
@@ -15,6 +22,10 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -1,15 +1,57 @@
 from pathlib import Path
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
 from app.core.config import get_settings
+from app.services.metrics import count_query
 
 
+# Drivers used by the async engine, which shares the database (and settings) of the sync one.
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+psycopg"}
+
 settings = get_settings()
-connect_args = {"check_same_thread": False} if settings.database_url.startswith("sqlite") else {}
-engine = create_engine(settings.database_url, future=True, connect_args=connect_args)
+database_url = make_url(settings.database_url)
+is_sqlite = database_url.get_backend_name() == "sqlite"
+
+
+def _engine_options() -> dict:
+    if is_sqlite:
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def _sqlite_pragmas(dbapi_connection, _record) -> None:
+    # WAL lets readers proceed while a writer commits, so local runs see roughly the
+    # concurrency Postgres gives; NORMAL sync is durable across application crashes in WAL mode.
+    cursor = dbapi_connection.cursor()
+    if settings.sqlite_wal and database_url.database not in (None, "", ":memory:"):
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+engine = create_engine(database_url, future=True, **_engine_options())
+async_engine = create_async_engine(
+    database_url.set(drivername=ASYNC_DRIVERS[database_url.get_backend_name()]), **_engine_options()
+)
+for sync_engine in (engine, async_engine.sync_engine):
+    event.listen(sync_engine, "before_cursor_execute", count_query)
+    if is_sqlite:
+        event.listen(sync_engine, "connect", _sqlite_pragmas)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+# Read paths on the event loop; objects stay usable after commit since lazy loads cannot run there.
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 
 class Base(DeclarativeBase):
@@ -20,6 +62,55 @@ def init_db() -> None:
     from app import models  # noqa: F401
 
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _backfill_current_versions()
+    _backfill_content_hashes()
+
+
+def _add_missing_columns() -> None:
+    # create_all() skips tables that already exist, so add newer columns (nullable) and their indexes.
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            missing = [column for column in table.columns if column.name not in existing]
+            for column in missing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def _backfill_current_versions() -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "UPDATE image_assets SET current_version = COALESCE("
+                "(SELECT MAX(version) FROM image_versions WHERE image_versions.image_id = image_assets.id), 1) "
+                "WHERE current_version IS NULL"
+            )
+        )
+
+
+def _backfill_content_hashes() -> None:
+    # Versions recorded before content hashing. Blob keys carry their digest; files still on a
+    # legacy path are hashed once here, so serving them never writes on a GET.
+    from app.services.blobs import BLOB_KEY, sha256_file
+
+    with engine.begin() as conn:
+        rows = conn.execute(text("SELECT id, path FROM image_versions WHERE content_hash IS NULL")).all()
+        for version_id, path in rows:
+            match = BLOB_KEY.match(path)
+            if match:
+                digest = match.group(1)
+            elif Path(path).is_file():
+                digest = sha256_file(Path(path))
+            else:
+                continue
+            conn.execute(
+                text("UPDATE image_versions SET content_hash = :digest WHERE id = :id"),
+                {"digest": digest, "id": version_id},
+            )
 
 
 def ensure_storage_dirs() -> None:
@@ -1,15 +1,29 @@
-from collections.abc import Generator
+import time
+from collections.abc import AsyncGenerator, Generator
+from dataclasses import dataclass
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core.security import decode_token
-from app.db import SessionLocal
+from app.db import AsyncSessionLocal, SessionLocal
 from app.models import AuthToken, User
+from app.services.sessions import SessionCache
 
 
 bearer_scheme = HTTPBearer(auto_error=False)
+session_cache = SessionCache()
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    # The signed-in user as handlers see it, whether it came from the session cache or the
+    # database: identity only, and not attached to any session.
+    id: int
+    email: str
 
 
 def get_db() -> Generator[Session, None, None]:
@@ -20,10 +34,12 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    db: Session = Depends(get_db),
-) -> User:
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _token_claims(credentials: HTTPAuthorizationCredentials | None) -> dict:
     if credentials is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing bearer token")
 
@@ -33,16 +49,54 @@ def get_current_user(
     except ValueError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-    jti = payload.get("jti")
-    user_id = payload.get("uid")
-    if not jti or not user_id:
+    if not payload.get("jti") or not payload.get("uid"):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+    return payload
 
-    token_row = db.query(AuthToken).filter(AuthToken.jti == jti, AuthToken.user_id == user_id).first()
+
+def _cached_user(payload: dict) -> CurrentUser | None:
+    cached = session_cache.get(payload["jti"], payload["uid"])
+    return CurrentUser(id=cached.user_id, email=cached.email) if cached is not None else None
+
+
+def _check_session(token_row: AuthToken | None) -> None:
     if token_row is None or token_row.is_revoked:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session revoked")
 
-    user = db.query(User).filter(User.id == user_id).first()
+
+def _remember_user(payload: dict, user: User | None) -> CurrentUser:
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    session_cache.put(payload["jti"], user.id, user.email, float(payload.get("exp", 0)) - time.time())
+    return CurrentUser(id=user.id, email=user.email)
+
+
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: Session = Depends(get_db),
+) -> CurrentUser:
+    payload = _token_claims(credentials)
+    cached = _cached_user(payload)
+    if cached is not None:
+        return cached
+
+    jti, user_id = payload["jti"], payload["uid"]
+    token_row = db.query(AuthToken).filter(AuthToken.jti == jti, AuthToken.user_id == user_id).first()
+    _check_session(token_row)
+    return _remember_user(payload, db.query(User).filter(User.id == user_id).first())
+
+
+async def get_current_user_async(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> User:
+    # Same checks as get_current_user, for handlers that run on the event loop.
+    payload = _token_claims(credentials)
+    cached = _cached_user(payload)
+    if cached is not None:
+        return cached
+
+    jti, user_id = payload["jti"], payload["uid"]
+    token_row = await db.scalar(select(AuthToken).where(AuthToken.jti == jti, AuthToken.user_id == user_id))
+    _check_session(token_row)
+    return _remember_user(payload, await db.scalar(select(User).where(User.id == user_id)))
@@ -1,18 +1,23 @@
 from pathlib import Path
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.core.config import get_settings
-from app.db import ensure_storage_dirs, init_db
-from app.routers.auth import router as auth_router
-from app.routers.images import router as images_router
+from app.db import async_engine, ensure_storage_dirs, init_db
+from app.deps import session_cache
+from app.routers.auth import password_hasher, router as auth_router
+from app.routers.images import processor, progress_hub, router as images_router, storage
+from app.routers.jobs import job_queue, router as jobs_router
+from app.services.metrics import REGISTRY, MetricsMiddleware
+from app.services.profiler import SamplingProfiler
 
 
 settings = get_settings()
 app = FastAPI(title=settings.app_name)
+profiler = SamplingProfiler() if settings.profile_slow_request_ms > 0 else None
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,13 +25,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware, profiler=profiler)
 
 
 @app.on_event("startup")
 def startup() -> None:
     init_db()
     ensure_storage_dirs()
+    processor.warm_up()
+    progress_hub.start()
+    if settings.metrics_enabled:
+        REGISTRY.start()
+    if profiler is not None:
+        profiler.start()
+    job_queue.start()
+    session_cache.start()
+    password_hasher.start()
+    storage.blobs.start()
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    storage.blobs.stop()
+    password_hasher.stop()
+    session_cache.stop()
+    job_queue.stop()
+    if profiler is not None:
+        profiler.stop()
+    REGISTRY.stop()
+    progress_hub.stop()
+
+
+@app.on_event("shutdown")
+async def dispose_async_engine() -> None:
+    await async_engine.dispose()
 
 
 @app.get("/health")
@@ -34,8 +69,21 @@ def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/health/models")
+def health_models() -> dict[str, object]:
+    return {"resident_bytes": processor.models.resident_bytes(), "models": processor.models.stats()}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> PlainTextResponse:
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 app.include_router(auth_router)
 app.include_router(images_router)
+app.include_router(jobs_router)
 
 frontend_dir = Path(__file__).resolve().parents[2].parent / "frontend"
 if frontend_dir.exists():
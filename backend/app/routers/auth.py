@@ -1,44 +1,115 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from app.core.security import create_access_token, get_password_hash, verify_password
-from app.deps import get_current_user, get_db, bearer_scheme
+from app.core.config import get_settings
+from app.core.security import create_access_token
+from app.db import SessionLocal
+from app.deps import CurrentUser, get_current_user, get_current_user_async, get_db, bearer_scheme, session_cache
 from app.models import AuthToken, User
 from app.schemas import LoginRequest, RegisterRequest, TokenResponse, UserResponse
+from app.services.passwords import HashingBusyError, LoginThrottle, PasswordHasher
 
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
+settings = get_settings()
+password_hasher = PasswordHasher()
+login_throttle = LoginThrottle()
+
+
+def _hashing_busy(exc: HashingBusyError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(exc),
+        headers={"Retry-After": str(settings.login_busy_retry_after_seconds)},
+    )
+
+
+# The auth handlers are async so that no threadpool thread waits on a hash; the short
+# database steps around the hash still run in the threadpool.
+def _email_registered(email: str) -> bool:
+    with SessionLocal() as db:
+        return db.query(User.id).filter(User.email == email).first() is not None
+
+
+def _create_user(email: str, password_hash: str) -> User:
+    with SessionLocal() as db:
+        user = User(email=email, password_hash=password_hash)
+        db.add(user)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email already registered")
+        db.refresh(user)
+        return user
+
+
+def _find_user(email: str) -> User | None:
+    with SessionLocal() as db:
+        return db.query(User).filter(User.email == email).first()
+
+
+def _issue_token(user: User, upgraded_hash: str | None) -> str:
+    token, jti, expires_at = create_access_token(subject=user.email, user_id=user.id)
+    with SessionLocal() as db:
+        if upgraded_hash is not None:
+            db.query(User).filter(User.id == user.id).update({User.password_hash: upgraded_hash})
+        db.add(AuthToken(jti=jti, user_id=user.id, expires_at=expires_at))
+        db.commit()
+    return token
 
 
 @router.post("/register", response_model=UserResponse)
-def register(payload: RegisterRequest, db: Session = Depends(get_db)) -> UserResponse:
-    existing = db.query(User).filter(User.email == payload.email.lower()).first()
-    if existing:
+async def register(payload: RegisterRequest) -> UserResponse:
+    email = payload.email.lower()
+    if await run_in_threadpool(_email_registered, email):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email already registered")
 
-    user = User(email=payload.email.lower(), password_hash=get_password_hash(payload.password))
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    try:
+        password_hash = await password_hasher.hash(payload.password)
+    except HashingBusyError as exc:
+        raise _hashing_busy(exc) from exc
+    user = await run_in_threadpool(_create_user, email, password_hash)
     return UserResponse(id=user.id, email=user.email)
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(payload: LoginRequest, db: Session = Depends(get_db)) -> TokenResponse:
-    user = db.query(User).filter(User.email == payload.email.lower()).first()
-    if user is None or not verify_password(payload.password, user.password_hash):
+async def login(payload: LoginRequest, request: Request) -> TokenResponse:
+    email = payload.email.lower()
+    email_key = f"email:{email}"
+    client_key = f"ip:{request.client.host if request.client else 'unknown'}"
+    retry_after = login_throttle.retry_after(
+        {email_key: settings.login_max_failures_per_email, client_key: settings.login_max_failures_per_ip}
+    )
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed sign-in attempts",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    user = await run_in_threadpool(_find_user, email)
+    valid, upgraded_hash = False, None
+    if user is not None:
+        try:
+            valid, upgraded_hash = await password_hasher.verify(payload.password, user.password_hash)
+        except HashingBusyError as exc:
+            raise _hashing_busy(exc) from exc
+    if not valid:
+        login_throttle.record_failure(email_key, client_key)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
-    token, jti, expires_at = create_access_token(subject=user.email, user_id=user.id)
-    db.add(AuthToken(jti=jti, user_id=user.id, expires_at=expires_at))
-    db.commit()
+    login_throttle.reset(email_key)
+    token = await run_in_threadpool(_issue_token, user, upgraded_hash)
     return TokenResponse(access_token=token)
 
 
 @router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
 def logout(
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme),
     db: Session = Depends(get_db),
 ) -> None:
@@ -57,8 +128,10 @@ def logout(
         token_row.is_revoked = True
         db.add(token_row)
         db.commit()
+    if jti:
+        session_cache.invalidate(jti)
 
 
 @router.get("/me", response_model=UserResponse)
-def me(current_user: User = Depends(get_current_user)) -> UserResponse:
+async def me(current_user: CurrentUser = Depends(get_current_user_async)) -> UserResponse:
     return UserResponse(id=current_user.id, email=current_user.email)
@@ -1,142 +1,353 @@
+import asyncio
+import base64
+import binascii
 import json
+import threading
+from collections.abc import AsyncIterator, Callable
+from contextlib import AbstractContextManager, ExitStack, nullcontext
+from datetime import datetime
 from pathlib import Path
-from uuid import uuid4
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
-from fastapi.responses import FileResponse
-from sqlalchemy import func
+from typing import Literal
+
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import and_, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.deps import get_current_user, get_db
-from app.models import ImageAsset, ImageVersion, User
+from app.deps import CurrentUser, get_async_db, get_current_user, get_current_user_async, get_db
+from app.models import ImageAsset, ImageVersion
 from app.schemas import ImageResponse, ProcessRequest, ProcessResponse
+from app.services.admission import AdmissionController, AdmissionRejected
 from app.services.processing import ProcessingService
-from app.services.storage import StorageService
+from app.services.progress import ProgressHub, ProgressLimitError, ProgressReporter, format_sse, progress_reporter
+from app.services.restore import RestoreService
+from app.services.storage import StorageService, UploadTooLargeError, sha256_file
+from app.services.tool_runner import ToolTimeout, tool_cancel
+
 
+# Downloads are per-user, so shared caches must not keep them; version-pinned URLs never change.
+PINNED_CACHE_CONTROL = "private, max-age=31536000, immutable"
+CURRENT_CACHE_CONTROL = "private, no-cache"
+DISCONNECT_POLL_SECONDS = 0.5
 
 router = APIRouter(prefix="/api/images", tags=["images"])
 storage = StorageService()
 processor = ProcessingService()
+admission = AdmissionController()
+processor.admission = admission
+progress_hub = ProgressHub()
+restorer = RestoreService(storage, processor)
 
 
 @router.post("/upload", response_model=ImageResponse)
 def upload_image(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ) -> ImageResponse:
     try:
-        saved_path = storage.save_upload(file, current_user.id)
+        upload = storage.save_upload(file)
+    except UploadTooLargeError as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc)) from exc
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
 
     image = ImageAsset(
         owner_id=current_user.id,
-        original_name=file.filename or saved_path.name,
-        original_path=str(saved_path),
-        current_path=str(saved_path),
+        original_name=file.filename or upload.key.rsplit("/", 1)[-1],
+        original_path=upload.key,
+        current_path=upload.key,
+        current_version=1,
+        content_hash=upload.content_hash,
+        width=upload.width,
+        height=upload.height,
     )
+    image.versions.append(
+        ImageVersion(
+            version=1,
+            path=upload.key,
+            operations_json=json.dumps({"upload": True}),
+            content_hash=upload.content_hash,
+        )
+    )
+    # One transaction for the asset and its first version. The response is built after the
+    # flush, which assigns the id and defaults, so the commit needs no refresh round trip.
     db.add(image)
-    db.commit()
-    db.refresh(image)
-
-    db.add(ImageVersion(image_id=image.id, version=1, path=str(saved_path), operations_json=json.dumps({"upload": True})))
-    db.commit()
-
-    return ImageResponse(
+    db.flush()
+    response = ImageResponse(
         id=image.id,
         original_name=image.original_name,
         created_at=image.created_at,
         updated_at=image.updated_at,
         current_version=1,
     )
+    db.commit()
+    if restorer.derivatives.settings.derivatives_eager:
+        background_tasks.add_task(restorer.derivatives.generate_all, upload.key)
 
+    return response
 
-@router.get("", response_model=list[ImageResponse])
-def list_images(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)) -> list[ImageResponse]:
-    images = (
-        db.query(ImageAsset)
-        .filter(ImageAsset.owner_id == current_user.id)
-        .order_by(ImageAsset.updated_at.desc())
-        .all()
-    )
 
-    response: list[ImageResponse] = []
-    for image in images:
-        version = db.query(func.max(ImageVersion.version)).filter(ImageVersion.image_id == image.id).scalar() or 1
-        response.append(
-            ImageResponse(
-                id=image.id,
-                original_name=image.original_name,
-                created_at=image.created_at,
-                updated_at=image.updated_at,
-                current_version=int(version),
+def _encode_cursor(image: ImageAsset) -> str:
+    raw = f"{image.updated_at.isoformat()}|{image.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        updated_at, image_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(updated_at), int(image_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor") from exc
+
+
+@router.get("", response_model=list[ImageResponse])
+async def list_images(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+) -> list[ImageResponse]:
+    query = select(ImageAsset).where(ImageAsset.owner_id == current_user.id)
+    if cursor:
+        updated_at, image_id = _decode_cursor(cursor)
+        query = query.where(
+            or_(
+                ImageAsset.updated_at < updated_at,
+                and_(ImageAsset.updated_at == updated_at, ImageAsset.id < image_id),
             )
         )
-    return response
+    images = list(await db.scalars(query.order_by(ImageAsset.updated_at.desc(), ImageAsset.id.desc()).limit(limit + 1)))
+
+    if len(images) > limit:
+        images = images[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(images[-1])
+
+    return [
+        ImageResponse(
+            id=image.id,
+            original_name=image.original_name,
+            created_at=image.created_at,
+            updated_at=image.updated_at,
+            current_version=image.current_version,
+        )
+        for image in images
+    ]
 
 
 @router.post("/{image_id}/process", response_model=ProcessResponse)
-def process_image(
+async def process_image(
     image_id: int,
     payload: ProcessRequest,
+    request: Request,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ) -> ProcessResponse:
-    image = db.query(ImageAsset).filter(ImageAsset.id == image_id, ImageAsset.owner_id == current_user.id).first()
-    if image is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    # Work runs off the event loop; if the client hangs up, any external tool it started is killed.
+    cancel = threading.Event()
+    work = asyncio.ensure_future(run_in_threadpool(_process_owned_image, db, current_user, image_id, payload, cancel))
+    while not work.done():
+        if await request.is_disconnected():
+            cancel.set()
+            break
+        await asyncio.wait({work}, timeout=DISCONNECT_POLL_SECONDS)
+    return await work
 
-    latest_version = db.query(func.max(ImageVersion.version)).filter(ImageVersion.image_id == image.id).scalar() or 1
-    next_version = int(latest_version) + 1
 
-    ext = Path(image.current_path).suffix.lower() or ".png"
-    out_path = storage.user_processed_dir(current_user.id) / f"{image.id}_{next_version}_{uuid4().hex}{ext}"
+def _process_owned_image(
+    db: Session, user: CurrentUser, image_id: int, payload: ProcessRequest, cancel: threading.Event
+) -> ProcessResponse:
+    image = db.query(ImageAsset).filter(ImageAsset.id == image_id, ImageAsset.owner_id == user.id).first()
+    if image is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    # Processing can take minutes; end the read transaction now so it does not hold a pooled
+    # connection (or a SQLite snapshot) meanwhile. The detached row keeps its loaded state; the
+    # version is recorded in one short transaction once the output exists.
+    db.expunge(image)
+    db.rollback()
 
+    reporter = ProgressReporter(progress_hub.sink(f"image:{image.id}"))
+    cancel_token = tool_cancel.set(cancel)
+    progress_token = progress_reporter.set(reporter)
     try:
-        processor.process_image(Path(image.current_path), out_path, payload)
+        result = restorer.produce(image, payload)
+    except AdmissionRejected as exc:
+        reporter.failed(exc.detail)
+        headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail, headers=headers) from exc
+    except ToolTimeout as exc:
+        reporter.failed(str(exc))
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(exc)) from exc
     except RuntimeError as exc:
+        reporter.failed(str(exc))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    finally:
+        progress_reporter.reset(progress_token)
+        tool_cancel.reset(cancel_token)
 
-    image.current_path = str(out_path)
-    db.add(image)
-    db.add(
-        ImageVersion(
-            image_id=image.id,
-            version=next_version,
-            path=str(out_path),
-            operations_json=payload.model_dump_json(),
-        )
+    try:
+        version = restorer.record_version(db, image.id, result).version
+        db.commit()
+    except LookupError as exc:
+        db.rollback()
+        reporter.failed(str(exc))
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(exc)) from exc
+    except IntegrityError as exc:
+        db.rollback()
+        reporter.failed("Another change to this image was saved at the same time")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Another change to this image was saved at the same time"
+        ) from exc
+    reporter.finished(version)
+
+    return ProcessResponse(image_id=image.id, version=version, message="Image processed")
+
+
+async def _owned_image_id(
+    image_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+) -> int:
+    exists = await db.scalar(select(ImageAsset.id).where(ImageAsset.id == image_id, ImageAsset.owner_id == current_user.id))
+    if exists is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    return image_id
+
+
+@router.get("/{image_id}/progress")
+async def image_progress(image_id: int = Depends(_owned_image_id)) -> StreamingResponse:
+    # Server-sent events for the next (or current) processing run of this image.
+    return progress_stream(f"image:{image_id}", replay_terminal=False)
+
+
+def progress_stream(topic: str, replay_terminal: bool, final: dict | None = None) -> StreamingResponse:
+    if final is not None:
+        return StreamingResponse(iter([format_sse(final)]), media_type="text/event-stream")
+    try:
+        progress_hub.check_capacity()
+    except ProgressLimitError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(exc),
+            headers={"Retry-After": str(admission.retry_after)},
+        ) from exc
+
+    async def stream() -> AsyncIterator[str]:
+        heartbeat = progress_hub.settings.progress_heartbeat_seconds
+        async for event in progress_hub.events(topic, replay_terminal=replay_terminal, heartbeat=heartbeat):
+            yield format_sse(event)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    db.commit()
 
-    return ProcessResponse(image_id=image.id, version=next_version, message="Image processed")
+
+def _get_version(db: Session, image: ImageAsset, version: int | None) -> ImageVersion:
+    version_row = (
+        db.query(ImageVersion)
+        .filter(ImageVersion.image_id == image.id, ImageVersion.version == (version or image.current_version))
+        .first()
+    )
+    if version_row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Version not found")
+
+    if not storage.exists(version_row.path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found in storage")
+    return version_row
+
+
+def _content_hash(version_row: ImageVersion) -> str:
+    # init_db backfills the column; a legacy file that was missing then is hashed per request
+    # rather than written back from a read.
+    if version_row.content_hash is not None:
+        return version_row.content_hash
+    with storage.local_copy(version_row.path) as path:
+        return storage.blobs.digest_of(version_row.path) or sha256_file(path)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _cached_file_response(
+    request: Request, open_file: Callable[[], AbstractContextManager[Path]], etag: str, pinned: bool, **kwargs
+) -> Response:
+    headers = {"ETag": etag, "Cache-Control": PINNED_CACHE_CONTROL if pinned else CURRENT_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    # The file stays pinned until the body has been sent, then the background task releases it.
+    stack = ExitStack()
+    try:
+        path = stack.enter_context(open_file())
+    except BaseException:
+        stack.close()
+        raise
+    # FileResponse answers Range and If-Range itself against the ETag set here.
+    return FileResponse(path=path, headers=headers, background=BackgroundTask(stack.close), **kwargs)
 
 
 @router.get("/{image_id}/download")
 def download_image(
+    request: Request,
     image_id: int,
     version: int | None = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     image = db.query(ImageAsset).filter(ImageAsset.id == image_id, ImageAsset.owner_id == current_user.id).first()
     if image is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
 
-    path = image.current_path
-    if version is not None:
-        version_row = (
-            db.query(ImageVersion)
-            .filter(ImageVersion.image_id == image.id, ImageVersion.version == version)
-            .first()
-        )
-        if version_row is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Version not found")
-        path = version_row.path
+    version_row = _get_version(db, image, version)
+    etag = f'"{_content_hash(version_row)}"'
+    filename = f"restored_{image.original_name}"
+    if not _etag_matches(request.headers.get("if-none-match"), etag):
+        url = storage.presigned_url(version_row.path, filename)
+        if url is not None:
+            # The object store serves the bytes (and Range requests) directly.
+            return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers={"Cache-Control": "no-store"})
+    return _cached_file_response(
+        request,
+        lambda: storage.local_copy(version_row.path),
+        etag,
+        pinned=version is not None,
+        filename=filename,
+    )
+
+
+@router.get("/{image_id}/preview")
+def preview_image(
+    request: Request,
+    image_id: int,
+    size: Literal["thumb", "preview"] = "thumb",
+    version: int | None = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    image = db.query(ImageAsset).filter(ImageAsset.id == image_id, ImageAsset.owner_id == current_user.id).first()
+    if image is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    version_row = _get_version(db, image, version)
 
-    file_path = Path(path)
-    if not file_path.exists():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found on disk")
+    def render() -> AbstractContextManager[Path]:
+        try:
+            return nullcontext(restorer.derivatives.get(version_row.path, size))
+        except (OSError, ValueError) as exc:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Could not render preview") from exc
 
-    return FileResponse(path=file_path, filename=f"restored_{image.original_name}")
+    etag = f'"{_content_hash(version_row)}-{size}"'
+    return _cached_file_response(request, render, etag, pinned=version is not None, media_type="image/webp")
@@ -0,0 +1,200 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db import AsyncSessionLocal
+from app.deps import CurrentUser, get_async_db, get_current_user, get_current_user_async, get_db
+from app.models import ImageAsset, ProcessingBatch, ProcessingJob
+from app.routers.images import admission, progress_hub, progress_stream
+from app.schemas import (
+    BatchProcessRequest,
+    BatchResponse,
+    BatchSubmitResponse,
+    JobQueueStats,
+    JobResponse,
+    JobSubmitResponse,
+    ProcessRequest,
+    ProcessResponse,
+)
+from app.services.jobs import (
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    JobQueue,
+    QueueFullError,
+    job_to_response,
+)
+from app.services.metrics import REGISTRY
+
+
+router = APIRouter(prefix="/api", tags=["jobs"])
+job_queue = JobQueue(admission, progress_hub.worker_queue(), REGISTRY.worker_queue())
+
+
+def _queue_full(exc: QueueFullError) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(exc), headers={"Retry-After": "5"})
+
+
+def _get_owned_batch(db: Session, batch_id: int, user: CurrentUser) -> ProcessingBatch:
+    batch = db.query(ProcessingBatch).filter(ProcessingBatch.id == batch_id, ProcessingBatch.owner_id == user.id).first()
+    if batch is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found")
+    return batch
+
+
+async def _get_owned_job(db: AsyncSession, job_id: int, user: CurrentUser) -> ProcessingJob:
+    job = await db.scalar(select(ProcessingJob).where(ProcessingJob.id == job_id, ProcessingJob.owner_id == user.id))
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+async def _owned_job_response(
+    job_id: int, db: AsyncSession = Depends(get_async_db), current_user: CurrentUser = Depends(get_current_user_async)
+) -> JobResponse:
+    return job_to_response(await _get_owned_job(db, job_id, current_user))
+
+
+@router.post("/images/{image_id}/jobs", response_model=JobSubmitResponse, status_code=status.HTTP_202_ACCEPTED)
+def submit_job(
+    image_id: int,
+    payload: ProcessRequest,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+) -> JobSubmitResponse:
+    image = db.query(ImageAsset).filter(ImageAsset.id == image_id, ImageAsset.owner_id == current_user.id).first()
+    if image is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    try:
+        job = job_queue.submit(db, image, payload)
+    except QueueFullError as exc:
+        raise _queue_full(exc) from exc
+
+    return JobSubmitResponse(job_id=job.id, status=job.status)
+
+
+@router.post("/batches", response_model=BatchSubmitResponse, status_code=status.HTTP_202_ACCEPTED)
+def submit_batch(
+    payload: BatchProcessRequest,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+) -> BatchSubmitResponse:
+    image_ids = list(dict.fromkeys(payload.image_ids))
+    if len(image_ids) > job_queue.settings.batch_max_images:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may contain at most {job_queue.settings.batch_max_images} images",
+        )
+
+    images = db.query(ImageAsset).filter(ImageAsset.id.in_(image_ids), ImageAsset.owner_id == current_user.id).all()
+    found = {image.id for image in images}
+    missing = [image_id for image_id in image_ids if image_id not in found]
+    if missing:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Images not found: {missing}")
+
+    images.sort(key=lambda image: image_ids.index(image.id))
+    try:
+        batch, jobs = job_queue.submit_batch(db, current_user.id, images, payload.options)
+    except QueueFullError as exc:
+        raise _queue_full(exc) from exc
+
+    return BatchSubmitResponse(batch_id=batch.id, job_ids=[job.id for job in jobs], status=JOB_QUEUED)
+
+
+@router.get("/batches/{batch_id}", response_model=BatchResponse)
+def get_batch(batch_id: int, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)) -> BatchResponse:
+    batch = _get_owned_batch(db, batch_id, current_user)
+    jobs = sorted(batch.jobs, key=lambda job: job.id)
+    counts = {state: sum(1 for job in jobs if job.status == state) for state in (JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED)}
+    return BatchResponse(
+        id=batch.id,
+        total=len(jobs),
+        queued=counts[JOB_QUEUED],
+        running=counts[JOB_RUNNING],
+        succeeded=counts[JOB_SUCCEEDED],
+        failed=counts[JOB_FAILED],
+        jobs=[job_to_response(job) for job in jobs],
+    )
+
+
+@router.get("/batches/{batch_id}/results")
+async def stream_batch_results(
+    batch_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+) -> StreamingResponse:
+    batch = await db.scalar(
+        select(ProcessingBatch).where(ProcessingBatch.id == batch_id, ProcessingBatch.owner_id == current_user.id)
+    )
+    if batch is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found")
+    total = await db.scalar(select(func.count()).select_from(ProcessingJob).where(ProcessingJob.batch_id == batch_id))
+
+    async def results() -> AsyncIterator[str]:
+        # One JSON line per image as its result is committed. The stream ends with the batch, when
+        # the client leaves, or at the deadline; a client that counts fewer lines than jobs can
+        # read the rest from GET /batches/{id}.
+        sent: set[int] = set()
+        poll_interval = job_queue.settings.job_poll_interval_seconds
+        deadline = time.monotonic() + job_queue.settings.batch_stream_max_seconds
+        while len(sent) < total and time.monotonic() < deadline:
+            if await request.is_disconnected():
+                return
+            async with AsyncSessionLocal() as session:
+                finished = await session.scalars(
+                    select(ProcessingJob)
+                    .where(ProcessingJob.batch_id == batch_id, ProcessingJob.status.in_([JOB_SUCCEEDED, JOB_FAILED]))
+                    .order_by(ProcessingJob.finished_at)
+                )
+                fresh = [job for job in finished if job.id not in sent]
+            for job in fresh:
+                sent.add(job.id)
+                yield job_to_response(job).model_dump_json() + "\n"
+            if not fresh:
+                await asyncio.sleep(poll_interval)
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.get("/jobs/stats", response_model=JobQueueStats)
+def job_stats(db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)) -> JobQueueStats:
+    return job_queue.stats(db, current_user.id)
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job: JobResponse = Depends(_owned_job_response)) -> JobResponse:
+    return job
+
+
+@router.get("/jobs/{job_id}/progress")
+async def job_progress(job: JobResponse = Depends(_owned_job_response)) -> StreamingResponse:
+    # A job that finished before the hub saw it (e.g. across a restart) is answered from the database.
+    final = None
+    if job.status == JOB_SUCCEEDED:
+        final = {"type": "done", "version": job.version, "overall": 1.0}
+    elif job.status == JOB_FAILED:
+        final = {"type": "failed", "error": job.error or "Job failed"}
+    return progress_stream(f"job:{job.id}", replay_terminal=True, final=final)
+
+
+@router.get("/jobs/{job_id}/result", response_model=ProcessResponse)
+async def get_job_result(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+) -> ProcessResponse:
+    job = await _get_owned_job(db, job_id, current_user)
+    if job.status == JOB_FAILED:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=job.error or "Job failed")
+    if job.status != JOB_SUCCEEDED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {job.status}")
+    return ProcessResponse(image_id=job.image_id, version=job.version, message="Image processed")
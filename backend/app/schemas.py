@@ -50,3 +50,51 @@ class ProcessResponse(BaseModel):
     image_id: int
     version: int
     message: str
+
+
+class JobSubmitResponse(BaseModel):
+    job_id: int
+    status: str
+
+
+class JobResponse(BaseModel):
+    id: int
+    image_id: int
+    status: str
+    version: int | None = None
+    error: str | None = None
+    queued_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    wait_seconds: float | None = None
+    run_seconds: float | None = None
+
+
+class BatchProcessRequest(BaseModel):
+    image_ids: list[int] = Field(min_length=1)
+    options: ProcessRequest
+
+
+class BatchSubmitResponse(BaseModel):
+    batch_id: int
+    job_ids: list[int]
+    status: str
+
+
+class BatchResponse(BaseModel):
+    id: int
+    total: int
+    queued: int
+    running: int
+    succeeded: int
+    failed: int
+    jobs: list[JobResponse]
+
+
+class JobQueueStats(BaseModel):
+    queued: int
+    running: int
+    workers: int
+    max_queued: int
+    avg_wait_seconds: float | None = None
+    avg_run_seconds: float | None = None
@@ -0,0 +1,108 @@
+import multiprocessing
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from app.core.config import get_settings
+
+
+RESERVE_POLL_SECONDS = 0.5
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int | None = None) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    # Step slots and the memory reservation counter are multiprocessing primitives so the
+    # job workers share them with the API process; per-user accounting is API-side only.
+    def __init__(self, shared_state: tuple | None = None, wait_for_steps: bool = False) -> None:
+        self.settings = get_settings()
+        self.budget_bytes = self.settings.admission_memory_budget_mb * 2**20
+        self.user_share = self.settings.admission_user_share
+        self.user_max_concurrent = self.settings.admission_user_max_concurrent
+        self.retry_after = self.settings.admission_retry_after_seconds
+        self.step_wait_seconds = None if wait_for_steps else self.settings.admission_step_wait_seconds
+        if shared_state is None:
+            context = multiprocessing.get_context("spawn")
+            limits = {
+                "deoldify": self.settings.max_concurrent_deoldify,
+                "gfpgan": self.settings.max_concurrent_gfpgan,
+                "realesrgan": self.settings.max_concurrent_realesrgan,
+                "opencv": self.settings.max_concurrent_opencv,
+            }
+            steps = {name: context.BoundedSemaphore(max(1, limit)) for name, limit in limits.items()}
+            shared_state = (steps, context.Value("q", 0))
+        self._steps, self._reserved = shared_state
+        self._users: dict[int, tuple[int, int]] = {}
+        self._users_lock = threading.Lock()
+
+    def shared_state(self) -> tuple:
+        # Handed to spawned job workers at start-up so they draw from the same slots and budget.
+        return (self._steps, self._reserved)
+
+    def reserved_bytes(self) -> int:
+        return self._reserved.value
+
+    @contextmanager
+    def reserve(self, cost_bytes: int, user_id: int | None = None, wait: bool = False) -> Iterator[None]:
+        if cost_bytes > self.budget_bytes:
+            raise AdmissionRejected(413, "Image is too large to process within this node's memory budget")
+        if user_id is not None:
+            self._claim_user(user_id, cost_bytes)
+        try:
+            self._claim_memory(cost_bytes, wait)
+            try:
+                yield
+            finally:
+                with self._reserved.get_lock():
+                    self._reserved.value -= cost_bytes
+        finally:
+            if user_id is not None:
+                self._release_user(user_id, cost_bytes)
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        semaphore = self._steps.get(name)
+        if semaphore is None:
+            yield
+            return
+        if not semaphore.acquire(timeout=self.step_wait_seconds):
+            raise AdmissionRejected(503, f"Too many concurrent {name} runs", self.retry_after)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def _claim_memory(self, cost_bytes: int, wait: bool) -> None:
+        while True:
+            with self._reserved.get_lock():
+                if self._reserved.value + cost_bytes <= self.budget_bytes:
+                    self._reserved.value += cost_bytes
+                    return
+            if not wait:
+                raise AdmissionRejected(503, "Processing capacity is exhausted", self.retry_after)
+            time.sleep(RESERVE_POLL_SECONDS)
+
+    def _claim_user(self, user_id: int, cost_bytes: int) -> None:
+        # Fair share: a user's first request is always considered, but further concurrent ones
+        # must fit within their slice of the budget and of the slots.
+        with self._users_lock:
+            held_bytes, held_count = self._users.get(user_id, (0, 0))
+            over_share = held_count > 0 and held_bytes + cost_bytes > self.budget_bytes * self.user_share
+            if held_count >= self.user_max_concurrent or over_share:
+                raise AdmissionRejected(429, "Per-user processing quota exceeded", self.retry_after)
+            self._users[user_id] = (held_bytes + cost_bytes, held_count + 1)
+
+    def _release_user(self, user_id: int, cost_bytes: int) -> None:
+        with self._users_lock:
+            held_bytes, held_count = self._users.get(user_id, (0, 0))
+            if held_count <= 1:
+                self._users.pop(user_id, None)
+            else:
+                self._users[user_id] = (held_bytes - cost_bytes, held_count - 1)
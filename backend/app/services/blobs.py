@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+
+from sqlalchemy import select, union, update
+
+from app.core.config import get_settings
+from app.db import SessionLocal
+from app.models import ImageAsset, ImageVersion, ResultCacheEntry
+from app.services.object_store import ObjectStore
+
+
+logger = logging.getLogger(__name__)
+
+BLOB_PREFIX = "blobs/"
+BLOB_KEY = re.compile(r"^blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.\w+$")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        while chunk := handle.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _path_columns():
+    return (
+        (ImageVersion, ImageVersion.path),
+        (ImageAsset, ImageAsset.original_path),
+        (ImageAsset, ImageAsset.current_path),
+        (ResultCacheEntry, ResultCacheEntry.path),
+    )
+
+
+class BlobStore:
+    # Immutable objects keyed by the sha256 of their bytes. A blob lives as long as some
+    # path column references its key; everything else is reclaimed by collect().
+    def __init__(self, store: ObjectStore, scratch_dir: Path) -> None:
+        self.settings = get_settings()
+        self.store = store
+        self.scratch_dir = scratch_dir
+        self.grace_seconds = self.settings.blob_gc_grace_seconds
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def key_for(self, digest: str, ext: str) -> str:
+        return f"{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+    def scratch_path(self, ext: str) -> Path:
+        # Beside the local blob root, so committing to a local store is a link rather than a copy.
+        self.scratch_dir.mkdir(parents=True, exist_ok=True)
+        return self.scratch_dir / f"{uuid4().hex}{ext}"
+
+    def is_blob(self, locator: str) -> bool:
+        return BLOB_KEY.match(locator) is not None
+
+    def digest_of(self, locator: str) -> str | None:
+        match = BLOB_KEY.match(locator)
+        return match.group(1) if match else None
+
+    def commit(self, source: Path, digest: str | None = None, ext: str | None = None, keep_source: bool = False) -> str:
+        digest = digest or sha256_file(source)
+        key = self.key_for(digest, ext or source.suffix.lower())
+        if not self.store.put_file(key, source):
+            # Reusing an existing blob refreshes its age so a running collection keeps it.
+            self.store.touch(key)
+        if not keep_source:
+            source.unlink(missing_ok=True)
+        return key
+
+    def referenced_paths(self, db) -> set[str]:
+        statement = union(*(select(column.label("path")) for _, column in _path_columns()))
+        return set(db.scalars(statement))
+
+    def collect(self) -> int:
+        with SessionLocal() as db:
+            referenced = self.referenced_paths(db)
+
+        cutoff = time.time() - self.grace_seconds
+        removed = 0
+        for stored in self.store.list(BLOB_PREFIX):
+            # Blobs younger than the grace period may belong to a transaction that has not committed yet.
+            if stored.key in referenced or stored.modified_at > cutoff:
+                continue
+            self.store.delete(stored.key)
+            removed += 1
+
+        for path in self.scratch_dir.glob("*"):
+            try:
+                if path.stat().st_mtime <= cutoff:
+                    path.unlink(missing_ok=True)
+            except FileNotFoundError:
+                continue
+        if removed:
+            logger.info("Collected %d unreferenced blobs", removed)
+        return removed
+
+    def migrate_legacy(self, limit: int = 100) -> int:
+        # Moves files still referenced by filesystem path (uploads/, processed/, results/ and
+        # path-addressed blobs) into the object store and rewrites every column that points at
+        # them. Old paths stay readable until then.
+        with SessionLocal() as db:
+            legacy = sorted(path for path in self.referenced_paths(db) if not self.is_blob(path))
+            migrated = 0
+            for old in legacy:
+                old_path = Path(old)
+                if migrated >= limit:
+                    break
+                if not old_path.exists():
+                    continue
+                key = self.commit(old_path, keep_source=True)
+                for model, column in _path_columns():
+                    db.execute(update(model).where(column == old).values({column.key: key}))
+                db.commit()
+                local = self.store.local_path(key)
+                if local is None or not local.exists() or not os.path.samefile(local, old_path):
+                    old_path.unlink(missing_ok=True)
+                migrated += 1
+        if migrated:
+            logger.info("Migrated %d legacy files into the blob store", migrated)
+        return migrated
+
+    def start(self) -> None:
+        if self._thread is not None or self.settings.blob_gc_interval_seconds <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._gc_loop, name="blob-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _gc_loop(self) -> None:
+        while not self._stop.wait(self.settings.blob_gc_interval_seconds):
+            try:
+                if self.settings.blob_migrate_legacy:
+                    self.migrate_legacy()
+                self.collect()
+            except Exception:  # noqa: BLE001
+                logger.exception("Blob collection failed")
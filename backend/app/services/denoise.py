@@ -0,0 +1,104 @@
+# Like enhance.py this is shared with scripts/opencv_enhance.py, so it only depends on cv2,
+# numpy and the standard library.
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+
+TEMPLATE_WINDOW = 7
+SEARCH_WINDOW = 21
+# A pixel's result depends on every template centred in its search window, so rows further
+# than this from a band edge see exactly the same neighbourhood as in the whole image.
+HALO = SEARCH_WINDOW // 2 + TEMPLATE_WINDOW // 2
+BANDS_PER_WORKER = 3
+MIN_BAND_ROWS = 64
+
+_pool: ProcessPoolExecutor | None = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def available_cpus() -> int:
+    # Cores this process may run on, which inside a container can be far fewer than the host has.
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def denoise_colored(image: np.ndarray, h: float, workers: int = 1, min_parallel_pixels: int = 1_000_000) -> np.ndarray:
+    height, width = image.shape[:2]
+    # Bands only pay off with a core each; on fewer, the halo rows and shared-memory copies are overhead.
+    workers = min(workers, available_cpus())
+    if workers <= 1 or height * width < min_parallel_pixels or height < 2 * MIN_BAND_ROWS:
+        return cv2.fastNlMeansDenoisingColored(image, None, h, h, TEMPLATE_WINDOW, SEARCH_WINDOW)
+
+    rows = max(MIN_BAND_ROWS, -(-height // (workers * BANDS_PER_WORKER)))
+    bands = [(start, min(start + rows, height)) for start in range(0, height, rows)]
+
+    # Workers attach to the buffers by name, so only band coordinates cross the process boundary.
+    source = shared_memory.SharedMemory(create=True, size=image.nbytes)
+    target = shared_memory.SharedMemory(create=True, size=image.nbytes)
+    try:
+        np.ndarray(image.shape, image.dtype, buffer=source.buf)[:] = image
+        pool = _get_pool(workers)
+        futures = [
+            pool.submit(_denoise_band, source.name, target.name, image.shape, image.dtype.str, start, stop, h)
+            for start, stop in bands
+        ]
+        for future in futures:
+            future.result()
+        return np.ndarray(image.shape, image.dtype, buffer=target.buf).copy()
+    finally:
+        for block in (source, target):
+            block.close()
+            block.unlink()
+
+
+def _denoise_band(source_name: str, target_name: str, shape: tuple, dtype: str, start: int, stop: int, h: float) -> None:
+    source = shared_memory.SharedMemory(name=source_name)
+    target = shared_memory.SharedMemory(name=target_name)
+    try:
+        image = np.ndarray(shape, np.dtype(dtype), buffer=source.buf)
+        output = np.ndarray(shape, np.dtype(dtype), buffer=target.buf)
+        top = max(0, start - HALO)
+        bottom = min(shape[0], stop + HALO)
+        band = cv2.fastNlMeansDenoisingColored(
+            np.ascontiguousarray(image[top:bottom]), None, h, h, TEMPLATE_WINDOW, SEARCH_WINDOW
+        )
+        output[start:stop] = band[start - top : stop - top]
+        del image, output
+    finally:
+        source.close()
+        target.close()
+
+
+def _init_worker() -> None:
+    # The pool already provides the parallelism; OpenCV's own threads would oversubscribe.
+    cv2.setNumThreads(1)
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            _pool_workers = workers
+        return _pool
+
+
+@atexit.register
+def _shutdown_pool() -> None:
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
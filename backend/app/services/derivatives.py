@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+
+from PIL import Image, ImageOps
+
+from app.core.config import get_settings
+from app.services.storage import StorageService
+
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = {"thumb": 256, "preview": 1024}
+DERIVATIVE_SUFFIX = ".webp"
+WEBP_QUALITY = 80
+COLLECT_INTERVAL_SECONDS = 60
+# EXIF orientations that swap width and height once exif_transpose has run.
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class DerivativeService:
+    def __init__(self, storage: StorageService) -> None:
+        self.settings = get_settings()
+        self.storage = storage
+        self.max_bytes = self.settings.derivative_cache_max_mb * 2**20
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._last_collect = 0.0
+
+    def path_for(self, locator: str, size: str) -> Path:
+        # Version files are never rewritten, so the locator identifies the content.
+        key = hashlib.sha256(f"{locator}\n{DERIVATIVE_WIDTHS[size]}".encode()).hexdigest()
+        return self.storage.derivatives_dir() / key[:2] / f"{key}{DERIVATIVE_SUFFIX}"
+
+    def get(self, locator: str, size: str) -> Path:
+        target = self.path_for(locator, size)
+        if target.exists():
+            os.utime(target)
+            return target
+
+        with self._lock_for(target.name):
+            if not target.exists():
+                with self.storage.local_copy(locator) as source:
+                    self._render(source, target, DERIVATIVE_WIDTHS[size])
+                self._maybe_collect()
+        return target
+
+    def generate_all(self, locator: str) -> None:
+        for size in DERIVATIVE_WIDTHS:
+            try:
+                self.get(locator, size)
+            except Exception:  # noqa: BLE001
+                logger.exception("Could not generate %s derivative for %s", size, locator)
+
+    def collect(self) -> None:
+        root = self.storage.derivatives_dir()
+        entries = []
+        for path in root.glob("*/[!.]*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def _render(self, source: Path, target: Path, width: int) -> None:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        scratch = target.parent / f".{target.stem}.{uuid4().hex}{DERIVATIVE_SUFFIX}"
+        try:
+            with Image.open(source) as image:
+                # JPEG can decode straight at a reduced scale; other formats ignore the hint.
+                image.draft("RGB", _draft_box(image, width))
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+                image.save(scratch, "WEBP", quality=WEBP_QUALITY, method=4)
+            os.replace(scratch, target)
+        finally:
+            scratch.unlink(missing_ok=True)
+
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(name)
+            if lock is None:
+                if len(self._locks) > 1024:
+                    self._locks = {key: value for key, value in self._locks.items() if value.locked()}
+                lock = self._locks[name] = threading.Lock()
+            return lock
+
+    def _maybe_collect(self) -> None:
+        now = time.monotonic()
+        if now - self._last_collect < COLLECT_INTERVAL_SECONDS:
+            return
+        self._last_collect = now
+        self.collect()
+
+
+def _draft_box(image: Image.Image, width: int) -> tuple[int, int]:
+    # The stored pixels' size at the output scale. Draft runs before exif_transpose, so a
+    # rotated photo's output width is its stored height.
+    rotated = image.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS
+    scale = width / (image.height if rotated else image.width)
+    return (max(1, math.ceil(image.width * scale)), max(1, math.ceil(image.height * scale)))
@@ -0,0 +1,116 @@
+# Shared by ProcessingService and scripts/opencv_enhance.py, so this module may only depend
+# on cv2, numpy and app.services.denoise (which keeps to the same rule).
+from collections.abc import Callable
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from app.services.denoise import HALO as DENOISE_HALO, denoise_colored
+
+
+SHARPEN_KERNEL = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+UNSHARP_SIGMA = 1.2
+# OpenCV sizes an 8-bit Gaussian kernel to cover 3 sigma on each side.
+UNSHARP_HALO = round(UNSHARP_SIGMA * 3)
+
+
+@lru_cache(maxsize=256)
+def tone_lut(contrast: float, gamma: float) -> np.ndarray:
+    # Contrast followed by gamma, folded into one table. Each step is computed by the same call
+    # the separate passes made, so the composition is bit-identical to running them in turn.
+    levels = np.arange(256, dtype=np.uint8)
+    table = cv2.convertScaleAbs(levels, alpha=contrast, beta=0).ravel() if contrast != 1.0 else levels
+    if gamma > 0 and gamma != 1.0:
+        table = (((np.arange(256) / 255.0) ** (1.0 / gamma)) * 255).astype(np.uint8)[table]
+    lut = np.ascontiguousarray(table)
+    lut.flags.writeable = False
+    return lut
+
+
+@lru_cache(maxsize=256)
+def saturation_lut(factor: float) -> np.ndarray:
+    # Identity for H and V; S scaled in float32, clipped and truncated as the legacy pass did.
+    levels = np.arange(256, dtype=np.float32)
+    scaled = np.clip(levels * factor, 0, 255).astype(np.uint8)
+    lut = cv2.merge([levels.astype(np.uint8), scaled, levels.astype(np.uint8)])
+    lut.flags.writeable = False
+    return lut
+
+
+def adjust_saturation(image: np.ndarray, factor: float) -> np.ndarray:
+    # HSV scaling exactly as before, minus the float32 copy of the whole image: the S channel
+    # goes through a three-channel LUT in place.
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    cv2.LUT(hsv, saturation_lut(factor), dst=hsv)
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+
+def enhance_image(
+    image: np.ndarray,
+    *,
+    contrast: float = 1.0,
+    saturation: float = 1.0,
+    gamma: float = 1.0,
+    sharpen: bool = False,
+    sharpen_amount: float = 0.0,
+    denoise_h: float = 0.0,
+    denoise_workers: int = 1,
+) -> np.ndarray:
+    # Never writes into `image`; the first pass that runs allocates the output.
+    result = image
+
+    if denoise_h > 0:
+        result = denoise_colored(result, denoise_h, workers=denoise_workers)
+
+    if sharpen:
+        result = cv2.filter2D(result, -1, SHARPEN_KERNEL)
+    elif sharpen_amount > 0:
+        blur = cv2.GaussianBlur(result, (0, 0), UNSHARP_SIGMA)
+        result = cv2.addWeighted(result, 1.0 + sharpen_amount, blur, -sharpen_amount, 0)
+
+    # Order is contrast, saturation, gamma. Contrast saturates at 255 and saturation is not a
+    # per-channel map, so the two do not commute; contrast and gamma only share one LUT when
+    # there is no saturation step between them.
+    apply_gamma = gamma > 0 and gamma != 1.0
+    if saturation == 1.0:
+        if contrast != 1.0 or apply_gamma:
+            result = _apply_lut(result, image, tone_lut(float(contrast), float(gamma) if apply_gamma else 1.0))
+        return result
+
+    if contrast != 1.0:
+        result = _apply_lut(result, image, tone_lut(float(contrast), 1.0))
+    result = adjust_saturation(result, float(saturation))
+    if apply_gamma:
+        result = _apply_lut(result, image, tone_lut(1.0, float(gamma)))
+    return result
+
+
+def enhance_halo(sharpen: bool = False, sharpen_amount: float = 0.0, denoise_h: float = 0.0) -> int:
+    # Rows of context a band needs on each side for its own rows to come out as in the whole image.
+    halo = DENOISE_HALO if denoise_h > 0 else 0
+    if sharpen:
+        halo += SHARPEN_KERNEL.shape[0] // 2
+    elif sharpen_amount > 0:
+        halo += UNSHARP_HALO
+    return halo
+
+
+def enhance_rows(image: np.ndarray, write_rows: Callable[[np.ndarray], None], band_rows: int, **options) -> None:
+    # enhance_image over bands of `band_rows` rows, each padded with enough neighbouring rows that
+    # the output is identical to a single pass. `image` may be a memory-mapped file, so only one
+    # padded band is ever decoded at a time.
+    height = image.shape[0]
+    halo = enhance_halo(options.get("sharpen", False), options.get("sharpen_amount", 0.0), options.get("denoise_h", 0.0))
+    for start in range(0, height, band_rows):
+        stop = min(start + band_rows, height)
+        top, bottom = max(0, start - halo), min(height, stop + halo)
+        band = enhance_image(np.ascontiguousarray(image[top:bottom]), **options)
+        write_rows(band[start - top : stop - top])
+
+
+def _apply_lut(result: np.ndarray, image: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    if result is image:
+        return cv2.LUT(result, lut)
+    cv2.LUT(result, lut, dst=result)
+    return result
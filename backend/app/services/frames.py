@@ -0,0 +1,60 @@
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+RAW_SUFFIX = ".npy"
+
+
+def read_image(path: Path) -> np.ndarray:
+    if path.suffix.lower() == RAW_SUFFIX:
+        return np.load(path)
+    image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+    if image is None:
+        raise RuntimeError("Unable to read source image")
+    return image
+
+
+def write_image(path: Path, image: np.ndarray) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix.lower() == RAW_SUFFIX:
+        with path.open("wb") as handle:
+            np.save(handle, image)
+        return
+    if not cv2.imwrite(str(path), image):
+        raise RuntimeError("Unable to write output image")
+
+
+class Frame:
+    # A stage result held as a decoded array, a file, or both. Decoding and encoding
+    # only happen when a consumer actually needs the other form.
+    def __init__(self, path: Path | None = None, array: np.ndarray | None = None, owned: bool = False) -> None:
+        self.path = path
+        self.owned = owned
+        # Content identity within the pipeline (the stage-chain hash), when the caller knows it.
+        self.key: str | None = None
+        self.io_seconds = 0.0
+        self._array = array
+
+    @property
+    def decoded(self) -> bool:
+        return self._array is not None
+
+    def array(self) -> np.ndarray:
+        if self._array is None:
+            started = time.perf_counter()
+            self._array = read_image(self.path)
+            self.io_seconds += time.perf_counter() - started
+        return self._array
+
+    def image_file(self, scratch: Path) -> Path:
+        # External tools need an encoded image file rather than raw arrays.
+        if self.path is not None and self.path.suffix.lower() != RAW_SUFFIX:
+            return self.path
+        image = self.array()
+        started = time.perf_counter()
+        write_image(scratch, image)
+        self.io_seconds += time.perf_counter() - started
+        return scratch
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+from app.core.config import get_settings
+import numpy as np
+
+from app.services.frames import RAW_SUFFIX, Frame, write_image
+
+
+logger = logging.getLogger(__name__)
+
+# Entries this fresh may be mid-read by a running pipeline, so collection leaves them alone.
+MIN_AGE_SECONDS = 600
+# Lossless and, at OpenCV's default compression level, cheap to encode; raw arrays of a
+# photograph are several times larger on disk.
+ENCODED_SUFFIX = ".png"
+
+
+def stage_key(previous_key: str, stage: str, params: dict[str, Any]) -> str:
+    payload = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{previous_key}\n{stage}\n{payload}".encode()).hexdigest()
+
+
+class IntermediateStore:
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self.enabled = self.settings.intermediate_cache_enabled
+        self.max_bytes = self.settings.intermediate_cache_max_mb * 2**20
+        self.max_age_seconds = self.settings.intermediate_cache_max_age_hours * 3600
+        self.max_entry_bytes = self.settings.intermediate_cache_max_entry_mb * 2**20
+        self.root = Path(self.settings.storage_dir) / "intermediates"
+
+    def get(self, key: str) -> Frame | None:
+        if not self.enabled:
+            return None
+        for path in (self.root / key[:2]).glob(f"{key}.*"):
+            # mtime doubles as the last-used time for collection.
+            os.utime(path)
+            return Frame(path=path)
+        return None
+
+    def put(self, key: str, frame: Frame) -> Frame:
+        if not self.enabled:
+            return frame
+        size = _frame_size(frame)
+        if size > self.max_entry_bytes:
+            # Re-running the stage is cheaper than writing and keeping an entry this large.
+            logger.debug("Not caching intermediate %s (%d MiB)", key, size // 2**20)
+            return frame
+        directory = self.root / key[:2]
+        directory.mkdir(parents=True, exist_ok=True)
+        raw_file = not frame.decoded and frame.path.suffix.lower() == RAW_SUFFIX
+        if frame.decoded or raw_file:
+            # Arrays are stored encoded; the pipeline carries on with the frame it already has.
+            scratch = directory / f".{key}.{uuid4().hex}{ENCODED_SUFFIX}"
+            try:
+                write_image(scratch, frame.array() if frame.decoded else np.load(frame.path, mmap_mode="r"))
+                os.replace(scratch, directory / f"{key}{ENCODED_SUFFIX}")
+            finally:
+                scratch.unlink(missing_ok=True)
+            return frame
+        target = directory / f"{key}{frame.path.suffix.lower()}"
+        if frame.owned:
+            os.replace(frame.path, target)
+        else:
+            link_or_copy(frame.path, target)
+        return Frame(path=target)
+
+    def collect(self) -> None:
+        if not self.enabled or not self.root.exists():
+            return
+        now = time.time()
+        entries = []
+        staging = 0
+        for path in self.root.glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.name.startswith("."):
+                # Half-written arrays from a crashed put are removed once stale; live ones still
+                # take disk, so they count against the budget and push older entries out.
+                if now - stat.st_mtime >= MIN_AGE_SECONDS:
+                    path.unlink(missing_ok=True)
+                else:
+                    staging += stat.st_size
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = staging + sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            age = now - mtime
+            if age < MIN_AGE_SECONDS:
+                break
+            if total <= self.max_bytes and age <= self.max_age_seconds:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.debug("Collected intermediate %s", path.name)
+
+
+def _frame_size(frame: Frame) -> int:
+    # Decoded size for arrays, file size for anything already on disk.
+    if frame.decoded:
+        return frame.array().nbytes
+    return frame.path.stat().st_size
+
+
+def link_or_copy(source: Path, destination: Path) -> None:
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    destination.unlink(missing_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
@@ -0,0 +1,432 @@
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import partial
+
+from PIL import Image
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.db import SessionLocal
+from app.models import ImageAsset, ProcessingBatch, ProcessingJob
+from app.schemas import JobQueueStats, JobResponse, ProcessRequest
+from app.services.admission import AdmissionController
+from app.services.progress import ProgressReporter, progress_reporter, worker_sink
+from app.services.restore import RestoreResult
+
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+_worker_restorer = None
+_worker_progress = None
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _init_worker(admission_state: tuple | None = None, progress_queue=None, metrics_queue=None) -> None:
+    global _worker_restorer, _worker_progress
+    from app.services.admission import AdmissionController
+    from app.services.metrics import REGISTRY
+    from app.services.processing import ProcessingService
+    from app.services.restore import RestoreService
+    from app.services.storage import StorageService
+
+    processor = ProcessingService()
+    # The pool already runs images side by side; a band pool per worker would multiply the processes.
+    processor.denoise_workers = 1
+    if admission_state is not None:
+        processor.admission = AdmissionController(admission_state, wait_for_steps=True)
+    processor.warm_up()
+    _worker_restorer = RestoreService(StorageService(), processor)
+    _worker_progress = progress_queue
+    if metrics_queue is not None:
+        REGISTRY.forward_to(metrics_queue)
+
+
+def _image_size(image: ImageAsset | None) -> tuple[int, int]:
+    if image is None:
+        return (0, 0)
+    if image.width and image.height and image.current_path == image.original_path:
+        return (image.width, image.height)
+    # Only files already on local disk are probed; fetching remote inputs just to sort would defeat the purpose.
+    path = _worker_restorer.storage.cached_path(image.current_path) if _worker_restorer else None
+    if path is None:
+        return (0, 0)
+    try:
+        # Reads only the header; enough to line up similarly sized inputs.
+        with Image.open(path) as handle:
+            return handle.size
+    except (OSError, ValueError):
+        return (0, 0)
+
+
+def _job_reporter(job: ProcessingJob) -> ProgressReporter | None:
+    if _worker_progress is None:
+        return None
+    return ProgressReporter(worker_sink(_worker_progress, f"job:{job.id}", f"image:{job.image_id}"))
+
+
+def _process_job(db: Session, job: ProcessingJob) -> RestoreResult | None:
+    reporter = _job_reporter(job)
+    token = progress_reporter.set(reporter)
+    try:
+        image = db.get(ImageAsset, job.image_id)
+        if image is None:
+            raise RuntimeError("Image not found")
+        if reporter is not None:
+            reporter.emit({"type": "running"})
+        result = _worker_restorer.produce(image, ProcessRequest.model_validate_json(job.options_json), wait=True)
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Job %s failed", job.id)
+        job.status = JOB_FAILED
+        job.error = str(exc) or exc.__class__.__name__
+        result = None
+    finally:
+        progress_reporter.reset(token)
+    job.finished_at = datetime.utcnow()
+    return result
+
+
+def _record_result(db: Session, job: ProcessingJob, result: RestoreResult | None) -> None:
+    # Versions are numbered just before the commit, so the image row is only written (and
+    # locked) for the length of the commit rather than while later jobs in the group run.
+    if result is None:
+        return
+    try:
+        job.version = _worker_restorer.record_version(db, job.image_id, result).version
+        job.status = JOB_SUCCEEDED
+    except LookupError as exc:
+        job.status = JOB_FAILED
+        job.error = str(exc)
+
+
+def _commit_jobs(db: Session, pending: list[tuple[ProcessingJob, RestoreResult | None]]) -> None:
+    jobs = [job for job, _ in pending]
+    # A rollback expires every job, so the outcomes are kept to replay them one at a time.
+    outcomes = [(job.id, job.status, job.error, job.finished_at) for job in jobs]
+    for job, result in pending:
+        _record_result(db, job, result)
+    try:
+        db.commit()
+    except Exception:  # noqa: BLE001
+        logger.exception("Failed to save results for jobs %s, retrying one at a time", [job_id for job_id, *_ in outcomes])
+        db.rollback()
+        for (job, result), outcome in zip(pending, outcomes):
+            _commit_job(db, job, result, outcome)
+    _report_finished(jobs)
+
+
+def _commit_job(db: Session, job: ProcessingJob, result: RestoreResult | None, outcome: tuple) -> None:
+    # One bad result (a deleted image, a version conflict) fails only its own job.
+    job_id, job.status, job.error, job.finished_at = outcome
+    _record_result(db, job, result)
+    try:
+        db.commit()
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Failed to save result for job %s", job_id)
+        db.rollback()
+        db.execute(
+            update(ProcessingJob)
+            .where(ProcessingJob.id == job_id)
+            .values(status=JOB_FAILED, error=f"Could not save result: {exc}", finished_at=outcome[3])
+        )
+        db.commit()
+
+
+def _report_finished(jobs: list[ProcessingJob]) -> None:
+    # Terminal events go out only once the outcome is committed and visible to readers.
+    for job in jobs:
+        reporter = _job_reporter(job)
+        if reporter is None:
+            return
+        if job.status == JOB_SUCCEEDED:
+            reporter.finished(job.version)
+        else:
+            reporter.failed(job.error or "Job failed")
+
+
+def _run_jobs(job_ids: list[int]) -> None:
+    # A chunk is processed in size order so consecutive inputs reuse the same model
+    # and tile setup, and results are committed in groups rather than per image.
+    settings = get_settings()
+    db = SessionLocal()
+    try:
+        jobs = db.query(ProcessingJob).filter(ProcessingJob.id.in_(job_ids)).all()
+        jobs.sort(key=lambda job: _image_size(db.get(ImageAsset, job.image_id)))
+
+        pending: list[tuple[ProcessingJob, RestoreResult | None]] = []
+        last_commit = time.monotonic()
+        for job in jobs:
+            pending.append((job, _process_job(db, job)))
+            due = time.monotonic() - last_commit >= settings.batch_commit_seconds
+            if len(pending) >= settings.batch_commit_size or due:
+                _commit_jobs(db, pending)
+                pending = []
+                last_commit = time.monotonic()
+        if pending:
+            _commit_jobs(db, pending)
+    finally:
+        db.close()
+
+
+def job_to_response(job: ProcessingJob) -> JobResponse:
+    wait_seconds = None
+    run_seconds = None
+    if job.started_at is not None:
+        wait_seconds = (job.started_at - job.queued_at).total_seconds()
+        if job.finished_at is not None:
+            run_seconds = (job.finished_at - job.started_at).total_seconds()
+    return JobResponse(
+        id=job.id,
+        image_id=job.image_id,
+        status=job.status,
+        version=job.version,
+        error=job.error,
+        queued_at=job.queued_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        wait_seconds=wait_seconds,
+        run_seconds=run_seconds,
+    )
+
+
+class JobQueue:
+    def __init__(self, admission: AdmissionController | None = None, progress_queue=None, metrics_queue=None) -> None:
+        self.settings = get_settings()
+        self.admission = admission
+        self.progress_queue = progress_queue
+        self.metrics_queue = metrics_queue
+        self.workers = self.settings.job_workers
+        self.max_queued = self.settings.job_queue_max
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
+
+    def start(self) -> None:
+        if self.workers <= 0 or self._thread is not None:
+            return
+        self._requeue_interrupted()
+        self._pool = self._new_pool()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def submit(self, db: Session, image: ImageAsset, options: ProcessRequest) -> ProcessingJob:
+        if self.depth(db) >= self.max_queued:
+            raise QueueFullError("Job queue is full")
+        job = ProcessingJob(image_id=image.id, owner_id=image.owner_id, options_json=options.model_dump_json())
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._wake.set()
+        return job
+
+    def submit_batch(
+        self, db: Session, owner_id: int, images: list[ImageAsset], options: ProcessRequest
+    ) -> tuple[ProcessingBatch, list[ProcessingJob]]:
+        # A batch may fill the queue past its usual limit by itself, but not on top of other work.
+        if self.depth(db) + len(images) > max(self.max_queued, len(images)):
+            raise QueueFullError("Job queue is full")
+        options_json = options.model_dump_json()
+        batch = ProcessingBatch(owner_id=owner_id, options_json=options_json)
+        jobs = [ProcessingJob(image_id=image.id, owner_id=owner_id, options_json=options_json) for image in images]
+        batch.jobs = jobs
+        db.add(batch)
+        db.commit()
+        self._wake.set()
+        return batch, jobs
+
+    def depth(self, db: Session) -> int:
+        return db.scalar(select(func.count(ProcessingJob.id)).where(ProcessingJob.status == JOB_QUEUED)) or 0
+
+    def stats(self, db: Session, owner_id: int, sample: int = 100) -> JobQueueStats:
+        # Counts and timings cover the caller's own jobs; other users' queues are not theirs to see.
+        owned = ProcessingJob.owner_id == owner_id
+        queued = db.scalar(select(func.count(ProcessingJob.id)).where(owned, ProcessingJob.status == JOB_QUEUED)) or 0
+        running = db.scalar(select(func.count(ProcessingJob.id)).where(owned, ProcessingJob.status == JOB_RUNNING)) or 0
+        recent = (
+            db.query(ProcessingJob)
+            .filter(owned, ProcessingJob.finished_at.is_not(None), ProcessingJob.started_at.is_not(None))
+            .order_by(ProcessingJob.finished_at.desc())
+            .limit(sample)
+            .all()
+        )
+        waits = [(job.started_at - job.queued_at).total_seconds() for job in recent]
+        runs = [(job.finished_at - job.started_at).total_seconds() for job in recent]
+        return JobQueueStats(
+            queued=queued,
+            running=running,
+            workers=self.workers,
+            max_queued=self.max_queued,
+            avg_wait_seconds=sum(waits) / len(waits) if waits else None,
+            avg_run_seconds=sum(runs) / len(runs) if runs else None,
+        )
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Spawned workers avoid inheriting the server's threads and DB connections.
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.admission.shared_state() if self.admission else None, self.progress_queue, self.metrics_queue),
+        )
+
+    def _requeue_interrupted(self) -> None:
+        # Jobs left running by a previous process never finished; run them again.
+        with SessionLocal() as db:
+            db.execute(
+                update(ProcessingJob)
+                .where(ProcessingJob.status == JOB_RUNNING)
+                .values(status=JOB_QUEUED, started_at=None)
+            )
+            db.commit()
+
+    def _claim_next(self) -> list[int]:
+        with SessionLocal() as db:
+            # Fair share: the next job comes from whichever owner has the fewest jobs running.
+            running = (
+                select(ProcessingJob.owner_id, func.count(ProcessingJob.id).label("running"))
+                .where(ProcessingJob.status == JOB_RUNNING)
+                .group_by(ProcessingJob.owner_id)
+                .subquery()
+            )
+            while True:
+                first = (
+                    db.query(ProcessingJob)
+                    .outerjoin(running, running.c.owner_id == ProcessingJob.owner_id)
+                    .filter(ProcessingJob.status == JOB_QUEUED)
+                    .order_by(func.coalesce(running.c.running, 0), ProcessingJob.id)
+                    .first()
+                )
+                if first is None:
+                    return []
+                candidates = [first.id]
+                # A job retried after a pool crash runs alone and is not pulled into a chunk, so a
+                # repeat crash costs only its own attempts.
+                if first.batch_id is not None and not first.attempts:
+                    candidates += db.scalars(
+                        select(ProcessingJob.id)
+                        .where(
+                            ProcessingJob.batch_id == first.batch_id,
+                            ProcessingJob.status == JOB_QUEUED,
+                            ProcessingJob.id != first.id,
+                            func.coalesce(ProcessingJob.attempts, 0) == 0,
+                        )
+                        .order_by(ProcessingJob.id)
+                        .limit(self.settings.batch_chunk_size - 1)
+                    ).all()
+
+                started_at = datetime.utcnow()
+                claimed = []
+                for job_id in candidates:
+                    rowcount = db.execute(
+                        update(ProcessingJob)
+                        .where(ProcessingJob.id == job_id, ProcessingJob.status == JOB_QUEUED)
+                        .values(status=JOB_RUNNING, started_at=started_at)
+                    ).rowcount
+                    if rowcount:
+                        claimed.append(job_id)
+                db.commit()
+                if claimed:
+                    return claimed
+
+    def _dispatch_loop(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.clear()
+            with self._inflight_lock:
+                has_capacity = self._inflight < self.workers
+            job_ids: list[int] = []
+            if has_capacity:
+                try:
+                    job_ids = self._claim_next()
+                except Exception:  # noqa: BLE001
+                    logger.exception("Failed to claim next job")
+            if not job_ids:
+                self._wake.wait(self.settings.job_poll_interval_seconds)
+                continue
+
+            with self._inflight_lock:
+                self._inflight += 1
+            with self._pool_lock:
+                try:
+                    pool = self._pool
+                    future = pool.submit(_run_jobs, job_ids)
+                except BrokenProcessPool:
+                    logger.error("Worker pool broke, starting a new one")
+                    pool = self._pool = self._new_pool()
+                    future = pool.submit(_run_jobs, job_ids)
+            future.add_done_callback(partial(self._on_done, job_ids, pool))
+
+    def _on_done(self, job_ids: list[int], pool: ProcessPoolExecutor, future: Future) -> None:
+        with self._inflight_lock:
+            self._inflight -= 1
+        if future.cancelled() or future.exception() is None:
+            self._wake.set()
+            return
+        exc = future.exception()
+        if isinstance(exc, BrokenProcessPool):
+            # One worker died and the executor fails every chunk it had in flight, with no way to
+            # tell which chunk killed it. All of them go back to the queue with an attempt
+            # counted; only a job that keeps crashing the pool runs out of attempts and fails.
+            logger.error("Worker pool crashed while running jobs %s", job_ids)
+            with self._pool_lock:
+                if self._pool is pool and not self._stopping.is_set():
+                    self._pool = self._new_pool()
+                    pool.shutdown(wait=False, cancel_futures=True)
+            self._requeue_crashed(job_ids)
+        else:
+            # The chunk raised outside the per-job handling, before it could record outcomes.
+            logger.error("Jobs %s failed in their worker: %s", job_ids, exc)
+            self._fail_running(job_ids, f"Worker error: {exc}")
+        self._wake.set()
+
+    def _requeue_crashed(self, job_ids: list[int]) -> None:
+        attempts = func.coalesce(ProcessingJob.attempts, 0)
+        with SessionLocal() as db:
+            running = and_(ProcessingJob.id.in_(job_ids), ProcessingJob.status == JOB_RUNNING)
+            db.execute(
+                update(ProcessingJob)
+                .where(running, attempts + 1 >= self.settings.job_max_attempts)
+                .values(status=JOB_FAILED, error="Worker crashed", attempts=attempts + 1, finished_at=datetime.utcnow())
+            )
+            db.execute(
+                update(ProcessingJob)
+                .where(running)
+                .values(status=JOB_QUEUED, started_at=None, attempts=attempts + 1)
+            )
+            db.commit()
+
+    def _fail_running(self, job_ids: list[int], error: str) -> None:
+        with SessionLocal() as db:
+            db.execute(
+                update(ProcessingJob)
+                .where(ProcessingJob.id.in_(job_ids), ProcessingJob.status == JOB_RUNNING)
+                .values(status=JOB_FAILED, error=error, finished_at=datetime.utcnow())
+            )
+            db.commit()
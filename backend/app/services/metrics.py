@@ -0,0 +1,260 @@
+import contextvars
+import math
+import multiprocessing
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import get_settings
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+BYTES_BUCKETS = tuple(2**power for power in range(20, 36, 2))
+WORKER_QUEUE_MAX = 10000
+
+
+class Metric(ABC):
+    kind = ""
+
+    def __init__(self, registry: "Registry", name: str, help_text: str, labelnames: tuple[str, ...]) -> None:
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _labels(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _submit(self, labels: dict[str, str], value: float) -> None:
+        key = self._labels(labels)
+        forward = self.registry.forward_queue
+        if forward is not None:
+            # Job workers hand their samples to the API process, which owns /metrics.
+            try:
+                forward.put_nowait((self.name, key, value))
+            except queue.Full:
+                pass
+            return
+        self.record(key, value)
+
+    @abstractmethod
+    def record(self, key: tuple[str, ...], value: float) -> None: ...
+
+    @abstractmethod
+    def render(self) -> list[str]: ...
+
+    def _format_labels(self, key: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        self._submit(labels, value)
+
+    def record(self, key: tuple[str, ...], value: float) -> None:
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {_number(value)}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DURATION_BUCKETS) -> None:
+        super().__init__(*args)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        self._submit(labels, value)
+
+    def record(self, key: tuple[str, ...], value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else _number(bound)
+                bucket_labels = self._format_labels(key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+        self.forward_queue = None
+        self._worker_queue = None
+        self._receiver: threading.Thread | None = None
+
+    def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def histogram(
+        self, name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DURATION_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(self, name, help_text, labelnames, buckets=buckets))
+
+    def _register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def worker_queue(self):
+        if self._worker_queue is None:
+            self._worker_queue = multiprocessing.get_context("spawn").Queue(WORKER_QUEUE_MAX)
+        return self._worker_queue
+
+    def forward_to(self, worker_queue) -> None:
+        self.forward_queue = worker_queue
+
+    def start(self) -> None:
+        if self._receiver is None:
+            self._receiver = threading.Thread(target=self._receive_loop, name="metrics-receiver", daemon=True)
+            self._receiver.start()
+
+    def stop(self) -> None:
+        if self._receiver is not None:
+            self.worker_queue().put(None)
+            self._receiver.join()
+            self._receiver = None
+
+    def _receive_loop(self) -> None:
+        source = self.worker_queue()
+        while True:
+            item = source.get()
+            if item is None:
+                return
+            name, key, value = item
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.record(tuple(key), value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time to the last response byte, by route.", ("method", "route")
+)
+HTTP_DB_QUERIES = REGISTRY.histogram(
+    "http_request_db_queries", "Database statements executed per request.", ("route",), buckets=COUNT_BUCKETS
+)
+STEP_DURATION = REGISTRY.histogram("pipeline_step_duration_seconds", "Wall time per pipeline step.", ("step",))
+STEP_FAILURES = REGISTRY.counter("pipeline_step_failures_total", "Pipeline steps that raised.", ("step",))
+STEP_INPUT_MEGAPIXELS = REGISTRY.counter(
+    "pipeline_step_input_megapixels_total", "Megapixels fed into each pipeline step.", ("step",)
+)
+STEP_OUTPUT_BYTES = REGISTRY.counter(
+    "pipeline_step_output_bytes_total", "Bytes produced by each pipeline step (file or raw array).", ("step",)
+)
+TOOL_DURATION = REGISTRY.histogram("tool_duration_seconds", "Wall time per external tool run.", ("tool",))
+TOOL_RUNS = REGISTRY.counter(
+    "tool_runs_total", "External tool runs by outcome (ok, failed, timeout, cancelled).", ("tool", "outcome")
+)
+TOOL_PEAK_RSS = REGISTRY.histogram(
+    "tool_peak_rss_bytes", "Peak resident memory of an external tool's process tree.", ("tool",), buckets=BYTES_BUCKETS
+)
+
+# A one-element list per request; threadpool calls copy the context but share the list.
+_query_counter: contextvars.ContextVar[list[int] | None] = contextvars.ContextVar("query_counter", default=None)
+
+
+def count_query(*_args) -> None:
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware, so streaming responses and disconnect
+    # detection pass through untouched. Routes are labelled by template to bound cardinality.
+    def __init__(self, app, profiler=None) -> None:
+        self.app = app
+        self.profiler = profiler
+        self.slow_seconds = get_settings().profile_slow_request_ms / 1000
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        streaming = False
+        started = time.perf_counter()
+        wall_started = time.time()
+        queries = [0]
+        token = _query_counter.set(queries)
+
+        async def send_wrapper(message) -> None:
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", ())
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _query_counter.reset(token)
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            template = (route.path or "/") if route is not None else "unmatched"
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method=method, route=template, status=str(status))
+            HTTP_LATENCY.observe(elapsed, method=method, route=template)
+            HTTP_DB_QUERIES.observe(queries[0], route=template)
+            # Event streams stay open by design; their duration says nothing about slowness.
+            if self.profiler is not None and not streaming and elapsed >= self.slow_seconds:
+                await run_in_threadpool(self.profiler.dump_window, wall_started, time.time(), f"{method} {template}", elapsed)
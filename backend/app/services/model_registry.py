@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+
+logger = logging.getLogger(__name__)
+
+ModelLoader = Callable[[], tuple[Any, int]]
+
+
+@dataclass
+class ModelStats:
+    hits: int = 0
+    misses: int = 0
+    loads: int = 0
+    evictions: int = 0
+    load_seconds_total: float = 0.0
+    last_load_seconds: float | None = None
+
+
+@dataclass
+class _Entry:
+    model: Any
+    size_bytes: int
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    in_use: int = 0
+
+
+class ModelRegistry:
+    # Loaders return (model, size_bytes). Eviction is least recently used first
+    # and skips models a caller currently holds through acquire().
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._loaders: dict[str, ModelLoader] = {}
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._stats: dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+        self._load_locks: dict[str, threading.Lock] = {}
+
+    def register(self, key: str, loader: ModelLoader) -> None:
+        with self._lock:
+            self._loaders[key] = loader
+            self._stats.setdefault(key, ModelStats())
+            self._load_locks.setdefault(key, threading.Lock())
+
+    @contextmanager
+    def acquire(self, key: str) -> Iterator[Any]:
+        entry = self._checkout(key)
+        try:
+            # Upsamplers keep per-call state on the instance, so one caller at a time.
+            with entry.lock:
+                yield entry.model
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                self._evict_locked()
+
+    def warm_up(self, keys: list[str]) -> None:
+        for key in keys:
+            with self.acquire(key):
+                pass
+
+    def loaded(self) -> list[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.size_bytes for entry in self._entries.values())
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {
+                key: {
+                    "loaded": key in self._entries,
+                    "size_bytes": self._entries[key].size_bytes if key in self._entries else 0,
+                    "hits": stats.hits,
+                    "misses": stats.misses,
+                    "loads": stats.loads,
+                    "evictions": stats.evictions,
+                    "load_seconds_total": round(stats.load_seconds_total, 3),
+                    "last_load_seconds": None if stats.last_load_seconds is None else round(stats.last_load_seconds, 3),
+                }
+                for key, stats in self._stats.items()
+            }
+
+    def _checkout(self, key: str) -> _Entry:
+        if key not in self._loaders:
+            raise KeyError(f"Unknown model: {key}")
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._stats[key].hits += 1
+                self._entries.move_to_end(key)
+                entry.in_use += 1
+                return entry
+
+        # Load outside the registry lock so other models stay usable meanwhile.
+        with self._load_locks[key]:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._stats[key].hits += 1
+                    self._entries.move_to_end(key)
+                    entry.in_use += 1
+                    return entry
+                self._stats[key].misses += 1
+
+            started = time.perf_counter()
+            model, size_bytes = self._loaders[key]()
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                stats = self._stats[key]
+                stats.loads += 1
+                stats.load_seconds_total += elapsed
+                stats.last_load_seconds = elapsed
+                entry = _Entry(model=model, size_bytes=size_bytes, in_use=1)
+                self._entries[key] = entry
+                self._evict_locked()
+            logger.info("Loaded model %s (%.1f MB) in %.2fs", key, size_bytes / 2**20, elapsed)
+            return entry
+
+    def _evict_locked(self) -> None:
+        total = sum(entry.size_bytes for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if entry.in_use:
+                continue
+            del self._entries[key]
+            total -= entry.size_bytes
+            self._stats[key].evictions += 1
+            logger.info("Evicted model %s (%.1f MB)", key, entry.size_bytes / 2**20)
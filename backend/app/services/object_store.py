@@ -0,0 +1,360 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from uuid import uuid4
+
+from app.core.config import get_settings
+
+
+# Dot-prefixed staging files this old belong to a download that died part-way.
+SCRATCH_STAGING_STALE_SECONDS = 3600
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    key: str
+    size_bytes: int
+    modified_at: float
+
+
+class ObjectStore(ABC):
+    # Flat key/value storage for immutable files. Keys are relative, "/"-separated paths.
+    @abstractmethod
+    def put_file(self, key: str, source: Path) -> bool:
+        # Stores `source` under `key` unless it already exists; returns whether it was written.
+        ...
+
+    @abstractmethod
+    def get_file(self, key: str, destination: Path) -> None: ...
+
+    @abstractmethod
+    def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    def touch(self, key: str) -> None: ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[StoredObject]: ...
+
+    def local_path(self, key: str) -> Path | None:
+        # Backends on the local filesystem hand out the file itself instead of a copy.
+        return None
+
+    def presigned_url(self, key: str, filename: str | None = None) -> str | None:
+        return None
+
+
+class LocalObjectStore(ObjectStore):
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def put_file(self, key: str, source: Path) -> bool:
+        target = self._path(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # link() never replaces, so concurrent writers of the same key keep a single inode.
+            os.link(source, target)
+        except FileExistsError:
+            return False
+        except OSError:
+            staging = target.with_name(f".{target.name}.{uuid4().hex}")
+            shutil.copyfile(source, staging)
+            os.replace(staging, target)
+        return True
+
+    def get_file(self, key: str, destination: Path) -> None:
+        shutil.copyfile(self._path(key), destination)
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def touch(self, key: str) -> None:
+        os.utime(self._path(key))
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        base = self._path(prefix)
+        if not base.exists():
+            return
+        for path in base.rglob("[!.]*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.is_file():
+                yield StoredObject(path.relative_to(self.root).as_posix(), stat.st_size, stat.st_mtime)
+
+    def local_path(self, key: str) -> Path | None:
+        return self._path(key)
+
+
+class MemoryObjectStore(ObjectStore):
+    # In-process stand-in for an object store. Worker processes do not share it, so
+    # create_object_store refuses it unless JOB_WORKERS=0.
+    def __init__(self) -> None:
+        self._objects: dict[str, tuple[bytes, float]] = {}
+        self._lock = threading.Lock()
+
+    def put_file(self, key: str, source: Path) -> bool:
+        data = source.read_bytes()
+        with self._lock:
+            if key in self._objects:
+                return False
+            self._objects[key] = (data, time.time())
+        return True
+
+    def get_file(self, key: str, destination: Path) -> None:
+        with self._lock:
+            if key not in self._objects:
+                raise FileNotFoundError(key)
+            data, _ = self._objects[key]
+        destination.write_bytes(data)
+
+    def exists(self, key: str) -> bool:
+        return key in self._objects
+
+    def touch(self, key: str) -> None:
+        with self._lock:
+            data, _ = self._objects[key]
+            self._objects[key] = (data, time.time())
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._objects.pop(key, None)
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        with self._lock:
+            items = [(key, len(data), mtime) for key, (data, mtime) in self._objects.items() if key.startswith(prefix)]
+        for key, size, mtime in items:
+            yield StoredObject(key, size, mtime)
+
+
+class S3ObjectStore(ObjectStore):
+    def __init__(self) -> None:
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError as exc:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install -r requirements-s3.txt)") from exc
+
+        settings = get_settings()
+        if not settings.s3_bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        self.bucket = settings.s3_bucket
+        self.prefix = settings.s3_prefix.strip("/")
+        self.presign = settings.s3_presign_downloads
+        self.presign_expiry = settings.s3_presign_expiry_seconds
+        # One client per store: it is thread-safe and keeps a pool of keep-alive connections.
+        self.client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=settings.s3_endpoint_url or None,
+            region_name=settings.s3_region or None,
+            config=Config(max_pool_connections=settings.s3_max_pool_connections, retries={"mode": "adaptive"}),
+        )
+        chunk = settings.s3_multipart_chunk_mb * 2**20
+        self.transfer = TransferConfig(multipart_threshold=chunk, multipart_chunksize=chunk, use_threads=True)
+        self._client_error = ClientError
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put_file(self, key: str, source: Path) -> bool:
+        if self.exists(key):
+            return False
+        # upload_file streams from disk and switches to a parallel multipart upload above the threshold.
+        self.client.upload_file(str(source), self.bucket, self._key(key), Config=self.transfer)
+        return True
+
+    def _missing(self, exc: Exception) -> bool:
+        return isinstance(exc, self._client_error) and exc.response.get("Error", {}).get("Code") in (
+            "404",
+            "NoSuchKey",
+            "NotFound",
+        )
+
+    def get_file(self, key: str, destination: Path) -> None:
+        try:
+            self.client.download_file(self.bucket, self._key(key), str(destination), Config=self.transfer)
+        except self._client_error as exc:
+            # Same contract as the filesystem backends, which callers already handle.
+            if self._missing(exc):
+                raise FileNotFoundError(key) from exc
+            raise
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as exc:
+            if self._missing(exc):
+                return False
+            raise
+        return True
+
+    def touch(self, key: str) -> None:
+        # S3 has no utime; copying an object onto itself refreshes LastModified.
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=self._key(key),
+            CopySource={"Bucket": self.bucket, "Key": self._key(key)},
+            MetadataDirective="REPLACE",
+        )
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get("Contents", []):
+                yield StoredObject(item["Key"][strip:], item["Size"], item["LastModified"].timestamp())
+
+    def presigned_url(self, key: str, filename: str | None = None) -> str | None:
+        if not self.presign:
+            return None
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if filename:
+            params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=self.presign_expiry)
+
+
+def create_object_store(root: Path) -> ObjectStore:
+    settings = get_settings()
+    backend = settings.storage_backend.lower()
+    if backend == "s3":
+        return S3ObjectStore()
+    if backend == "memory":
+        # Spawned job workers would each start with an empty store and fail every job.
+        if settings.job_workers > 0:
+            raise RuntimeError("STORAGE_BACKEND=memory requires JOB_WORKERS=0")
+        return MemoryObjectStore()
+    return LocalObjectStore(root)
+
+
+class ScratchCache:
+    # Bounded local copies of remote objects, for code that needs a real file (cv2, PIL, tools).
+    # A copy is pinned by holding a shared flock on it for as long as the caller uses the path;
+    # eviction takes a non-blocking exclusive lock, so pinned copies (in this process or a job
+    # worker) are skipped and everything else is fair game once the cache is over budget.
+    def __init__(self, store: ObjectStore, root: Path, max_bytes: int) -> None:
+        self.store = store
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _target(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.root / digest[:2] / f"{digest}{Path(key).suffix}"
+
+    @contextmanager
+    def pinned(self, key: str) -> Iterator[Path]:
+        local = self.store.local_path(key)
+        if local is not None:
+            yield local
+            return
+
+        target = self._target(key)
+        handle = _open_locked(target, fcntl.LOCK_SH)
+        fetched = False
+        while handle is None:
+            self._download(key, target)
+            fetched = True
+            handle = _open_locked(target, fcntl.LOCK_SH)
+        try:
+            # mtime doubles as the last-used time for eviction order.
+            os.utime(target)
+            yield target
+        finally:
+            handle.close()
+        if fetched:
+            self.collect()
+
+    def _download(self, key: str, target: Path) -> None:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        staging = target.with_name(f".{target.name}.{uuid4().hex}")
+        try:
+            self.store.get_file(key, staging)
+            # link() never replaces, so a copy another process already pinned keeps its inode.
+            try:
+                os.link(staging, target)
+            except FileExistsError:
+                pass
+        finally:
+            staging.unlink(missing_ok=True)
+
+    def cached_path(self, key: str) -> Path | None:
+        local = self.store.local_path(key)
+        if local is not None:
+            return local
+        target = self._target(key)
+        return target if target.exists() else None
+
+    def collect(self) -> None:
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            stale = time.time() - SCRATCH_STAGING_STALE_SECONDS
+            entries = []
+            staging = 0
+            for path in self.root.glob("*/*"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if path.name.startswith("."):
+                    if stat.st_mtime <= stale:
+                        path.unlink(missing_ok=True)
+                    else:
+                        staging += stat.st_size
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            entries.sort()
+            total = staging + sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                handle = _open_locked(path, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if handle is None:
+                    # Pinned by a reader right now; the next collection gets another chance.
+                    continue
+                with handle:
+                    path.unlink(missing_ok=True)
+                total -= size
+        finally:
+            self._lock.release()
+
+
+def _open_locked(path: Path, operation: int):
+    # Opens and flocks `path`, or returns None if it is missing, was replaced or evicted while
+    # the lock was being taken, or (with LOCK_NB) is held by someone else.
+    try:
+        handle = path.open("rb")
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(handle.fileno(), operation)
+        if os.stat(path).st_ino != os.fstat(handle.fileno()).st_ino:
+            handle.close()
+            return None
+    except (BlockingIOError, FileNotFoundError):
+        handle.close()
+        return None
+    return handle
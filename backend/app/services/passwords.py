@@ -0,0 +1,106 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import get_settings
+from app.core.security import get_password_hash, verify_and_update_password
+
+
+MAX_TRACKED_KEYS = 100_000
+
+
+class HashingBusyError(Exception):
+    pass
+
+
+class PasswordHasher:
+    # bcrypt holds the GIL for its whole run, so hashing in the request threadpool stalls every
+    # other sync handler. A small process pool takes the CPU elsewhere, and a bounded number of
+    # pending hashes turns a login burst into fast 503s instead of a growing backlog.
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self.workers = self.settings.password_hash_workers
+        self.max_pending = self.settings.password_hash_queue_max
+        self._pool: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self.workers > 0 and self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def stop(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        # Returns (valid, replacement hash when the stored one is below the configured cost).
+        return await self._run(verify_and_update_password, password, hashed)
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HashingBusyError("Too many sign-in attempts in progress")
+            self._pending += 1
+        try:
+            if self.workers <= 0:
+                return await run_in_threadpool(fn, *args)
+            self.start()
+            return await asyncio.wrap_future(self._pool.submit(fn, *args))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+class LoginThrottle:
+    # Sliding-window failure counts per key (an email or a client address). Checked before any
+    # hashing, so a flood of bad passwords costs a dictionary lookup rather than a bcrypt run.
+    # State is per process, like the local session cache.
+    def __init__(self) -> None:
+        settings = get_settings()
+        self.window = settings.login_throttle_window_seconds
+        self._failures: OrderedDict[str, deque[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def retry_after(self, limits: dict[str, int]) -> int | None:
+        now = time.monotonic()
+        wait = 0.0
+        with self._lock:
+            for key, limit in limits.items():
+                failures = self._failures.get(key)
+                if failures is None or limit <= 0:
+                    continue
+                self._prune(failures, now)
+                if len(failures) >= limit:
+                    wait = max(wait, failures[-limit] + self.window - now)
+        return max(1, round(wait)) if wait > 0 else None
+
+    def record_failure(self, *keys: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                failures = self._failures.pop(key, None) or deque()
+                self._prune(failures, now)
+                failures.append(now)
+                self._failures[key] = failures
+            while len(self._failures) > MAX_TRACKED_KEYS:
+                self._failures.popitem(last=False)
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def _prune(self, failures: deque[float], now: float) -> None:
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
@@ -1,51 +1,431 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
 import shlex
-import subprocess
+import shutil
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
+from typing import Any
+from uuid import uuid4
 
-import cv2
 import numpy as np
 
 from app.core.config import get_settings
 from app.schemas import OpenCVOptions, ProcessRequest
+from app.services.admission import AdmissionController
+from app.services.denoise import available_cpus
+from app.services.enhance import enhance_image, enhance_rows
+from app.services.faces import FaceDetector, face_regions, restore_regions
+from app.services.frames import RAW_SUFFIX, Frame, read_image, write_image
+from app.services.intermediates import IntermediateStore, link_or_copy, stage_key
+from app.services.metrics import (
+    STEP_DURATION,
+    STEP_FAILURES,
+    STEP_INPUT_MEGAPIXELS,
+    STEP_OUTPUT_BYTES,
+    TOOL_DURATION,
+    TOOL_PEAK_RSS,
+    TOOL_RUNS,
+)
+from app.services.model_registry import ModelRegistry
+from app.services.progress import progress_reporter
+from app.services.storage import UploadTooLargeError, probe_dimensions, sha256_file
+from app.services.tiling import choose_tile_size, estimate_full_upscale_bytes, open_row_writer, tiled_upscale
+from app.services.tool_runner import ToolCancelled, ToolTimeout, run_tool
+
+
+logger = logging.getLogger(__name__)
+
+REALESRGAN_X4 = "realesrgan_x4"
+GFPGAN = "gfpgan"
+
+StageFn = Callable[[Frame, Path], Frame]
+
+# Peak working set per pixel a stage touches: its input and output frames plus temporaries.
+STAGE_BYTES_PER_PIXEL = {"deoldify": 48, "gfpgan": 64, "opencv": 24}
+UPSCALE_FACTOR = 4
+# Keeps the banded opencv pass from degenerating into per-row calls on very wide images.
+MIN_BAND_ROWS = 64
+
+
+@dataclass
+class StageReport:
+    name: str
+    io_seconds: float = 0.0
+    compute_seconds: float = 0.0
+    cache_seconds: float = 0.0
+
+
+@dataclass
+class PipelineReport:
+    stages: list[StageReport] = field(default_factory=list)
+    resumed_after: str | None = None
+    output_io_seconds: float = 0.0
+
+
+def _weights_size(*paths: str) -> int:
+    # Resident parameter memory tracks the on-disk weight size closely enough to budget with.
+    return sum(Path(path).stat().st_size for path in paths if Path(path).exists())
+
+
+def _file_identity(path: str | None) -> str | None:
+    # Size and mtime stand in for a version: replacing weights or a tool binary changes them.
+    if not path:
+        return None
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _command_params(command: str) -> dict[str, Any]:
+    # The executable (looked up on PATH) and any file arguments, such as a script or weights.
+    files = {}
+    for index, token in enumerate(shlex.split(command)):
+        if "{" in token:
+            continue
+        resolved = shutil.which(token) if index == 0 else token
+        if resolved and os.path.isfile(resolved):
+            files[token] = _file_identity(resolved)
+    return {"cmd": command, "files": files}
+
+
+def _model_params(**paths: str | None) -> dict[str, Any]:
+    return {name: {"path": path, "file": _file_identity(path)} for name, path in paths.items()}
+
+
+def _frame_megapixels(frame: Frame) -> float | None:
+    # Header-only for files, so measuring never decodes an image the step itself did not.
+    if frame.decoded:
+        height, width = frame.array().shape[:2]
+    elif frame.path.suffix.lower() == RAW_SUFFIX:
+        height, width = np.load(frame.path, mmap_mode="r").shape[:2]
+    else:
+        try:
+            probed = probe_dimensions(frame.path)
+        except UploadTooLargeError:
+            probed = None
+        if probed is None:
+            return None
+        _, width, height = probed
+    return width * height / 1e6
+
+
+def _frame_bytes(frame: Frame) -> int:
+    if frame.path is not None and frame.path.exists():
+        return frame.path.stat().st_size
+    return frame.array().nbytes if frame.decoded else 0
 
 
 class ProcessingService:
     def __init__(self) -> None:
         self.settings = get_settings()
+        self.models = ModelRegistry(max_bytes=self.settings.model_cache_max_mb * 2**20)
+        self.models.register(REALESRGAN_X4, self._load_realesrgan)
+        self.models.register(GFPGAN, self._load_gfpgan)
+        self.intermediates = IntermediateStore()
+        self.faces = FaceDetector()
+        # Job workers and password-hash workers each keep a core busy, so the band pool gets the
+        # cores left over; at one it denoises single-shot. Job workers themselves denoise serially.
+        self.denoise_workers = self.settings.denoise_workers or max(
+            1, available_cpus() - self.settings.job_workers - self.settings.password_hash_workers
+        )
+        self.admission: AdmissionController | None = None
 
-    def process_image(self, source: Path, destination: Path, options: ProcessRequest) -> None:
-        working = source
+    def warm_up(self) -> None:
+        keys = [key.strip() for key in (self.settings.model_warmup or "").split(",") if key.strip()]
+        self.models.warm_up(keys)
 
-        if options.colorize:
-            working = self._step_deoldify(working, destination.with_name(destination.stem + "_colorized" + destination.suffix))
+    def estimate_memory_bytes(self, width: int, height: int, options: ProcessRequest) -> int:
+        # Stages run one after another, so the cost is the largest single stage at the
+        # resolution it sees; the upscale multiplies every later stage's pixels by scale**2.
+        peak = 0
+        tiled = False
+        budget = self.settings.realesrgan_memory_budget_mb * 2**20
+        for name, _, _, _ in self._plan(options):
+            if name == "realesrgan":
+                full = estimate_full_upscale_bytes(height, width, UPSCALE_FACTOR)
+                tiled = self._should_tile_upscale(height, width, UPSCALE_FACTOR)
+                peak = max(peak, min(full, budget) if tiled else full)
+                width, height = width * UPSCALE_FACTOR, height * UPSCALE_FACTOR
+            elif name == "opencv" and tiled:
+                # Streamed band by band from the tiled output, within the same budget.
+                peak = max(peak, min(width * height * STAGE_BYTES_PER_PIXEL[name], budget))
+            else:
+                peak = max(peak, width * height * STAGE_BYTES_PER_PIXEL[name])
+        return peak
 
-        if options.face_restore:
-            working = self._step_gfpgan(working, destination.with_name(destination.stem + "_face" + destination.suffix))
+    def process_image(
+        self,
+        source: Path,
+        destination: Path,
+        options: ProcessRequest,
+        source_hash: str | None = None,
+    ) -> PipelineReport:
+        stages = self._plan(options)
+        report = PipelineReport()
+        memoize = bool(stages) and self.intermediates.enabled
+        frame = Frame(path=source)
+        start = 0
 
-        if options.upscale:
-            working = self._step_realesrgan(working, destination.with_name(destination.stem + "_upscaled" + destination.suffix))
+        source_key = source_hash or (sha256_file(source) if memoize else None)
+        keys: list[str] = []
+        if source_key is not None:
+            key = source_key
+            for name, params, _, _ in stages:
+                key = stage_key(key, name, params)
+                keys.append(key)
+        if memoize:
+            # Resume after the deepest stage whose output is already cached.
+            for index in range(len(stages) - 1, -1, -1):
+                cached = self.intermediates.get(keys[index])
+                if cached is not None:
+                    frame = cached
+                    start = index + 1
+                    report.resumed_after = stages[index][0]
+                    break
 
+        reporter = progress_reporter.get()
+        scratch: list[Path] = []
+        try:
+            for index in range(start, len(stages)):
+                name, _, suffix, run = stages[index]
+                output_path = destination.with_name(destination.stem + suffix + destination.suffix)
+                scratch.append(output_path)
+                io_before = frame.io_seconds
+                frame.key = (keys[index - 1] if index else source_key) if keys else None
+                if reporter is not None:
+                    reporter.stage_start(name, index, len(stages))
+                with self._step_slot(name):
+                    started = time.perf_counter()
+                    try:
+                        result = run(frame, output_path)
+                    except Exception:
+                        STEP_FAILURES.inc(step=name)
+                        raise
+                    elapsed = time.perf_counter() - started
+                self._record_step(name, frame, result, elapsed)
+                if reporter is not None:
+                    reporter.stage_end(name, elapsed)
+                stage = StageReport(name=name, io_seconds=frame.io_seconds - io_before + result.io_seconds)
+                stage.compute_seconds = elapsed - stage.io_seconds
+
+                if memoize:
+                    started = time.perf_counter()
+                    result = self.intermediates.put(keys[index], result)
+                    stage.cache_seconds = time.perf_counter() - started
+                report.stages.append(stage)
+                frame = result
+
+            started = time.perf_counter()
+            self._commit_output(frame, destination)
+            report.output_io_seconds = time.perf_counter() - started
+        finally:
+            for path in scratch:
+                path.unlink(missing_ok=True)
+                path.with_name(path.stem + "_input" + path.suffix).unlink(missing_ok=True)
+                path.with_suffix(RAW_SUFFIX).unlink(missing_ok=True)
+
+        if memoize:
+            self.intermediates.collect()
+        logger.debug("Processed %s: %s", destination.name, report)
+        return report
+
+    def _record_step(self, name: str, frame: Frame, result: Frame, elapsed: float) -> None:
+        STEP_DURATION.observe(elapsed, step=name)
+        megapixels = _frame_megapixels(frame)
+        if megapixels is not None:
+            STEP_INPUT_MEGAPIXELS.inc(megapixels, step=name)
+        STEP_OUTPUT_BYTES.inc(_frame_bytes(result), step=name)
+
+    def _step_slot(self, name: str):
+        if self.admission is None:
+            return contextlib.nullcontext()
+        return self.admission.step(name)
+
+    def _commit_output(self, frame: Frame, destination: Path) -> None:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        same_format = frame.path is not None and frame.path.suffix.lower() == destination.suffix.lower()
+        if same_format and frame.owned:
+            os.replace(frame.path, destination)
+            return
+
+        # Build the file beside the destination so the final step is always an atomic rename.
+        staging = destination.with_name(f".{destination.stem}.{uuid4().hex}{destination.suffix}")
+        try:
+            if same_format:
+                link_or_copy(frame.path, staging)
+            else:
+                write_image(staging, frame.array())
+            os.replace(staging, destination)
+        finally:
+            staging.unlink(missing_ok=True)
+
+    def _plan(self, options: ProcessRequest) -> list[tuple[str, dict[str, Any], str, StageFn]]:
+        # Params cover everything that changes a stage's output, including which tool runs it.
+        stages: list[tuple[str, dict[str, Any], str, StageFn]] = []
+        if options.colorize:
+            params = _command_params(self.settings.deoldify_cmd) if self.settings.deoldify_cmd else {"cmd": None}
+            stages.append(("deoldify", params, "_colorized", self._step_deoldify))
+        if options.face_restore:
+            params = _command_params(self.settings.gfpgan_cmd) if self.settings.gfpgan_cmd else _model_params(
+                model=self.settings.gfpgan_model_path,
+                bg_model=self.settings.gfpgan_upsampler_model_path,
+            )
+            if self.settings.face_detect_enabled:
+                params["faces"] = {
+                    "max_side": self.settings.face_detect_max_side,
+                    "margin": self.settings.face_crop_margin,
+                    "max_coverage": self.settings.face_crop_max_coverage,
+                }
+            stages.append(("gfpgan", params, "_face", self._step_gfpgan))
+        if options.upscale:
+            params = _command_params(self.settings.realesrgan_cmd) if self.settings.realesrgan_cmd else {
+                **_model_params(model=self.settings.realesrgan_model_path),
+                "scale": 4,
+                # Tile seams differ from a whole-image pass, and the tile size follows the budget.
+                "tiling": {
+                    "mode": self.settings.realesrgan_tile_mode,
+                    "memory_budget_mb": self.settings.realesrgan_memory_budget_mb,
+                    "overlap": self.settings.realesrgan_tile_overlap,
+                },
+            }
+            # A tiled upscale hands a following opencv stage rows it can stream, not a whole image.
+            stages.append(("realesrgan", params, "_upscaled", partial(self._step_realesrgan, streamed=options.opencv is not None)))
         if options.opencv is not None:
-            working = self._step_opencv(working, destination.with_name(destination.stem + "_opencv" + destination.suffix), options.opencv)
+            opencv = options.opencv
+            stages.append((
+                "opencv",
+                opencv.model_dump(mode="json"),
+                "_opencv",
+                lambda frame, output_path: self._step_opencv(frame, output_path, opencv),
+            ))
+        return stages
+
+    def config_fingerprint(self, options: ProcessRequest) -> str:
+        # The stage params minus the request itself: tools, weights and tiling that decide the pixels.
+        params = [[name, params] for name, params, _, _ in self._plan(options)]
+        return hashlib.sha256(json.dumps(params, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
 
-        if working != destination:
-            destination.parent.mkdir(parents=True, exist_ok=True)
-            destination.write_bytes(working.read_bytes())
+    def _run_tool_stage(self, name: str, command_template: str, frame: Frame, output_path: Path) -> Frame:
+        input_path = frame.image_file(output_path.with_name(output_path.stem + "_input" + output_path.suffix))
+        return Frame(path=self._run_command_tool(name, command_template, input_path, output_path), owned=True)
 
-    def _run_command_tool(self, command_template: str, input_path: Path, output_path: Path) -> Path:
+    def _run_command_tool(self, name: str, command_template: str, input_path: Path, output_path: Path) -> Path:
         output_path.parent.mkdir(parents=True, exist_ok=True)
         command = command_template.format(input=shlex.quote(str(input_path)), output=shlex.quote(str(output_path)))
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise RuntimeError(result.stderr.strip() or result.stdout.strip() or "External tool failed")
+        timeout = getattr(self.settings, f"{name}_timeout_seconds") or None
+        run = run_tool(command, timeout=timeout, log_limit=self.settings.tool_log_max_bytes)
+        logger.info(
+            "Tool %s exited %s in %.2fs, peak RSS %.1f MiB",
+            name,
+            run.returncode,
+            run.wall_seconds,
+            run.peak_rss_bytes / 2**20,
+        )
+        outcome = "cancelled" if run.cancelled else "timeout" if run.timed_out else "ok" if run.returncode == 0 else "failed"
+        TOOL_RUNS.inc(tool=name, outcome=outcome)
+        TOOL_DURATION.observe(run.wall_seconds, tool=name)
+        TOOL_PEAK_RSS.observe(run.peak_rss_bytes, tool=name)
+        if run.cancelled:
+            raise ToolCancelled(f"{name} was cancelled")
+        if run.timed_out:
+            raise ToolTimeout(f"{name} timed out after {timeout:g}s")
+        if run.returncode != 0:
+            raise RuntimeError(run.stderr.strip() or run.stdout.strip() or "External tool failed")
         if not output_path.exists():
             raise RuntimeError("Processing tool did not produce output file")
         return output_path
 
-    def _step_realesrgan(self, input_path: Path, output_path: Path) -> Path:
+    def _step_realesrgan(self, frame: Frame, output_path: Path, streamed: bool = False) -> Frame:
         if self.settings.realesrgan_cmd:
-            return self._run_command_tool(self.settings.realesrgan_cmd, input_path, output_path)
+            return self._run_tool_stage("realesrgan", self.settings.realesrgan_cmd, frame, output_path)
 
+        img = frame.array()
+        if self._should_tile_upscale(*img.shape[:2], scale=4):
+            return self._step_realesrgan_tiled(img, output_path.with_suffix(RAW_SUFFIX) if streamed else output_path, scale=4)
+
+        with self.models.acquire(REALESRGAN_X4) as upsampler:
+            output, _ = upsampler.enhance(img, outscale=4)
+        return Frame(array=output)
+
+    def _should_tile_upscale(self, height: int, width: int, scale: int) -> bool:
+        mode = self.settings.realesrgan_tile_mode
+        if mode == "always":
+            return True
+        if mode == "off":
+            return False
+        return estimate_full_upscale_bytes(height, width, scale) > self.settings.realesrgan_memory_budget_mb * 2**20
+
+    def _step_realesrgan_tiled(self, img: np.ndarray, output_path: Path, scale: int) -> Frame:
+        # Tiled output goes straight to disk, as an encoded image when it is the final result or
+        # as raw rows when a later stage reads it back in bands.
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        height, width = img.shape[:2]
+        overlap = self.settings.realesrgan_tile_overlap
+        tile = choose_tile_size(width, scale, overlap, self.settings.realesrgan_memory_budget_mb * 2**20)
+        writer = open_row_writer(output_path, width * scale, height * scale)
+        reporter = progress_reporter.get()
+        try:
+            with self.models.acquire(REALESRGAN_X4) as upsampler:
+                tiled_upscale(
+                    img,
+                    lambda patch: upsampler.enhance(patch, outscale=scale)[0],
+                    scale,
+                    tile,
+                    overlap,
+                    writer,
+                    on_tile=partial(reporter.progress, "realesrgan") if reporter else None,
+                )
+        except BaseException:
+            writer.abort()
+            output_path.unlink(missing_ok=True)
+            raise
+        writer.close()
+        return Frame(path=output_path, owned=True)
+
+    def _step_gfpgan(self, frame: Frame, output_path: Path) -> Frame:
+        regions = None
+        if self.settings.face_detect_enabled:
+            img = frame.array()
+            faces = self.faces.detect(img, frame.key)
+            if not faces:
+                logger.info("No faces detected, skipping face restoration")
+                return Frame(array=img)
+            regions = face_regions(faces, img.shape, self.settings.face_crop_margin, self.settings.face_crop_max_coverage)
+
+        if self.settings.gfpgan_cmd:
+            if regions is None:
+                return self._run_tool_stage("gfpgan", self.settings.gfpgan_cmd, frame, output_path)
+            restore = partial(self._run_tool_on_array, "gfpgan", self.settings.gfpgan_cmd, output_path=output_path)
+            return Frame(array=restore_regions(frame.array(), regions, restore))
+
+        img = frame.array()
+        with self.models.acquire(GFPGAN) as restorer:
+            def enhance(region: np.ndarray) -> np.ndarray:
+                return restorer.enhance(region, has_aligned=False, only_center_face=False, paste_back=True)[2]
+
+            if regions is None:
+                return Frame(array=enhance(img))
+            return Frame(array=restore_regions(img, regions, enhance))
+
+    def _run_tool_on_array(self, name: str, command_template: str, image: np.ndarray, output_path: Path) -> np.ndarray:
+        crop_output = output_path.with_name(f"{output_path.stem}_{uuid4().hex[:8]}{output_path.suffix}")
+        crop_input = crop_output.with_name(crop_output.stem + "_input" + crop_output.suffix)
+        try:
+            write_image(crop_input, image)
+            return read_image(self._run_command_tool(name, command_template, crop_input, crop_output))
+        finally:
+            crop_input.unlink(missing_ok=True)
+            crop_output.unlink(missing_ok=True)
+
+    def _load_realesrgan(self) -> tuple[object, int]:
         try:
             from basicsr.archs.rrdbnet_arch import RRDBNet
             from realesrgan import RealESRGANer
@@ -58,18 +438,9 @@ class ProcessingService:
 
         model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
         upsampler = RealESRGANer(scale=4, model_path=model_path, model=model)
-        img = cv2.imread(str(input_path), cv2.IMREAD_COLOR)
-        if img is None:
-            raise RuntimeError("Unable to read source image")
-        output, _ = upsampler.enhance(img, outscale=4)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        cv2.imwrite(str(output_path), output)
-        return output_path
-
-    def _step_gfpgan(self, input_path: Path, output_path: Path) -> Path:
-        if self.settings.gfpgan_cmd:
-            return self._run_command_tool(self.settings.gfpgan_cmd, input_path, output_path)
+        return upsampler, _weights_size(model_path)
 
+    def _load_gfpgan(self) -> tuple[object, int]:
         try:
             from gfpgan import GFPGANer
         except Exception as exc:  # noqa: BLE001
@@ -89,47 +460,39 @@ class ProcessingService:
         bg_model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=2)
         bg_upsampler = RealESRGANer(scale=2, model_path=bg_model_path, model=bg_model)
         restorer = GFPGANer(model_path=model_path, upscale=1, arch="clean", channel_multiplier=2, bg_upsampler=bg_upsampler)
+        return restorer, _weights_size(model_path, bg_model_path)
 
-        img = cv2.imread(str(input_path), cv2.IMREAD_COLOR)
-        if img is None:
-            raise RuntimeError("Unable to read source image")
-        _, _, restored_img = restorer.enhance(img, has_aligned=False, only_center_face=False, paste_back=True)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        cv2.imwrite(str(output_path), restored_img)
-        return output_path
-
-    def _step_deoldify(self, input_path: Path, output_path: Path) -> Path:
+    def _step_deoldify(self, frame: Frame, output_path: Path) -> Frame:
         if self.settings.deoldify_cmd:
-            return self._run_command_tool(self.settings.deoldify_cmd, input_path, output_path)
+            return self._run_tool_stage("deoldify", self.settings.deoldify_cmd, frame, output_path)
         raise RuntimeError("DeOldify requires DEOLDIFY_CMD integration in this build")
 
-    def _step_opencv(self, input_path: Path, output_path: Path, options: OpenCVOptions) -> Path:
-        image = cv2.imread(str(input_path), cv2.IMREAD_COLOR)
-        if image is None:
-            raise RuntimeError("Unable to read source image")
-
-        result = image.copy()
-
-        if options.denoise:
-            result = cv2.fastNlMeansDenoisingColored(result, None, 6, 6, 7, 21)
-
-        if options.sharpen:
-            kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-            result = cv2.filter2D(result, -1, kernel)
-
-        if options.contrast != 1.0:
-            result = cv2.convertScaleAbs(result, alpha=options.contrast, beta=0)
-
-        if options.saturation != 1.0:
-            hsv = cv2.cvtColor(result, cv2.COLOR_BGR2HSV).astype(np.float32)
-            hsv[:, :, 1] = np.clip(hsv[:, :, 1] * options.saturation, 0, 255)
-            result = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
-
-        if options.gamma != 1.0 and options.gamma > 0:
-            inv_gamma = 1.0 / options.gamma
-            table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype("uint8")
-            result = cv2.LUT(result, table)
+    def _step_opencv(self, frame: Frame, output_path: Path, options: OpenCVOptions) -> Frame:
+        params = {
+            "contrast": options.contrast,
+            "saturation": options.saturation,
+            "gamma": options.gamma,
+            "sharpen": options.sharpen,
+            "denoise_h": 6.0 if options.denoise else 0.0,
+            "denoise_workers": self.denoise_workers,
+        }
+        if not frame.decoded and frame.path.suffix.lower() == RAW_SUFFIX:
+            return self._step_opencv_banded(np.load(frame.path, mmap_mode="r"), output_path, params)
+        return Frame(array=enhance_image(frame.array(), **params))
 
+    def _step_opencv_banded(self, image: np.ndarray, output_path: Path, params: dict[str, Any]) -> Frame:
+        # Raw input (a tiled upscale or a cached array) is read through a memory map and enhanced
+        # a band at a time, so the stage stays within the upscale's memory budget.
+        height, width = image.shape[:2]
+        budget = self.settings.realesrgan_memory_budget_mb * 2**20
+        band_rows = max(MIN_BAND_ROWS, budget // (width * STAGE_BYTES_PER_PIXEL["opencv"]))
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        cv2.imwrite(str(output_path), result)
-        return output_path
+        writer = open_row_writer(output_path, width, height)
+        try:
+            enhance_rows(image, writer.write_rows, band_rows, **params)
+        except BaseException:
+            writer.abort()
+            output_path.unlink(missing_ok=True)
+            raise
+        writer.close()
+        return Frame(path=output_path, owned=True)
@@ -0,0 +1,81 @@
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+
+from app.core.config import get_settings
+
+
+# Threads parked in these modules are waiting, not working; leaving them out keeps idle pool
+# threads and the event loop's select() from drowning the request's own stacks.
+IDLE_MODULES = ("threading.py", "selectors.py", "queue.py", "connection.py", "unix_events.py")
+
+
+class SamplingProfiler:
+    # Samples every thread's Python stack at a fixed interval into a rolling history. When a
+    # request turns out to be slow, the samples taken while it ran are written in the collapsed
+    # format ("frame;frame;frame count") read by flamegraph.pl, speedscope and similar tools.
+    # Threads are not attributed to requests, so concurrent requests share a profile.
+    def __init__(self) -> None:
+        settings = get_settings()
+        self.interval = settings.profile_sample_interval_ms / 1000
+        self.history_seconds = settings.profile_history_seconds
+        self.output_dir = Path(settings.storage_dir) / "profiles"
+        self._samples: deque[tuple[float, tuple[str, ...]]] = deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names: dict[int, str] = {}
+        labels: dict[object, str] = {}
+        while not self._stop.wait(self.interval):
+            now = time.time()
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own or frame.f_code.co_filename.endswith(IDLE_MODULES):
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+                    parts.append(label)
+                    frame = frame.f_back
+                parts.append(names.get(ident, f"thread-{ident}"))
+                stacks.append(";".join(reversed(parts)))
+            with self._lock:
+                self._samples.append((now, tuple(stacks)))
+                while self._samples and self._samples[0][0] < now - self.history_seconds:
+                    self._samples.popleft()
+
+    def dump_window(self, started: float, finished: float, name: str, elapsed: float) -> Path | None:
+        with self._lock:
+            window = [stacks for taken, stacks in self._samples if started <= taken <= finished]
+        folded = Counter(stack for stacks in window for stack in stacks)
+        if not folded:
+            return None
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(started))
+        path = self.output_dir / f"{stamp}-{slug}-{round(elapsed * 1000)}ms.folded"
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in folded.most_common()))
+        return path
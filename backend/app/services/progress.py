@@ -0,0 +1,189 @@
+import asyncio
+import contextvars
+import json
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable
+
+from app.core.config import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_EVENTS = ("done", "failed")
+LAST_EVENTS_MAX = 4096
+WORKER_QUEUE_MAX = 10000
+
+ProgressSink = Callable[[dict], None]
+
+
+class ProgressLimitError(Exception):
+    pass
+
+
+class ProgressReporter:
+    # Turns pipeline callbacks into events: stage boundaries always go out, fractional
+    # progress is throttled so a tiled upscale does not flood subscribers.
+    def __init__(self, sink: ProgressSink, min_interval: float | None = None) -> None:
+        self.sink = sink
+        self.min_interval = get_settings().progress_min_interval_seconds if min_interval is None else min_interval
+        self._stage_index = 0
+        self._stage_total = 1
+        self._last_progress = 0.0
+
+    def stage_start(self, name: str, index: int, total: int) -> None:
+        self._stage_index, self._stage_total = index, max(1, total)
+        self.emit({"type": "stage_start", "stage": name, "index": index, "total": total, "overall": self._overall(0.0)})
+
+    def stage_end(self, name: str, seconds: float) -> None:
+        self.emit({"type": "stage_end", "stage": name, "seconds": round(seconds, 3), "overall": self._overall(1.0)})
+
+    def progress(self, name: str, done: int, total: int) -> None:
+        now = time.monotonic()
+        if done < total and now - self._last_progress < self.min_interval:
+            return
+        self._last_progress = now
+        fraction = done / total if total else 1.0
+        self.emit({"type": "progress", "stage": name, "fraction": round(fraction, 4), "overall": self._overall(fraction)})
+
+    def finished(self, version: int) -> None:
+        self.emit({"type": "done", "version": version, "overall": 1.0})
+
+    def failed(self, error: str) -> None:
+        self.emit({"type": "failed", "error": error})
+
+    def emit(self, event: dict) -> None:
+        event["ts"] = time.time()
+        try:
+            self.sink(event)
+        except Exception:  # noqa: BLE001
+            # Progress is best effort and must never fail the work it describes.
+            logger.debug("Dropped progress event %s", event, exc_info=True)
+
+    def _overall(self, fraction: float) -> float:
+        return round((self._stage_index + fraction) / self._stage_total, 4)
+
+
+# Set around a pipeline run by whoever wants to observe it (request thread or job worker).
+progress_reporter: contextvars.ContextVar[ProgressReporter | None] = contextvars.ContextVar(
+    "progress_reporter", default=None
+)
+
+
+class ProgressHub:
+    # Fan-out from processing threads and job workers to async subscribers. Publishing only
+    # schedules work on the event loop; each subscriber has a bounded queue that drops its
+    # oldest event when the client falls behind, so slow readers never stall anyone else.
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self.queue_size = self.settings.progress_queue_size
+        self.max_subscribers = self.settings.progress_max_subscribers
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._count = 0
+        self._last: OrderedDict[str, dict] = OrderedDict()
+        self._worker_queue = multiprocessing.get_context("spawn").Queue(WORKER_QUEUE_MAX)
+        self._pump: threading.Thread | None = None
+
+    def worker_queue(self):
+        return self._worker_queue
+
+    def start(self) -> None:
+        # Called from the startup hook, which runs on the server's event loop.
+        self._loop = asyncio.get_running_loop()
+        if self._pump is None:
+            self._pump = threading.Thread(target=self._pump_loop, name="progress-pump", daemon=True)
+            self._pump.start()
+
+    def stop(self) -> None:
+        if self._pump is not None:
+            self._worker_queue.put(None)
+            self._pump.join()
+            self._pump = None
+        self._loop = None
+
+    def publish(self, topics: tuple[str, ...], event: dict) -> None:
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch, topics, event)
+        except RuntimeError:
+            pass
+
+    def sink(self, *topics: str) -> ProgressSink:
+        return lambda event: self.publish(topics, event)
+
+    def check_capacity(self) -> None:
+        # Checked before a response starts streaming; the subscription itself is made lazily.
+        if self._count >= self.max_subscribers:
+            raise ProgressLimitError("Too many progress subscribers")
+
+    async def events(
+        self, topic: str, replay_terminal: bool = True, heartbeat: float | None = None
+    ) -> AsyncIterator[dict | None]:
+        # Yields events until a terminal one, or None when `heartbeat` seconds pass quietly.
+        # Late subscribers start from the topic's latest event; topics reused across runs
+        # (images) skip a stale terminal event and wait for the next run instead.
+        subscriber: asyncio.Queue = asyncio.Queue(self.queue_size)
+        last = self._last.get(topic)
+        if last is not None and (replay_terminal or last["type"] not in TERMINAL_EVENTS):
+            subscriber.put_nowait(last)
+        self._subscribers.setdefault(topic, set()).add(subscriber)
+        self._count += 1
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            self._count -= 1
+            listeners = self._subscribers.get(topic)
+            if listeners is not None:
+                listeners.discard(subscriber)
+                if not listeners:
+                    del self._subscribers[topic]
+
+    def _dispatch(self, topics: tuple[str, ...], event: dict) -> None:
+        for topic in topics:
+            self._last[topic] = event
+            self._last.move_to_end(topic)
+            for subscriber in self._subscribers.get(topic, ()):
+                if subscriber.full():
+                    subscriber.get_nowait()
+                subscriber.put_nowait(event)
+        while len(self._last) > LAST_EVENTS_MAX:
+            self._last.popitem(last=False)
+
+    def _pump_loop(self) -> None:
+        while True:
+            item = self._worker_queue.get()
+            if item is None:
+                return
+            topics, event = item
+            self.publish(topics, event)
+
+
+def worker_sink(worker_queue, *topics: str) -> ProgressSink:
+    def put(event: dict) -> None:
+        try:
+            worker_queue.put_nowait((topics, event))
+        except queue.Full:
+            pass
+
+    return put
+
+
+def format_sse(event: dict | None) -> str:
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
@@ -0,0 +1,91 @@
+import contextlib
+from dataclasses import dataclass
+from pathlib import Path
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.models import ImageAsset, ImageVersion
+from app.schemas import ProcessRequest
+from app.services.derivatives import DerivativeService
+from app.services.processing import ProcessingService
+from app.services.result_cache import ResultCache, canonical_operations
+from app.services.storage import StorageService, probe_dimensions, sha256_file
+
+
+@dataclass(frozen=True)
+class RestoreResult:
+    path: str
+    operations_json: str
+    content_hash: str | None
+
+
+class RestoreService:
+    def __init__(self, storage: StorageService, processor: ProcessingService) -> None:
+        self.storage = storage
+        self.processor = processor
+        self.cache = ResultCache(storage)
+        self.derivatives = DerivativeService(storage)
+
+    def process(self, db: Session, image: ImageAsset, options: ProcessRequest, wait: bool = False) -> ImageVersion:
+        return self.record_version(db, image.id, self.produce(image, options, wait))
+
+    def produce(self, image: ImageAsset, options: ProcessRequest, wait: bool = False) -> RestoreResult:
+        # Runs (or reuses) the pipeline without touching the database rows of the image.
+        operations_json = canonical_operations(options)
+        with self.storage.local_copy(image.current_path) as source:
+            if image.content_hash and image.current_path == image.original_path:
+                input_hash = image.content_hash
+            else:
+                input_hash = sha256_file(source)
+            cache_key = self.cache.key_for(input_hash, operations_json, self.processor.config_fingerprint(options))
+
+            out_key = self.cache.lookup(cache_key)
+            if out_key is None:
+                produced = self.storage.blobs.scratch_path(source.suffix.lower() or ".png")
+                try:
+                    with self._admit(image, source, options, wait):
+                        self.processor.process_image(source, produced, options, source_hash=input_hash)
+                    size_bytes = produced.stat().st_size
+                    out_key = self.storage.blobs.commit(produced)
+                finally:
+                    produced.unlink(missing_ok=True)
+                self.cache.store(cache_key, input_hash, operations_json, out_key, size_bytes)
+        if self.derivatives.settings.derivatives_eager:
+            self.derivatives.generate_all(out_key)
+
+        return RestoreResult(path=out_key, operations_json=operations_json, content_hash=self.storage.blobs.digest_of(out_key))
+
+    def record_version(self, db: Session, image_id: int, result: RestoreResult) -> ImageVersion:
+        # The number is claimed by an atomic increment in the transaction that writes the version,
+        # not read before processing, so concurrent runs on one image (a request and a queued
+        # job, two tabs) each get their own version instead of colliding on uq_image_version.
+        next_version = db.execute(
+            update(ImageAsset)
+            .where(ImageAsset.id == image_id)
+            .values(current_version=ImageAsset.current_version + 1, current_path=result.path)
+            .returning(ImageAsset.current_version)
+        ).scalar_one_or_none()
+        if next_version is None:
+            raise LookupError("Image was deleted while it was being processed")
+        version = ImageVersion(
+            image_id=image_id,
+            version=next_version,
+            path=result.path,
+            operations_json=result.operations_json,
+            content_hash=result.content_hash,
+        )
+        db.add(version)
+        return version
+
+    def _admit(self, image: ImageAsset, source: Path, options: ProcessRequest, wait: bool):
+        admission = self.processor.admission
+        if admission is None:
+            return contextlib.nullcontext()
+        if image.width and image.height and image.current_path == image.original_path:
+            width, height = image.width, image.height
+        else:
+            _, width, height = probe_dimensions(source) or ("", 0, 0)
+        cost = self.processor.estimate_memory_bytes(width, height, options)
+        # Queued jobs wait for capacity; interactive requests are told to come back later instead.
+        return admission.reserve(cost, user_id=None if wait else image.owner_id, wait=wait)
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import get_settings
+from app.db import SessionLocal
+from app.models import ResultCacheEntry
+from app.schemas import ProcessRequest
+from app.services.storage import StorageService
+
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_operations(options: ProcessRequest) -> str:
+    return json.dumps(options.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+
+
+class ResultCache:
+    def __init__(self, storage: StorageService) -> None:
+        self.settings = get_settings()
+        self.storage = storage
+        self.enabled = self.settings.result_cache_enabled
+        self.max_bytes = self.settings.result_cache_max_mb * 2**20
+
+    def key_for(self, input_hash: str, operations_json: str, config_fingerprint: str) -> str:
+        # The fingerprint covers tool commands, model weights and tiling, so results made with
+        # an older configuration stop matching instead of being served until evicted.
+        return hashlib.sha256(f"{input_hash}\n{operations_json}\n{config_fingerprint}".encode()).hexdigest()
+
+    def lookup(self, cache_key: str) -> str | None:
+        if not self.enabled:
+            return None
+        with SessionLocal() as db:
+            entry = db.query(ResultCacheEntry).filter(ResultCacheEntry.cache_key == cache_key).first()
+            if entry is None:
+                return None
+            if not self.storage.exists(entry.path):
+                db.delete(entry)
+                db.commit()
+                return None
+            entry.hit_count += 1
+            entry.last_used_at = datetime.utcnow()
+            db.commit()
+            return entry.path
+
+    def store(self, cache_key: str, input_hash: str, operations_json: str, artifact: str, size_bytes: int) -> None:
+        # Artifacts are blobs; the cache only indexes them and its row counts as a blob reference.
+        if not self.enabled:
+            return
+
+        with SessionLocal() as db:
+            db.add(
+                ResultCacheEntry(
+                    cache_key=cache_key,
+                    input_hash=input_hash,
+                    operations_json=operations_json,
+                    path=artifact,
+                    size_bytes=size_bytes,
+                )
+            )
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+        self.evict()
+
+    def evict(self) -> None:
+        with SessionLocal() as db:
+            total = db.scalar(select(func.coalesce(func.sum(ResultCacheEntry.size_bytes), 0))) or 0
+            if total <= self.max_bytes:
+                return
+            for entry in db.query(ResultCacheEntry).order_by(ResultCacheEntry.last_used_at).all():
+                if total <= self.max_bytes:
+                    break
+                # Dropping the row releases the blob; the blob collector deletes it once nothing else refers to it.
+                logger.info("Evicted cached result %s", entry.cache_key)
+                total -= entry.size_bytes
+                db.delete(entry)
+            db.commit()
@@ -0,0 +1,158 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from app.core.config import get_settings
+from app.db import engine
+
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "session_revoked"
+
+
+@dataclass(frozen=True)
+class CachedSession:
+    user_id: int
+    email: str
+    expires_at: float
+
+
+class LocalInvalidationChannel:
+    # Single-process stand-in: revocations reach only this process's subscribers.
+    def __init__(self) -> None:
+        self._subscribers: list[Callable[[str], None]] = []
+
+    def subscribe(self, callback: Callable[[str], None]) -> None:
+        self._subscribers.append(callback)
+
+    def publish(self, jti: str) -> None:
+        for callback in self._subscribers:
+            callback(jti)
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class PostgresInvalidationChannel(LocalInvalidationChannel):
+    # Fans revocations out to every worker process through LISTEN/NOTIFY.
+    def __init__(self, database_url: str) -> None:
+        super().__init__()
+        self.conninfo = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def publish(self, jti: str) -> None:
+        super().publish(jti)
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :jti)"), {"channel": NOTIFY_CHANNEL, "jti": jti})
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name="session-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _listen(self) -> None:
+        import psycopg
+
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(self.conninfo, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    while not self._stop.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            for callback in self._subscribers:
+                                callback(notify.payload)
+            except Exception:  # noqa: BLE001
+                # Notifications missed while reconnecting are covered by the cache TTL.
+                logger.exception("Session invalidation listener failed; reconnecting")
+                self._stop.wait(5)
+
+
+def create_invalidation_channel() -> LocalInvalidationChannel:
+    settings = get_settings()
+    mode = settings.session_invalidation.lower()
+    if mode == "auto":
+        mode = "postgres" if settings.database_url.startswith("postgresql") else "local"
+    if mode == "postgres":
+        return PostgresInvalidationChannel(settings.database_url)
+    return LocalInvalidationChannel()
+
+
+class SessionCache:
+    def __init__(self, channel: LocalInvalidationChannel | None = None) -> None:
+        settings = get_settings()
+        self.ttl_seconds = settings.session_cache_ttl_seconds
+        self.max_entries = settings.session_cache_max_entries
+        self.channel = channel or create_invalidation_channel()
+        self.channel.subscribe(self._evict)
+        self._entries: OrderedDict[str, CachedSession] = OrderedDict()
+        # Revoked jtis are remembered for one TTL so a lookup racing the logout cannot re-cache them.
+        self._revoked: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, jti: str, user_id: int) -> CachedSession | None:
+        if self.ttl_seconds <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(jti)
+            if entry is None:
+                return None
+            if entry.expires_at <= now or entry.user_id != user_id:
+                del self._entries[jti]
+                return None
+            self._entries.move_to_end(jti)
+            return entry
+
+    def put(self, jti: str, user_id: int, email: str, token_expires_in: float) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        now = time.monotonic()
+        expires_at = now + min(self.ttl_seconds, token_expires_in)
+        with self._lock:
+            if self._revoked.get(jti, 0.0) > now:
+                return
+            self._entries[jti] = CachedSession(user_id=user_id, email=email, expires_at=expires_at)
+            self._entries.move_to_end(jti)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, jti: str) -> None:
+        self.channel.publish(jti)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._revoked.clear()
+
+    def start(self) -> None:
+        self.channel.start()
+
+    def stop(self) -> None:
+        self.channel.stop()
+
+    def _evict(self, jti: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(jti, None)
+            self._revoked[jti] = now + self.ttl_seconds
+            if len(self._revoked) > self.max_entries:
+                self._revoked = {key: until for key, until in self._revoked.items() if until > now}
@@ -1,40 +1,156 @@
-import shutil
+import hashlib
+import io
+import warnings
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from uuid import uuid4
 
 from fastapi import UploadFile
+from PIL import Image
 
 from app.core.config import get_settings
+from app.services.blobs import HASH_CHUNK_SIZE, BlobStore, sha256_file  # noqa: F401
+from app.services.object_store import ScratchCache, create_object_store
 
 
-ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+# Headers (including EXIF/ICC segments) normally sit well inside this prefix.
+HEADER_PROBE_BYTES = 1024 * 1024
+
+# Magic bytes -> canonical extension. WEBP is RIFF with a format tag at offset 8.
+MAGIC_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"BM", ".bmp"),
+    (b"II*\x00", ".tif"),
+    (b"MM\x00*", ".tif"),
+)
+PIL_FORMATS = {"JPEG": ".jpg", "MPO": ".jpg", "PNG": ".png", "WEBP": ".webp", "BMP": ".bmp", "TIFF": ".tif"}
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+@dataclass
+class StoredUpload:
+    key: str
+    content_hash: str
+    size_bytes: int
+    width: int
+    height: int
+
+
+def sniff_extension(head: bytes) -> str | None:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    for signature, ext in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+
+def probe_dimensions(source: bytes | Path) -> tuple[str, int, int] | None:
+    # Image.open parses only the header; pixel data is never decoded or allocated.
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+                return image.format or "", image.width, image.height
+    except Image.DecompressionBombError as exc:
+        raise UploadTooLargeError("Image dimensions exceed the allowed limit") from exc
+    except (OSError, SyntaxError, ValueError):
+        return None
 
 
 class StorageService:
     def __init__(self) -> None:
         self.settings = get_settings()
         self.base_dir = Path(self.settings.storage_dir)
+        self.objects = create_object_store(self.base_dir)
+        self.blobs = BlobStore(self.objects, self.base_dir / "tmp")
+        self.scratch = ScratchCache(self.objects, self.base_dir / "scratch", self.settings.scratch_cache_max_mb * 2**20)
 
-    def user_upload_dir(self, user_id: int) -> Path:
-        path = self.base_dir / "uploads" / str(user_id)
-        path.mkdir(parents=True, exist_ok=True)
-        return path
+    # Path columns hold either a blob key or, for rows not yet migrated, a local file path.
+    @contextmanager
+    def local_copy(self, locator: str) -> Iterator[Path]:
+        # The path stays valid (not evicted from the scratch cache) until the block exits.
+        if not self.blobs.is_blob(locator):
+            yield Path(locator)
+            return
+        with self.scratch.pinned(locator) as path:
+            yield path
+
+    def cached_path(self, locator: str) -> Path | None:
+        if self.blobs.is_blob(locator):
+            return self.scratch.cached_path(locator)
+        return Path(locator)
 
-    def user_processed_dir(self, user_id: int) -> Path:
-        path = self.base_dir / "processed" / str(user_id)
+    def exists(self, locator: str) -> bool:
+        if self.blobs.is_blob(locator):
+            return self.objects.exists(locator)
+        return Path(locator).exists()
+
+    def presigned_url(self, locator: str, filename: str | None = None) -> str | None:
+        if self.blobs.is_blob(locator):
+            return self.objects.presigned_url(locator, filename)
+        return None
+
+    def derivatives_dir(self) -> Path:
+        path = self.base_dir / "derivatives"
         path.mkdir(parents=True, exist_ok=True)
         return path
 
-    def save_upload(self, file: UploadFile, user_id: int) -> Path:
-        ext = Path(file.filename or "").suffix.lower()
-        if ext not in ALLOWED_EXTENSIONS:
-            raise ValueError("Unsupported file type")
+    def save_upload(self, file: UploadFile) -> StoredUpload:
+        max_bytes = self.settings.upload_max_mb * 2**20
+        scratch = self.blobs.scratch_path(".part")
+        digest = hashlib.sha256()
+        head = b""
+        ext = None
+        probed = None
+        size = 0
+
+        try:
+            with scratch.open("wb") as output:
+                while chunk := file.file.read(HASH_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise UploadTooLargeError(f"File exceeds {self.settings.upload_max_mb} MB")
+                    if probed is None and len(head) < HEADER_PROBE_BYTES:
+                        head += chunk[: HEADER_PROBE_BYTES - len(head)]
+                        if ext is None:
+                            ext = sniff_extension(head)
+                            if ext is None and len(head) >= 16:
+                                raise ValueError("Unsupported file type")
+                        probed = probe_dimensions(head)
+                        if probed is not None:
+                            self._check_dimensions(probed, ext)
+                    digest.update(chunk)
+                    output.write(chunk)
+
+            if ext is None:
+                raise ValueError("Unsupported file type")
+            if probed is None:
+                # Some layouts (e.g. TIFF with a trailing IFD) only parse from the complete file.
+                probed = probe_dimensions(scratch)
+                if probed is None:
+                    raise ValueError("File is not a readable image")
+                self._check_dimensions(probed, ext)
 
-        upload_dir = self.user_upload_dir(user_id)
-        filename = f"{uuid4().hex}{ext}"
-        destination = upload_dir / filename
+            content_hash = digest.hexdigest()
+            # Re-uploading identical bytes reuses the existing blob.
+            key = self.blobs.commit(scratch, digest=content_hash, ext=ext)
+        finally:
+            scratch.unlink(missing_ok=True)
 
-        with destination.open("wb") as output:
-            shutil.copyfileobj(file.file, output)
+        _, width, height = probed
+        return StoredUpload(key=key, content_hash=content_hash, size_bytes=size, width=width, height=height)
 
-        return destination
+    def _check_dimensions(self, probed: tuple[str, int, int], ext: str | None) -> None:
+        image_format, width, height = probed
+        if PIL_FORMATS.get(image_format) != ext:
+            raise ValueError("File content does not match a supported image format")
+        if width <= 0 or height <= 0:
+            raise ValueError("File is not a readable image")
+        if width * height > self.settings.upload_max_megapixels * 1_000_000:
+            raise UploadTooLargeError(f"Image exceeds {self.settings.upload_max_megapixels} megapixels")
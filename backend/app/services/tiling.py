@@ -0,0 +1,221 @@
+import logging
+import struct
+import zlib
+from collections.abc import Callable
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from app.services.frames import RAW_SUFFIX
+
+
+logger = logging.getLogger(__name__)
+
+# Rough CPU working set of RRDBNet per input pixel (feature maps plus upsampled output).
+MODEL_BYTES_PER_INPUT_PIXEL = 3072
+# Band accumulator: float32 BGR sum plus a float32 weight per output pixel.
+ACCUMULATOR_BYTES_PER_OUTPUT_PIXEL = 16
+MIN_TILE = 64
+MAX_TILE = 1024
+WRITE_CHUNK_ROWS = 64
+
+UpscaleFn = Callable[[np.ndarray], np.ndarray]
+
+
+def estimate_full_upscale_bytes(height: int, width: int, scale: int) -> int:
+    return height * width * MODEL_BYTES_PER_INPUT_PIXEL + height * width * scale * scale * 3 * 2
+
+
+def tile_working_bytes(tile: int, width: int, scale: int, overlap: int) -> int:
+    span = tile + 2 * overlap
+    band = span * scale * width * scale * ACCUMULATOR_BYTES_PER_OUTPUT_PIXEL
+    model = span * span * MODEL_BYTES_PER_INPUT_PIXEL
+    return band + model
+
+
+def choose_tile_size(width: int, scale: int, overlap: int, budget_bytes: int) -> int:
+    for tile in range(MAX_TILE, MIN_TILE - 1, -16):
+        if tile_working_bytes(tile, width, scale, overlap) <= budget_bytes:
+            return tile
+    # The band accumulator spans the full output width, so a wide enough image overruns any
+    # budget; run anyway at the smallest tile rather than refuse work admission already accepted.
+    logger.warning(
+        "Tiled x%d upscale of a %d px wide image needs about %d MiB at the smallest tile, over the %d MiB budget",
+        scale,
+        width,
+        tile_working_bytes(MIN_TILE, width, scale, overlap) // 2**20,
+        budget_bytes // 2**20,
+    )
+    return MIN_TILE
+
+
+class PngStreamWriter:
+    def __init__(self, path: Path, width: int, height: int, compression: int = 1) -> None:
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._file = path.open("wb")
+        self._compressor = zlib.compressobj(compression)
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        rgb = rows[:, :, ::-1].reshape(rows.shape[0], -1)
+        # "Sub" filter: each byte minus the same channel of the pixel to its left.
+        filtered = np.empty((rgb.shape[0], rgb.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:4] = rgb[:, :3]
+        np.subtract(rgb[:, 3:], rgb[:, :-3], out=filtered[:, 4:], dtype=np.uint8, casting="unsafe")
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+        self.rows_written += rows.shape[0]
+
+    def close(self) -> None:
+        self._chunk(b"IDAT", self._compressor.flush())
+        self._chunk(b"IEND", b"")
+        self._file.close()
+
+    def abort(self) -> None:
+        self._file.close()
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(kind)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+class MemmapImageWriter:
+    # Formats without a streaming encoder here: stage rows in a disk-backed array and encode once.
+    def __init__(self, path: Path, width: int, height: int) -> None:
+        self.path = path
+        self.rows_written = 0
+        self._scratch = path.with_name(path.name + ".rows.npy")
+        self._rows = np.lib.format.open_memmap(self._scratch, mode="w+", dtype=np.uint8, shape=(height, width, 3))
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        self._rows[self.rows_written : self.rows_written + rows.shape[0]] = rows
+        self.rows_written += rows.shape[0]
+
+    def close(self) -> None:
+        self._rows.flush()
+        try:
+            if not cv2.imwrite(str(self.path), self._rows):
+                raise RuntimeError("Unable to write upscaled image")
+        finally:
+            self.abort()
+
+    def abort(self) -> None:
+        del self._rows
+        self._scratch.unlink(missing_ok=True)
+
+
+class RawRowWriter:
+    # For output a later stage reads back a band at a time: rows land in the .npy file itself.
+    def __init__(self, path: Path, width: int, height: int) -> None:
+        self.path = path
+        self.rows_written = 0
+        self._rows = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(height, width, 3))
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        self._rows[self.rows_written : self.rows_written + rows.shape[0]] = rows
+        self.rows_written += rows.shape[0]
+
+    def close(self) -> None:
+        self._rows.flush()
+        del self._rows
+
+    def abort(self) -> None:
+        del self._rows
+        self.path.unlink(missing_ok=True)
+
+
+RowWriter = PngStreamWriter | MemmapImageWriter | RawRowWriter
+
+
+def open_row_writer(path: Path, width: int, height: int) -> RowWriter:
+    suffix = path.suffix.lower()
+    if suffix == ".png":
+        return PngStreamWriter(path, width, height)
+    if suffix == RAW_SUFFIX:
+        return RawRowWriter(path, width, height)
+    return MemmapImageWriter(path, width, height)
+
+
+def _ramp(start: int, stop: int, size: int, overlap: int, scale: int) -> np.ndarray:
+    # Per-output-pixel blend weight along one axis for a tile spanning input [start, stop).
+    coords = (np.arange((stop - start) * scale, dtype=np.float32) + 0.5) / scale + start
+    weights = np.ones_like(coords)
+    if overlap > 0:
+        if start > 0:
+            weights = np.minimum(weights, (coords - start) / (2 * overlap))
+        if stop < size:
+            weights = np.minimum(weights, (stop - coords) / (2 * overlap))
+    return np.clip(weights, 1e-3, 1.0)
+
+
+def tiled_upscale(
+    image: np.ndarray,
+    upscale: UpscaleFn,
+    scale: int,
+    tile: int,
+    overlap: int,
+    writer: RowWriter,
+    on_tile: Callable[[int, int], None] | None = None,
+) -> None:
+    height, width = image.shape[:2]
+    out_width = width * scale
+    band_starts = list(range(0, height, tile))
+    col_starts = list(range(0, width, tile))
+    total_tiles = len(band_starts) * len(col_starts)
+    done_tiles = 0
+
+    # Only one band of output rows (plus the overlap carried into the next band) is ever resident.
+    capacity = (min(tile, height) + 2 * overlap) * scale
+    acc = np.zeros((capacity, out_width, 3), dtype=np.float32)
+    weight = np.zeros((capacity, out_width), dtype=np.float32)
+    acc_start = 0
+    used = 0
+
+    for band_index, by in enumerate(band_starts):
+        y0 = max(by - overlap, 0)
+        y1 = min(by + tile + overlap, height)
+        used = max(used, y1 * scale - acc_start)
+
+        wy = _ramp(y0, y1, height, overlap, scale)
+        for bx in col_starts:
+            x0 = max(bx - overlap, 0)
+            x1 = min(bx + tile + overlap, width)
+            out = upscale(image[y0:y1, x0:x1])
+            expected = ((y1 - y0) * scale, (x1 - x0) * scale)
+            if out.shape[:2] != expected:
+                out = cv2.resize(out, (expected[1], expected[0]), interpolation=cv2.INTER_CUBIC)
+
+            w = wy[:, None] * _ramp(x0, x1, width, overlap, scale)[None, :]
+            rows = slice(y0 * scale - acc_start, y1 * scale - acc_start)
+            cols = slice(x0 * scale, x1 * scale)
+            acc[rows, cols] += out * w[:, :, None]
+            weight[rows, cols] += w
+
+            done_tiles += 1
+            if on_tile is not None:
+                on_tile(done_tiles, total_tiles)
+
+        is_last = band_index == len(band_starts) - 1
+        final_end = height * scale if is_last else max(by + tile - overlap, 0) * scale
+        ready = final_end - acc_start
+        for start in range(0, ready, WRITE_CHUNK_ROWS):
+            stop = min(start + WRITE_CHUNK_ROWS, ready)
+            blended = acc[start:stop] / weight[start:stop, :, None]
+            writer.write_rows(np.clip(blended + 0.5, 0, 255).astype(np.uint8))
+
+        carry = used - ready
+        if ready > 0:
+            acc[:carry] = acc[ready:used]
+            weight[:carry] = weight[ready:used]
+            acc[carry:used] = 0
+            weight[carry:used] = 0
+            acc_start = final_end
+            used = carry
@@ -0,0 +1,172 @@
+import contextvars
+import os
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+
+POLL_INTERVAL_SECONDS = 0.2
+# VmHWM keeps each process's own peak between samples, so memory can be read far less often
+# than cancellation is polled.
+MEMORY_SAMPLE_SECONDS = 1.0
+KILL_GRACE_SECONDS = 5.0
+READ_CHUNK_BYTES = 64 * 1024
+
+# Set by callers that can observe the client going away; a running tool is killed when it fires.
+tool_cancel: contextvars.ContextVar[threading.Event | None] = contextvars.ContextVar("tool_cancel", default=None)
+
+
+class ToolCancelled(RuntimeError):
+    pass
+
+
+class ToolTimeout(RuntimeError):
+    pass
+
+
+@dataclass
+class ToolRun:
+    returncode: int | None
+    wall_seconds: float
+    peak_rss_bytes: int
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+    cancelled: bool = False
+
+
+class LogTail:
+    # Keeps only the last `limit` bytes so a chatty tool cannot grow memory without bound.
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.buffer = bytearray()
+        self.dropped = 0
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        overflow = len(self.buffer) - self.limit
+        if overflow > 0:
+            del self.buffer[:overflow]
+            self.dropped += overflow
+
+    def text(self) -> str:
+        prefix = f"[{self.dropped} bytes truncated]\n" if self.dropped else ""
+        return prefix + self.buffer.decode("utf-8", errors="replace")
+
+
+def _descendants(pid: int) -> list[int]:
+    # Walks the tool's process tree through /proc/<pid>/task/<tid>/children instead of scanning
+    # every process on the host. Helpers that daemonise away from the tree are not counted.
+    found = [pid]
+    index = 0
+    while index < len(found):
+        for children in Path(f"/proc/{found[index]}/task").glob("*/children"):
+            try:
+                found.extend(int(child) for child in children.read_text().split())
+            except (OSError, ValueError):
+                continue
+        index += 1
+    return found
+
+
+def _tree_memory(pid: int) -> tuple[int, int]:
+    # Returns (current RSS summed over the tool's processes, largest per-process high-water mark).
+    rss_total = 0
+    hwm_max = 0
+    for member in _descendants(pid):
+        try:
+            for line in Path(f"/proc/{member}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    rss_total += int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    hwm_max = max(hwm_max, int(line.split()[1]) * 1024)
+        except (OSError, ValueError, IndexError):
+            continue
+    return rss_total, hwm_max
+
+
+def _drain(stream, tail: LogTail) -> None:
+    while chunk := stream.read1(READ_CHUNK_BYTES):
+        tail.write(chunk)
+    stream.close()
+
+
+def _kill_group(process: subprocess.Popen) -> None:
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(KILL_GRACE_SECONDS)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def run_tool(
+    command: str,
+    timeout: float | None = None,
+    log_limit: int = 64 * 1024,
+    cancel: threading.Event | None = None,
+) -> ToolRun:
+    # Blocks the calling thread (a request thread or a job worker) for the whole run, like the
+    # plain subprocess call it replaces; what it adds is the deadline, cancellation, bounded
+    # logs and memory accounting.
+    if cancel is None:
+        cancel = tool_cancel.get()
+    started = time.perf_counter()
+    # A new session makes the tool its own process group, so every helper it forks is killed with it.
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    stdout, stderr = LogTail(log_limit), LogTail(log_limit)
+    readers = [
+        threading.Thread(target=_drain, args=(process.stdout, stdout), daemon=True),
+        threading.Thread(target=_drain, args=(process.stderr, stderr), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+    deadline = time.monotonic() + timeout if timeout else None
+    peak = 0
+    next_sample = 0.0
+    timed_out = cancelled = False
+
+    try:
+        while process.poll() is None:
+            if time.monotonic() >= next_sample:
+                rss, hwm = _tree_memory(process.pid)
+                peak = max(peak, rss, hwm)
+                next_sample = time.monotonic() + MEMORY_SAMPLE_SECONDS
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                timed_out = True
+                break
+            try:
+                process.wait(POLL_INTERVAL_SECONDS)
+            except subprocess.TimeoutExpired:
+                continue
+    finally:
+        if process.poll() is None:
+            _kill_group(process)
+        for reader in readers:
+            reader.join()
+
+    return ToolRun(
+        returncode=process.returncode,
+        wall_seconds=time.perf_counter() - started,
+        peak_rss_bytes=peak,
+        stdout=stdout.text(),
+        stderr=stderr.text(),
+        timed_out=timed_out,
+        cancelled=cancelled,
+    )
@@ -0,0 +1,231 @@
+"""Offline benchmarks for the processing pipeline and the API hot paths.
+
+Run from ``backend/``: ``python -m benchmarks.bench_suite``. Everything runs against a
+throwaway SQLite database and storage directory; ML steps are replaced by
+``benchmarks/stub_tool.py`` through the ``*_CMD`` settings. Results are written as JSON
+(``--output``) and two result files can be diffed with ``--compare OLD NEW``.
+"""
+import argparse
+import fnmatch
+import io
+import os
+import random
+import sys
+import tempfile
+from collections.abc import Callable, Iterator
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import cv2
+
+from benchmarks.bench_enhance import synthetic_image
+from benchmarks.harness import ScenarioResult, git_revision, measure, print_comparison, print_table, write_results
+
+
+STUB_TOOL = Path(__file__).with_name("stub_tool.py")
+RESULTS_DIR = Path(__file__).with_name("results")
+BENCH_EMAIL = "bench@example.com"
+
+Scenario = tuple[str, Callable[[int], object], int]
+
+
+def configure_environment(workdir: Path) -> None:
+    # Must run before anything under `app` is imported: settings and the engine are module globals.
+    tool = f"{sys.executable} {STUB_TOOL}"
+    os.environ.update(
+        {
+            "DATABASE_URL": f"sqlite:///{workdir / 'bench.db'}",
+            "STORAGE_DIR": str(workdir / "storage"),
+            "STORAGE_BACKEND": "local",
+            "JOB_WORKERS": "0",
+            "SESSION_INVALIDATION": "local",
+            "RESULT_CACHE_ENABLED": "false",
+            "INTERMEDIATE_CACHE_ENABLED": "false",
+            "DERIVATIVES_EAGER": "false",
+            "BLOB_MIGRATE_LEGACY": "false",
+            "REALESRGAN_CMD": f"{tool} upscale 4 {{input}} {{output}}",
+            "GFPGAN_CMD": f"{tool} copy {{input}} {{output}}",
+            "DEOLDIFY_CMD": f"{tool} copy {{input}} {{output}}",
+        }
+    )
+
+
+def opencv_scenarios(megapixels: list[float], denoise_max_mp: float, iterations: int, workdir: Path) -> Iterator[Scenario]:
+    from app.schemas import OpenCVOptions
+    from app.services.frames import Frame
+    from app.services.processing import ProcessingService
+
+    service = ProcessingService()
+    output = workdir / "opencv_out.png"
+    enhance = OpenCVOptions(sharpen=True, contrast=1.2, saturation=1.3, gamma=0.9)
+    denoise = OpenCVOptions(denoise=True)
+    for mp in megapixels:
+        image = synthetic_image(mp, seed=1)
+        yield f"opencv_step/enhance/{mp:g}MP", lambda _, image=image: service._step_opencv(Frame(array=image), output, enhance), iterations
+        if mp <= denoise_max_mp:
+            yield f"opencv_step/denoise/{mp:g}MP", lambda _, image=image: service._step_opencv(Frame(array=image), output, denoise), max(1, iterations // 4)
+
+
+def pipeline_scenarios(megapixels: list[float], iterations: int, workdir: Path) -> Iterator[Scenario]:
+    from app.schemas import OpenCVOptions, ProcessRequest
+    from app.services.processing import ProcessingService
+
+    service = ProcessingService()
+    options = ProcessRequest(upscale=True, face_restore=True, colorize=True, opencv=OpenCVOptions(contrast=1.1))
+    for mp in megapixels:
+        source = workdir / f"pipeline_{mp:g}.png"
+        cv2.imwrite(str(source), synthetic_image(mp, seed=2))
+        destination = workdir / f"pipeline_{mp:g}_out.png"
+        yield f"pipeline/stubbed_tools/{mp:g}MP", lambda _, source=source, destination=destination: service.process_image(source, destination, options), iterations
+
+
+def upload_scenarios(megapixels: list[float], iterations: int) -> Iterator[Scenario]:
+    from fastapi import UploadFile
+
+    from app.services.storage import StorageService
+
+    storage = StorageService()
+    for mp in megapixels:
+        ok, encoded = cv2.imencode(".jpg", synthetic_image(mp, seed=3), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        payload = encoded.tobytes()
+
+        def upload(index: int, payload: bytes = payload) -> None:
+            # Bytes after the JPEG end marker are ignored by decoders but give every upload a new hash,
+            # so each call writes a fresh blob instead of deduplicating against the previous one.
+            data = payload + index.to_bytes(8, "big", signed=True)
+            storage.save_upload(UploadFile(io.BytesIO(data), filename="bench.jpg"))
+
+        yield f"save_upload/{mp:g}MP", upload, iterations
+
+
+def seed_library(library_size: int, other_users: int, seed: int) -> str:
+    # Returns a bearer token for the benchmark user, who owns `library_size` images.
+    from sqlalchemy import insert
+
+    from app.core.security import create_access_token
+    from app.db import SessionLocal
+    from app.models import AuthToken, ImageAsset, User
+
+    rng = random.Random(seed)
+    epoch = datetime(2024, 1, 1)
+    with SessionLocal() as db:
+        users = [User(email=BENCH_EMAIL, password_hash="-")]
+        users += [User(email=f"other{index}@example.com", password_hash="-") for index in range(other_users)]
+        db.add_all(users)
+        db.flush()
+        for user in users:
+            count = library_size if user.email == BENCH_EMAIL else max(1, library_size // 10)
+            rows = []
+            for index in range(count):
+                updated = epoch + timedelta(seconds=rng.randrange(0, 365 * 86400))
+                rows.append(
+                    {
+                        "owner_id": user.id,
+                        "original_name": f"photo_{index}.jpg",
+                        "original_path": f"blobs/00/00/{index:064x}.jpg",
+                        "current_path": f"blobs/00/00/{index:064x}.jpg",
+                        "current_version": 1,
+                        "created_at": updated,
+                        "updated_at": updated,
+                    }
+                )
+            db.execute(insert(ImageAsset), rows)
+
+        token, jti, expires_at = create_access_token(subject=BENCH_EMAIL, user_id=users[0].id)
+        db.add(AuthToken(jti=jti, user_id=users[0].id, expires_at=expires_at))
+        db.commit()
+    return token
+
+
+def api_scenarios(token: str, library_size: int, iterations: int) -> Iterator[Scenario]:
+    from fastapi.security import HTTPAuthorizationCredentials
+    from fastapi.testclient import TestClient
+
+    from app.db import SessionLocal
+    from app.deps import get_current_user, session_cache
+    from app.main import app
+    from app.models import ImageAsset
+    from app.routers.images import _encode_cursor
+
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {token}"}
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    with SessionLocal() as db:
+        middle = (
+            db.query(ImageAsset)
+            .filter(ImageAsset.owner_id == get_current_user(credentials, db).id)
+            .order_by(ImageAsset.updated_at.desc(), ImageAsset.id.desc())
+            .offset(library_size // 2)
+            .first()
+        )
+        deep_cursor = _encode_cursor(middle) if middle is not None else None
+
+    def list_page(_: int, params: dict) -> None:
+        response = client.get("/api/images", params=params, headers=headers)
+        response.raise_for_status()
+
+    yield "list_images/first_page", lambda index: list_page(index, {"limit": 100}), iterations
+    if deep_cursor:
+        yield "list_images/deep_page", lambda index: list_page(index, {"limit": 100, "cursor": deep_cursor}), iterations
+
+    def current_user(_: int, cached: bool) -> None:
+        if not cached:
+            session_cache.clear()
+        with SessionLocal() as db:
+            get_current_user(credentials, db)
+
+    yield "get_current_user/cache_hit", lambda index: current_user(index, True), iterations * 10
+    yield "get_current_user/cache_miss", lambda index: current_user(index, False), iterations * 10
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", nargs="+", default=["*"], help="glob patterns selecting scenarios")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[0.5, 2.0, 8.0])
+    parser.add_argument("--pipeline-megapixels", type=float, nargs="+", default=[0.25, 1.0])
+    parser.add_argument("--denoise-max-mp", type=float, default=2.0)
+    parser.add_argument("--library-size", type=int, default=20000)
+    parser.add_argument("--other-users", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("BASELINE", "CANDIDATE"))
+    args = parser.parse_args()
+
+    if args.compare:
+        print_comparison(*args.compare)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="image-restore-bench-") as tmp:
+        workdir = Path(tmp)
+        configure_environment(workdir)
+
+        from app.db import ensure_storage_dirs, init_db
+
+        init_db()
+        ensure_storage_dirs()
+        token = seed_library(args.library_size, args.other_users, args.seed)
+
+        def scenarios() -> Iterator[Scenario]:
+            yield from opencv_scenarios(args.megapixels, args.denoise_max_mp, args.iterations, workdir)
+            yield from pipeline_scenarios(args.pipeline_megapixels, max(1, args.iterations // 4), workdir)
+            yield from upload_scenarios(args.megapixels, args.iterations)
+            yield from api_scenarios(token, args.library_size, args.iterations)
+
+        results: dict[str, ScenarioResult] = {}
+        for name, fn, iterations in scenarios():
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in args.only):
+                continue
+            print(f"running {name} ...", file=sys.stderr)
+            results[name] = measure(fn, iterations)
+
+    print_table(results)
+    output = args.output or RESULTS_DIR / f"{git_revision()}.json"
+    options = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    write_results(output, results, options)
+    print(f"\nwrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Timing, memory and reporting helpers shared by the benchmark scripts."""
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+
+@dataclass
+class ScenarioResult:
+    iterations: int
+    throughput_per_second: float
+    mean_ms: float
+    p50_ms: float
+    p99_ms: float
+    # Python allocations in this process only; work done in pool workers or external tools shows
+    # up in peak_children_mb instead.
+    peak_traced_mb: float
+    peak_children_mb: float = 0.0
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    # Nearest-rank, so small sample counts report an observed value rather than an interpolation.
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _descendant_rss_bytes(pid: int) -> int:
+    # Current RSS summed over every process below `pid`, found through /proc/<pid>/task/*/children.
+    found = [pid]
+    total = 0
+    index = 0
+    while index < len(found):
+        for children in Path(f"/proc/{found[index]}/task").glob("*/children"):
+            try:
+                found.extend(int(child) for child in children.read_text().split())
+            except (OSError, ValueError):
+                continue
+        index += 1
+    for member in found[1:]:
+        try:
+            for line in Path(f"/proc/{member}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+        except (OSError, ValueError, IndexError):
+            continue
+    return total
+
+
+class ChildMemorySampler:
+    # Peak memory of child processes while the block runs: the summed RSS of live descendants,
+    # sampled on a thread. Short-lived tools can start and exit between samples, so a child
+    # reaped meanwhile that raises ru_maxrss(RUSAGE_CHILDREN) counts too. Sampling reads /proc.
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def __enter__(self) -> "ChildMemorySampler":
+        self._reaped_before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        reaped = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if reaped > self._reaped_before:
+            # ru_maxrss is in KiB on Linux.
+            self.peak_bytes = max(self.peak_bytes, reaped * 1024)
+
+    def _sample(self) -> None:
+        pid = os.getpid()
+        while True:
+            self.peak_bytes = max(self.peak_bytes, _descendant_rss_bytes(pid))
+            if self._stop.wait(self.interval):
+                return
+
+
+def measure(fn: Callable[[int], object], iterations: int, warmup: int = 1) -> ScenarioResult:
+    # `fn` receives the iteration number so scenarios can vary their input between calls.
+    for index in range(warmup):
+        fn(-1 - index)
+
+    # Memory is traced in a separate pass because tracemalloc slows allocation-heavy code.
+    tracemalloc.start()
+    with ChildMemorySampler() as children:
+        fn(-1 - warmup)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples = []
+    for index in range(iterations):
+        started = time.perf_counter()
+        fn(index)
+        samples.append(time.perf_counter() - started)
+
+    total = sum(samples)
+    return ScenarioResult(
+        iterations=iterations,
+        throughput_per_second=round(iterations / total, 3) if total else 0.0,
+        mean_ms=round(total * 1000 / iterations, 3),
+        p50_ms=round(percentile(samples, 0.50) * 1000, 3),
+        p99_ms=round(percentile(samples, 0.99) * 1000, 3),
+        peak_traced_mb=round(peak / 2**20, 2),
+        peak_children_mb=round(children.peak_bytes / 2**20, 2),
+    )
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(path: Path, results: dict[str, ScenarioResult], options: dict) -> None:
+    document = {
+        "meta": {
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "options": options,
+        },
+        "scenarios": {name: asdict(result) for name, result in sorted(results.items())},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+
+
+def print_table(results: dict[str, ScenarioResult]) -> None:
+    print(
+        f"{'scenario':<40} {'n':>4} {'ops/s':>10} {'p50 ms':>10} {'p99 ms':>10} "
+        f"{'parent MB':>10} {'children MB':>12}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<40} {result.iterations:>4} {result.throughput_per_second:>10.2f} "
+            f"{result.p50_ms:>10.2f} {result.p99_ms:>10.2f} {result.peak_traced_mb:>10.1f} "
+            f"{result.peak_children_mb:>12.1f}"
+        )
+
+
+def print_comparison(baseline_path: Path, candidate_path: Path) -> None:
+    # Changes are relative to the baseline: higher is better for ops/s, lower for everything else.
+    baseline = json.loads(baseline_path.read_text())
+    candidate = json.loads(candidate_path.read_text())
+    print(f"{baseline['meta']['revision']} -> {candidate['meta']['revision']}")
+    print(
+        f"{'scenario':<40} {'p50 ms':>18} {'p99 ms':>18} {'ops/s':>18} {'parent MB':>18} {'children MB':>18}"
+    )
+
+    def change(old: float, new: float) -> str:
+        if not old:
+            return f"{new:>10.2f}        "
+        return f"{new:>10.2f} {100 * (new - old) / old:>+6.1f}%"
+
+    for name, new in candidate["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if old is None:
+            print(f"{name:<40} (new)")
+            continue
+        print(
+            f"{name:<40} {change(old['p50_ms'], new['p50_ms'])} {change(old['p99_ms'], new['p99_ms'])} "
+            f"{change(old['throughput_per_second'], new['throughput_per_second'])} "
+            f"{change(old['peak_traced_mb'], new['peak_traced_mb'])} "
+            f"{change(old.get('peak_children_mb', 0.0), new.get('peak_children_mb', 0.0))}"
+        )
+    for name in sorted(baseline["scenarios"].keys() - candidate["scenarios"].keys()):
+        print(f"{name:<40} (removed)")
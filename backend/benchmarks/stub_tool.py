@@ -0,0 +1,24 @@
+"""Deterministic stand-in for the external ML tools, wired in through ``*_CMD``.
+
+``python stub_tool.py upscale 4 IN OUT`` resizes by the factor; ``copy IN OUT`` re-encodes.
+"""
+import sys
+
+import cv2
+
+
+def main() -> None:
+    mode, *rest = sys.argv[1:]
+    if mode == "upscale":
+        factor, source, target = int(rest[0]), rest[1], rest[2]
+        image = cv2.imread(source, cv2.IMREAD_COLOR)
+        image = cv2.resize(image, None, fx=factor, fy=factor, interpolation=cv2.INTER_NEAREST)
+    else:
+        source, target = rest
+        image = cv2.imread(source, cv2.IMREAD_COLOR)
+    if image is None or not cv2.imwrite(target, image):
+        sys.exit(f"stub_tool: could not process {source}")
+
+
+if __name__ == "__main__":
+    main()
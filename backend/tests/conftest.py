@@ -0,0 +1,66 @@
+import os
+import tempfile
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+
+# Settings and the module-level services read the environment once, at import time, so the test
+# database and storage are pointed at a scratch directory before anything under app/ is imported.
+_ROOT = Path(tempfile.mkdtemp(prefix="image-restore-tests-"))
+os.environ.update(
+    {
+        "DATABASE_URL": f"sqlite:///{_ROOT / 'test.db'}",
+        "STORAGE_DIR": str(_ROOT / "storage"),
+        "STORAGE_BACKEND": "local",
+        "JOB_WORKERS": "0",
+        "PASSWORD_HASH_WORKERS": "0",
+        "BCRYPT_ROUNDS": "4",
+        "BLOB_GC_INTERVAL_SECONDS": "0",
+        "MODEL_WARMUP": "",
+    }
+)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def settings():
+    from app.core.config import get_settings
+
+    return get_settings()
+
+
+def register(client, password: str = "correct-horse") -> tuple[str, dict[str, str]]:
+    email = f"user-{uuid4().hex[:12]}@example.com"
+    assert client.post("/api/auth/register", json={"email": email, "password": password}).status_code == 200
+    response = client.post("/api/auth/login", json={"email": email, "password": password})
+    assert response.status_code == 200
+    return email, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def auth(client) -> dict[str, str]:
+    return register(client)[1]
+
+
+def png_bytes(width: int = 64, height: int = 48, seed: int = 0) -> bytes:
+    import cv2
+    import numpy as np
+
+    image = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    ok, encoded = cv2.imencode(".png", image)
+    assert ok
+    return encoded.tobytes()
+
+
+def upload(client, headers: dict[str, str], data: bytes | None = None, name: str = "photo.png"):
+    return client.post("/api/images/upload", files={"file": (name, data or png_bytes(), "image/png")}, headers=headers)
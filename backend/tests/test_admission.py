@@ -0,0 +1,76 @@
+import pytest
+
+from app.routers.images import admission
+from app.services.admission import AdmissionController, AdmissionRejected
+from conftest import png_bytes, upload
+
+
+OPTIONS = {"opencv": {"contrast": 1.25}}
+
+
+@pytest.fixture
+def image_id(client, auth, request) -> int:
+    seed = 1000 + sum(map(ord, request.node.name))
+    return upload(client, auth, png_bytes(seed=seed)).json()["id"]
+
+
+def _user_id(client, headers) -> int:
+    return client.get("/api/auth/me", headers=headers).json()["id"]
+
+
+def _process(client, headers, image_id: int):
+    return client.post(f"/api/images/{image_id}/process", json=OPTIONS, headers=headers)
+
+
+def test_image_larger_than_the_budget_is_rejected(client, auth, image_id, monkeypatch):
+    monkeypatch.setattr(admission, "budget_bytes", 1024)
+    response = _process(client, auth, image_id)
+    assert response.status_code == 413
+    assert "retry-after" not in response.headers
+
+
+def test_user_over_their_concurrency_quota_is_throttled(client, auth, image_id, monkeypatch):
+    monkeypatch.setattr(admission, "user_max_concurrent", 1)
+    with admission.reserve(1, user_id=_user_id(client, auth)):
+        response = _process(client, auth, image_id)
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == str(admission.retry_after)
+    assert _process(client, auth, image_id).status_code == 200
+
+
+def test_exhausted_capacity_is_unavailable(client, auth, image_id):
+    with admission.reserve(admission.budget_bytes):
+        response = _process(client, auth, image_id)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(admission.retry_after)
+    assert admission.reserved_bytes() == 0
+
+
+def test_busy_stage_is_unavailable(client, auth, image_id, monkeypatch):
+    monkeypatch.setattr(admission, "step_wait_seconds", 0.05)
+    semaphore = admission._steps["opencv"]
+    held = 0
+    while semaphore.acquire(timeout=0):
+        held += 1
+    try:
+        response = _process(client, auth, image_id)
+    finally:
+        for _ in range(held):
+            semaphore.release()
+    assert response.status_code == 503
+    assert "opencv" in response.json()["detail"]
+    assert admission.reserved_bytes() == 0
+
+
+def test_first_request_is_admitted_even_above_the_user_share():
+    controller = AdmissionController()
+    controller.budget_bytes = 100
+    controller.user_share = 0.5
+    with controller.reserve(80, user_id=1):
+        with pytest.raises(AdmissionRejected) as rejected:
+            with controller.reserve(10, user_id=1):
+                pass
+        assert rejected.value.status_code == 429
+        with controller.reserve(20, user_id=2):
+            assert controller.reserved_bytes() == 100
+    assert controller.reserved_bytes() == 0
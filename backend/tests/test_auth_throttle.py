@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from app.routers.auth import login_throttle, password_hasher
+from conftest import register
+
+
+@pytest.fixture(autouse=True)
+def fresh_throttle(monkeypatch):
+    monkeypatch.setattr(login_throttle, "_failures", type(login_throttle._failures)())
+
+
+def _login(client, email: str, password: str):
+    return client.post("/api/auth/login", json={"email": email, "password": password})
+
+
+def test_repeated_failures_for_an_email_are_throttled(client, settings):
+    email, _ = register(client)
+    for _ in range(settings.login_max_failures_per_email):
+        assert _login(client, email, "wrong-password").status_code == 401
+
+    throttled = _login(client, email, "correct-horse")
+    assert throttled.status_code == 429
+    assert int(throttled.headers["retry-after"]) >= 1
+
+
+def test_throttle_expires_with_its_window(client, settings, monkeypatch):
+    monkeypatch.setattr(login_throttle, "window", 0.2)
+    email, _ = register(client)
+    for _ in range(settings.login_max_failures_per_email):
+        _login(client, email, "wrong-password")
+    assert _login(client, email, "correct-horse").status_code == 429
+
+    time.sleep(0.3)
+    assert _login(client, email, "correct-horse").status_code == 200
+
+
+def test_successful_login_clears_the_email_count(client, settings):
+    email, _ = register(client)
+    for _ in range(settings.login_max_failures_per_email - 1):
+        _login(client, email, "wrong-password")
+    assert _login(client, email, "correct-horse").status_code == 200
+    assert _login(client, email, "wrong-password").status_code == 401
+    assert _login(client, email, "correct-horse").status_code == 200
+
+
+def test_failures_across_emails_throttle_the_client_address(client, settings, monkeypatch):
+    email, _ = register(client)
+    monkeypatch.setattr(settings, "login_max_failures_per_ip", 3)
+    for index in range(3):
+        assert _login(client, f"nobody-{index}@example.com", "guess").status_code == 401
+    assert _login(client, email, "correct-horse").status_code == 429
+
+
+def test_throttled_login_is_refused_before_hashing(client, settings, monkeypatch):
+    email, _ = register(client)
+    for _ in range(settings.login_max_failures_per_email):
+        _login(client, email, "wrong-password")
+    monkeypatch.setattr(password_hasher, "max_pending", 0)
+    assert _login(client, email, "correct-horse").status_code == 429
+
+
+def test_busy_hasher_sheds_load(client, settings, monkeypatch):
+    email, _ = register(client)
+    monkeypatch.setattr(password_hasher, "max_pending", 0)
+
+    for response in (
+        _login(client, email, "correct-horse"),
+        client.post("/api/auth/register", json={"email": "busy@example.com", "password": "correct-horse"}),
+    ):
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == str(settings.login_busy_retry_after_seconds)
+
+    # A busy hasher is not a wrong password, so it does not count towards the throttle.
+    assert not login_throttle._failures
@@ -0,0 +1,64 @@
+import json
+import threading
+import time
+
+from sqlalchemy import update
+
+from app.db import SessionLocal
+from app.models import ProcessingJob
+from app.services import jobs
+from conftest import png_bytes, register, upload
+
+
+def _submit_batch(client, headers, count: int = 3) -> dict:
+    image_ids = [upload(client, headers, png_bytes(seed=100 + index)).json()["id"] for index in range(count)]
+    response = client.post("/api/batches", json={"image_ids": image_ids, "options": {"opencv": {"contrast": 1.1}}}, headers=headers)
+    assert response.status_code == 202
+    return response.json()
+
+
+def _run_in_background(job_ids: list[int]) -> threading.Thread:
+    # Stands in for a pool worker: claim the jobs, then run them in this process.
+    with SessionLocal() as db:
+        db.execute(update(ProcessingJob).where(ProcessingJob.id.in_(job_ids)).values(status=jobs.JOB_RUNNING))
+        db.commit()
+    jobs._init_worker()
+    thread = threading.Thread(target=jobs._run_jobs, args=(job_ids,))
+    thread.start()
+    return thread
+
+
+def _stream(client, headers, batch_id: int) -> list[dict]:
+    with client.stream("GET", f"/api/batches/{batch_id}/results", headers=headers) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        return [json.loads(line) for line in response.iter_lines() if line]
+
+
+def test_stream_yields_each_job_once_and_ends(client, auth, settings, monkeypatch):
+    monkeypatch.setattr(settings, "job_poll_interval_seconds", 0.05)
+    batch = _submit_batch(client, auth)
+    worker = _run_in_background(batch["job_ids"])
+    try:
+        lines = _stream(client, auth, batch["batch_id"])
+    finally:
+        worker.join()
+
+    assert sorted(line["id"] for line in lines) == sorted(batch["job_ids"])
+    assert {line["status"] for line in lines} == {jobs.JOB_SUCCEEDED}
+
+
+def test_stream_stops_at_the_deadline(client, auth, settings, monkeypatch):
+    monkeypatch.setattr(settings, "job_poll_interval_seconds", 0.05)
+    monkeypatch.setattr(settings, "batch_stream_max_seconds", 0.5)
+    batch = _submit_batch(client, auth, count=1)
+
+    started = time.monotonic()
+    assert _stream(client, auth, batch["batch_id"]) == []
+    assert time.monotonic() - started < 5
+
+
+def test_stream_of_another_users_batch_is_not_found(client, auth):
+    batch = _submit_batch(client, auth, count=1)
+    _, other = register(client)
+    assert client.get(f"/api/batches/{batch['batch_id']}/results", headers=other).status_code == 404
@@ -0,0 +1,109 @@
+import os
+import time
+
+import pytest
+
+from app.db import SessionLocal
+from app.models import ImageAsset, ResultCacheEntry
+from app.routers.images import storage
+from conftest import png_bytes, upload
+
+
+@pytest.fixture
+def blobs(monkeypatch):
+    monkeypatch.setattr(storage.blobs, "grace_seconds", 0)
+    return storage.blobs
+
+
+def _age(key: str, seconds: float = 10) -> None:
+    # Backdates a local blob so it is past any small grace period.
+    path = storage.objects.local_path(key)
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def _delete_image(image_id: int) -> None:
+    with SessionLocal() as db:
+        db.delete(db.get(ImageAsset, image_id))
+        db.commit()
+
+
+def test_identical_uploads_share_one_blob(client, auth):
+    data = png_bytes(seed=31)
+    first, second = (upload(client, auth, data).json()["id"] for _ in range(2))
+    with SessionLocal() as db:
+        assert db.get(ImageAsset, first).original_path == db.get(ImageAsset, second).original_path
+
+
+def test_shared_blob_lives_until_its_last_reference_is_gone(client, auth, blobs):
+    data = png_bytes(seed=32)
+    first, second = (upload(client, auth, data).json()["id"] for _ in range(2))
+    with SessionLocal() as db:
+        key = db.get(ImageAsset, first).original_path
+    _age(key)
+
+    _delete_image(first)
+    blobs.collect()
+    assert storage.objects.exists(key)
+    assert client.get(f"/api/images/{second}/download", headers=auth).content == data
+
+    _delete_image(second)
+    blobs.collect()
+    assert not storage.objects.exists(key)
+
+
+def test_every_referenced_blob_survives_collection(client, auth, blobs):
+    image_id = upload(client, auth, png_bytes(seed=33)).json()["id"]
+    assert client.post(f"/api/images/{image_id}/process", json={"opencv": {"gamma": 1.4}}, headers=auth).status_code == 200
+    with SessionLocal() as db:
+        referenced = blobs.referenced_paths(db)
+    for key in referenced:
+        if blobs.is_blob(key):
+            _age(key)
+
+    blobs.collect()
+    assert all(storage.objects.exists(key) for key in referenced if blobs.is_blob(key))
+    for version in (1, 2):
+        assert client.get(f"/api/images/{image_id}/download?version={version}", headers=auth).status_code == 200
+
+
+def test_result_cache_entries_hold_their_blob(blobs, tmp_path):
+    source = tmp_path / "cached.png"
+    source.write_bytes(png_bytes(seed=34))
+    key = blobs.commit(source)
+    _age(key)
+    with SessionLocal() as db:
+        db.add(ResultCacheEntry(cache_key="test-gc-entry", input_hash=blobs.digest_of(key), path=key, operations_json="[]", size_bytes=1))
+        db.commit()
+
+    blobs.collect()
+    assert storage.objects.exists(key)
+
+
+def test_unreferenced_blob_is_kept_for_the_grace_period(blobs, monkeypatch, tmp_path):
+    source = tmp_path / "orphan.png"
+    source.write_bytes(png_bytes(seed=35))
+    key = blobs.commit(source)
+
+    # Not referenced yet, as if its row were still in an open transaction.
+    monkeypatch.setattr(blobs, "grace_seconds", 60)
+    blobs.collect()
+    assert storage.objects.exists(key)
+
+    _age(key, 120)
+    blobs.collect()
+    assert not storage.objects.exists(key)
+
+
+def test_recommitting_a_blob_refreshes_its_age(blobs, monkeypatch, tmp_path):
+    data = png_bytes(seed=36)
+    source = tmp_path / "again.png"
+    source.write_bytes(data)
+    key = blobs.commit(source)
+    _age(key, 120)
+
+    source.write_bytes(data)
+    assert blobs.commit(source) == key
+    monkeypatch.setattr(blobs, "grace_seconds", 60)
+    blobs.collect()
+    assert storage.objects.exists(key)
@@ -0,0 +1,27 @@
+import dataclasses
+
+import pytest
+
+from app.core.security import decode_token
+from app.deps import CurrentUser, _cached_user, session_cache
+from conftest import register
+
+
+def test_database_and_cached_lookups_return_the_same_frozen_user(client):
+    email, headers = register(client)
+    payload = decode_token(headers["Authorization"].removeprefix("Bearer "))
+    session_cache.clear()
+
+    first = client.get("/api/auth/me", headers=headers).json()
+    cached = _cached_user(payload)
+    assert isinstance(cached, CurrentUser)
+    assert client.get("/api/auth/me", headers=headers).json() == first == {"id": cached.id, "email": email}
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        cached.email = "someone-else@example.com"
+
+
+def test_logout_revokes_a_cached_session(client):
+    _, headers = register(client)
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    assert client.post("/api/auth/logout", headers=headers).status_code == 204
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
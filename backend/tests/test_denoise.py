@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.services import denoise, processing
+from app.services.processing import ProcessingService
+
+
+@pytest.fixture(scope="module")
+def photo() -> np.ndarray:
+    rng = np.random.default_rng(3)
+    image = cv2.GaussianBlur(rng.integers(0, 256, (400, 300, 3), dtype=np.uint8), (0, 0), 2)
+    return cv2.add(image, rng.integers(0, 20, image.shape, dtype=np.uint8))
+
+
+def _single_shot(image: np.ndarray, h: float) -> np.ndarray:
+    return cv2.fastNlMeansDenoisingColored(image, None, h, h, denoise.TEMPLATE_WINDOW, denoise.SEARCH_WINDOW)
+
+
+def test_bands_match_a_single_pass(photo, monkeypatch):
+    monkeypatch.setattr(denoise, "available_cpus", lambda: 2)
+    banded = denoise.denoise_colored(photo, 6.0, workers=2, min_parallel_pixels=0)
+    assert np.array_equal(banded, _single_shot(photo, 6.0))
+
+
+def test_one_usable_cpu_denoises_single_shot(photo, monkeypatch):
+    monkeypatch.setattr(denoise, "available_cpus", lambda: 1)
+    monkeypatch.setattr(denoise, "_get_pool", lambda workers: pytest.fail("started a band pool on one CPU"))
+    assert np.array_equal(denoise.denoise_colored(photo, 6.0, workers=8, min_parallel_pixels=0), _single_shot(photo, 6.0))
+
+
+@pytest.mark.parametrize(("cpus", "job_workers", "hash_workers", "expected"), [(16, 2, 2, 12), (4, 2, 2, 1), (1, 0, 0, 1)])
+def test_band_pool_gets_the_cores_other_pools_leave(settings, cpus, job_workers, hash_workers, expected, monkeypatch):
+    configured = settings.model_copy(
+        update={"denoise_workers": 0, "job_workers": job_workers, "password_hash_workers": hash_workers}
+    )
+    monkeypatch.setattr(processing, "get_settings", lambda: configured)
+    monkeypatch.setattr(processing, "available_cpus", lambda: cpus)
+    assert ProcessingService().denoise_workers == expected
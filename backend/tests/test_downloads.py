@@ -0,0 +1,108 @@
+import pytest
+
+from app.db import SessionLocal, init_db
+from app.models import ImageAsset, ImageVersion
+from app.routers.images import restorer
+from conftest import png_bytes, upload
+
+
+@pytest.fixture
+def image(client, auth) -> tuple[int, bytes]:
+    data = png_bytes(96, 64, seed=7)
+    return upload(client, auth, data).json()["id"], data
+
+
+@pytest.mark.parametrize("route", ["download", "preview"])
+def test_matching_etag_returns_not_modified(client, auth, image, route):
+    image_id, _ = image
+    first = client.get(f"/api/images/{image_id}/{route}", headers=auth)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    cached = client.get(f"/api/images/{image_id}/{route}", headers={**auth, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert cached.content == b""
+
+    weak = client.get(f"/api/images/{image_id}/{route}", headers={**auth, "If-None-Match": f'"other", W/{etag}'})
+    assert weak.status_code == 304
+
+    stale = client.get(f"/api/images/{image_id}/{route}", headers={**auth, "If-None-Match": '"other"'})
+    assert stale.status_code == 200
+
+
+def test_etags_differ_between_versions_and_sizes(client, auth, image):
+    image_id, _ = image
+    thumb = client.get(f"/api/images/{image_id}/preview?size=thumb", headers=auth).headers["etag"]
+    preview = client.get(f"/api/images/{image_id}/preview?size=preview", headers=auth).headers["etag"]
+    original = client.get(f"/api/images/{image_id}/download", headers=auth).headers["etag"]
+    assert client.post(f"/api/images/{image_id}/process", json={"opencv": {"contrast": 1.3}}, headers=auth).status_code == 200
+    current = client.get(f"/api/images/{image_id}/download", headers=auth)
+
+    assert len({thumb, preview, original, current.headers["etag"]}) == 4
+    assert client.get(f"/api/images/{image_id}/download?version=1", headers=auth).headers["etag"] == original
+
+
+def test_pinned_versions_are_immutable(client, auth, image):
+    image_id, _ = image
+    pinned = client.get(f"/api/images/{image_id}/download?version=1", headers=auth)
+    current = client.get(f"/api/images/{image_id}/download", headers=auth)
+    assert "immutable" in pinned.headers["cache-control"]
+    assert "immutable" not in current.headers["cache-control"]
+
+
+def test_range_request_returns_partial_content(client, auth, image):
+    image_id, data = image
+    response = client.get(f"/api/images/{image_id}/download?version=1", headers={**auth, "Range": "bytes=8-23"})
+    assert response.status_code == 206
+    assert response.content == data[8:24]
+    assert response.headers["content-range"] == f"bytes 8-23/{len(data)}"
+
+
+def test_if_range_with_a_stale_etag_sends_the_whole_file(client, auth, image):
+    image_id, data = image
+    response = client.get(
+        f"/api/images/{image_id}/download?version=1",
+        headers={**auth, "Range": "bytes=0-9", "If-Range": '"stale"'},
+    )
+    assert response.status_code == 200
+    assert response.content == data
+
+
+def test_preview_range_request(client, auth, image):
+    image_id, _ = image
+    full = client.get(f"/api/images/{image_id}/preview", headers=auth).content
+    partial = client.get(f"/api/images/{image_id}/preview", headers={**auth, "Range": "bytes=0-3"})
+    assert partial.status_code == 206
+    assert partial.content == full[:4] == b"RIFF"
+
+
+def _unhashed_copy(image_id: int) -> int:
+    # A version as recorded before content hashes existed.
+    with SessionLocal() as db:
+        original = db.query(ImageVersion).filter(ImageVersion.image_id == image_id).one()
+        legacy = ImageVersion(image_id=image_id, version=2, path=original.path, operations_json="[]", content_hash=None)
+        db.add(legacy)
+        db.flush()
+        db.query(ImageAsset).filter(ImageAsset.id == image_id).update({ImageAsset.current_version: 2})
+        db.commit()
+        return legacy.id
+
+
+def test_serving_an_unhashed_version_does_not_write(client, auth, image):
+    image_id, _ = image
+    version_id = _unhashed_copy(image_id)
+    etag = client.get(f"/api/images/{image_id}/download?version=1", headers=auth).headers["etag"]
+
+    assert client.get(f"/api/images/{image_id}/download", headers=auth).headers["etag"] == etag
+    with SessionLocal() as db:
+        assert db.get(ImageVersion, version_id).content_hash is None
+
+
+def test_startup_backfills_missing_hashes(client, auth, image):
+    image_id, _ = image
+    version_id = _unhashed_copy(image_id)
+    init_db()
+    with SessionLocal() as db:
+        version = db.get(ImageVersion, version_id)
+        assert version.content_hash == restorer.storage.blobs.digest_of(version.path)
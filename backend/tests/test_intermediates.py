@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from app.services.frames import RAW_SUFFIX, Frame, write_image
+from app.services.intermediates import ENCODED_SUFFIX, IntermediateStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    intermediates = IntermediateStore()
+    intermediates.enabled = True
+    intermediates.root = tmp_path / "intermediates"
+    return intermediates
+
+
+def _image(height: int = 40, width: int = 60) -> np.ndarray:
+    return np.random.default_rng(9).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def test_arrays_are_stored_losslessly_compressed(store):
+    image = _image()
+    frame = Frame(array=image)
+    assert store.put("ab" + "0" * 62, frame) is frame
+
+    cached = store.get("ab" + "0" * 62)
+    assert cached.path.suffix == ENCODED_SUFFIX
+    assert np.array_equal(cached.array(), image)
+
+
+def test_raw_files_are_encoded_and_left_to_the_pipeline(store, tmp_path):
+    image = _image()
+    raw = tmp_path / f"upscaled{RAW_SUFFIX}"
+    write_image(raw, image)
+    frame = Frame(path=raw, owned=True)
+
+    assert store.put("cd" + "0" * 62, frame) is frame
+    assert raw.exists()
+    assert np.array_equal(store.get("cd" + "0" * 62).array(), image)
+
+
+def test_entries_over_the_size_cap_are_not_cached(store):
+    store.max_entry_bytes = _image().nbytes - 1
+    store.put("ef" + "0" * 62, Frame(array=_image()))
+    assert store.get("ef" + "0" * 62) is None
+    assert not list(store.root.glob("*/*"))
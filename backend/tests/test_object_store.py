@@ -0,0 +1,147 @@
+import os
+import time
+
+import pytest
+
+from app.core.config import get_settings
+from app.services.object_store import (
+    SCRATCH_STAGING_STALE_SECONDS,
+    LocalObjectStore,
+    MemoryObjectStore,
+    ScratchCache,
+)
+
+
+@pytest.fixture
+def s3_store(monkeypatch):
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    from app.services.object_store import S3ObjectStore
+
+    for name, value in {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }.items():
+        monkeypatch.setenv(name, value)
+    settings = get_settings()
+    monkeypatch.setattr(settings, "s3_bucket", "image-restore-test")
+    monkeypatch.setattr(settings, "s3_prefix", "objects")
+    monkeypatch.setattr(settings, "s3_region", "us-east-1")
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="image-restore-test")
+        yield S3ObjectStore()
+
+
+def _is_s3(store) -> bool:
+    return type(store).__name__ == "S3ObjectStore"
+
+
+@pytest.fixture(params=["memory", "local", "s3"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryObjectStore()
+    if request.param == "local":
+        return LocalObjectStore(tmp_path / "objects")
+    return request.getfixturevalue("s3_store")
+
+
+def test_store_contract(store, tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"first")
+    key = "blobs/ab/cd/object.bin"
+
+    assert not store.exists(key)
+    assert store.put_file(key, source)
+    # A separate file: the local backend may hard-link the source, as blob commits expect.
+    other = tmp_path / "other.bin"
+    other.write_bytes(b"second")
+    assert not store.put_file(key, other), "second put replaced an existing key"
+    assert store.exists(key)
+
+    copy = tmp_path / "copy.bin"
+    store.get_file(key, copy)
+    assert copy.read_bytes() == b"first"
+
+    listed = {item.key: item for item in store.list("blobs/")}
+    assert set(listed) == {key}
+    assert listed[key].size_bytes == len(b"first")
+    assert not list(store.list("other/"))
+
+    before = listed[key].modified_at
+    # S3 timestamps have one-second resolution.
+    time.sleep(1.1 if _is_s3(store) else 0.01)
+    store.touch(key)
+    assert next(iter(store.list("blobs/"))).modified_at > before
+
+    store.delete(key)
+    assert not store.exists(key)
+    store.delete(key)
+    with pytest.raises(FileNotFoundError):
+        store.get_file(key, copy)
+
+
+def test_only_s3_presigns(store, tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"data")
+    store.put_file("blobs/x.bin", source)
+    url = store.presigned_url("blobs/x.bin", "x.bin")
+    if _is_s3(store):
+        assert url and "objects/blobs/x.bin" in url and "x.bin" in url
+    else:
+        assert url is None
+
+
+def test_s3_get_of_missing_key_raises(s3_store, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        s3_store.get_file("blobs/missing.bin", tmp_path / "out.bin")
+
+
+def _scratch(tmp_path, max_bytes=0):
+    store = MemoryObjectStore()
+    source = tmp_path / "payload.bin"
+    source.write_bytes(b"x" * 1024)
+    for name in ("a", "b"):
+        store.put_file(f"blobs/{name}.bin", source)
+    return ScratchCache(store, tmp_path / "scratch", max_bytes=max_bytes)
+
+
+def test_scratch_cache_keeps_pinned_copies(tmp_path):
+    # A zero budget makes every unpinned entry a candidate; only pins keep them.
+    cache = _scratch(tmp_path)
+    with cache.pinned("blobs/a.bin") as first, cache.pinned("blobs/b.bin") as second:
+        assert first.read_bytes() == b"x" * 1024
+        cache.collect()
+        assert first.exists() and second.exists()
+        with cache.pinned("blobs/a.bin") as again:
+            assert again == first
+        cache.collect()
+        assert first.exists(), "releasing a nested pin let collect evict the entry"
+        assert cache.cached_path("blobs/b.bin") == second
+
+
+def test_scratch_cache_enforces_budget_on_unpinned_copies(tmp_path):
+    cache = _scratch(tmp_path)
+    with cache.pinned("blobs/a.bin") as first:
+        pass
+    leftover = first.with_name(f".{first.name}.partial")
+    leftover.write_bytes(b"partial")
+    stale = time.time() - SCRATCH_STAGING_STALE_SECONDS - 1
+    os.utime(leftover, (stale, stale))
+    with cache.pinned("blobs/b.bin") as second:
+        cache.collect()
+        assert not first.exists(), "an idle copy survived over budget"
+        assert not leftover.exists(), "a stale staging file survived"
+        assert second.exists()
+
+
+def test_memory_store_refused_with_job_workers(monkeypatch, tmp_path):
+    from app.services.object_store import create_object_store
+
+    settings = get_settings()
+    monkeypatch.setattr(settings, "storage_backend", "memory")
+    monkeypatch.setattr(settings, "job_workers", 2)
+    with pytest.raises(RuntimeError, match="JOB_WORKERS=0"):
+        create_object_store(tmp_path)
+    monkeypatch.setattr(settings, "job_workers", 0)
+    assert isinstance(create_object_store(tmp_path), MemoryObjectStore)
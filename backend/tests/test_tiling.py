@@ -0,0 +1,79 @@
+import contextlib
+import logging
+
+import cv2
+import numpy as np
+import pytest
+
+from app.schemas import OpenCVOptions, ProcessRequest
+from app.services import frames
+from app.services.processing import ProcessingService
+from app.services.tiling import MIN_TILE, choose_tile_size
+
+
+class NearestUpsampler:
+    # Stands in for Real-ESRGAN: deterministic, and blending overlapping tiles of it is lossless.
+    def enhance(self, image: np.ndarray, outscale: int) -> tuple[np.ndarray, None]:
+        return cv2.resize(image, None, fx=outscale, fy=outscale, interpolation=cv2.INTER_NEAREST), None
+
+
+class StubModels:
+    @contextlib.contextmanager
+    def acquire(self, key: str):
+        yield NearestUpsampler()
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    service = ProcessingService()
+    service.models = StubModels()
+    service.intermediates.enabled = False
+    monkeypatch.setattr(service, "settings", service.settings.model_copy())
+    service.settings.realesrgan_cmd = None
+    service.settings.realesrgan_tile_overlap = 4
+    return service
+
+
+def _source(tmp_path):
+    rng = np.random.default_rng(5)
+    image = cv2.GaussianBlur(rng.integers(0, 256, (150, 90, 3), dtype=np.uint8), (0, 0), 1.5)
+    path = tmp_path / "source.png"
+    cv2.imwrite(str(path), image)
+    return path
+
+
+def test_opencv_after_a_tiled_upscale_streams_and_matches_a_single_pass(processor, tmp_path, monkeypatch):
+    source = _source(tmp_path)
+    options = ProcessRequest(upscale=True, opencv=OpenCVOptions(contrast=1.2, saturation=1.3, gamma=1.8, sharpen=True))
+
+    processor.settings.realesrgan_tile_mode = "off"
+    processor.process_image(source, tmp_path / "whole.png", options)
+
+    decoded = []
+    read_image = frames.read_image
+    monkeypatch.setattr(frames, "read_image", lambda path: decoded.append(path.name) or read_image(path))
+    processor.settings.realesrgan_tile_mode = "always"
+    # A tiny budget forces small tiles and many opencv bands.
+    processor.settings.realesrgan_memory_budget_mb = 1
+    processor.process_image(source, tmp_path / "tiled.png", options)
+
+    assert decoded == ["source.png"]
+    whole = cv2.imread(str(tmp_path / "whole.png"))
+    tiled = cv2.imread(str(tmp_path / "tiled.png"))
+    assert np.array_equal(whole, tiled)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["source.png", "tiled.png", "whole.png"]
+
+
+def test_memory_estimate_caps_the_streamed_opencv_stage(processor):
+    processor.settings.realesrgan_tile_mode = "always"
+    options = ProcessRequest(upscale=True, opencv=OpenCVOptions(contrast=1.2))
+    budget = processor.settings.realesrgan_memory_budget_mb * 2**20
+    assert processor.estimate_memory_bytes(4000, 3000, options) == budget
+
+
+def test_smallest_tile_over_budget_is_logged(caplog):
+    with caplog.at_level(logging.WARNING, logger="app.services.tiling"):
+        assert choose_tile_size(4000, 4, 16, 1024 * 2**20) > MIN_TILE
+        assert not caplog.records
+        assert choose_tile_size(100_000, 4, 16, 64 * 2**20) == MIN_TILE
+    assert "over the 64 MiB budget" in caplog.text
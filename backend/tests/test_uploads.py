@@ -0,0 +1,57 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.routers.images import storage
+from conftest import png_bytes, upload
+
+
+def _leftover_parts() -> list:
+    return list(storage.blobs.scratch_dir.glob("*.part")) if storage.blobs.scratch_dir.exists() else []
+
+
+def test_valid_upload_is_stored(client, auth):
+    response = upload(client, auth, png_bytes(40, 30, seed=21))
+    assert response.status_code == 200
+    assert response.json()["current_version"] == 1
+
+
+def test_oversize_upload_is_rejected_while_streaming(client, auth, settings, monkeypatch):
+    monkeypatch.setattr(settings, "upload_max_mb", 1)
+    data = png_bytes(8, 8) + b"\0" * 2**20
+    response = upload(client, auth, data)
+    assert response.status_code == 413
+    assert "1 MB" in response.json()["detail"]
+    assert _leftover_parts() == []
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"#!/bin/sh\necho not an image\n",
+        b"GIF89a" + b"\0" * 64,
+        b"\x89PNG\r\n\x1a\n" + b"garbage" * 16,
+    ],
+    ids=["script", "unsupported-format", "png-magic-only"],
+)
+def test_unrecognised_content_is_rejected(client, auth, data):
+    response = upload(client, auth, data)
+    assert response.status_code == 400
+    assert _leftover_parts() == []
+
+
+def test_extension_in_filename_is_not_trusted(client, auth):
+    ok, jpeg = cv2.imencode(".jpg", np.zeros((16, 16, 3), np.uint8))
+    assert ok
+    response = upload(client, auth, b"\x89PNG\r\n\x1a\n" + jpeg.tobytes(), name="photo.png")
+    assert response.status_code == 400
+
+
+def test_megapixel_cap_is_checked_from_the_header(client, auth, settings, monkeypatch):
+    monkeypatch.setattr(settings, "upload_max_megapixels", 1)
+    ok, encoded = cv2.imencode(".png", np.zeros((1000, 1200), np.uint8))
+    assert ok
+    response = upload(client, auth, encoded.tobytes())
+    assert response.status_code == 413
+    assert "megapixels" in response.json()["detail"]
+    assert _leftover_parts() == []
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from app.db import SessionLocal
+from app.models import ImageAsset, ImageVersion
+from app.routers.images import restorer
+from app.services.restore import RestoreResult
+from conftest import png_bytes, register, upload
+
+
+def _record(image_id: int, path: str) -> int:
+    with SessionLocal() as db:
+        version = restorer.record_version(db, image_id, RestoreResult(path=path, operations_json="[]", content_hash=None))
+        db.commit()
+        return version.version
+
+
+def test_concurrent_versions_get_distinct_numbers(client, auth):
+    image_id = upload(client, auth).json()["id"]
+    path = restorer.storage.blobs.key_for("0" * 64, ".png")
+    numbers: list[int] = []
+    errors: list[BaseException] = []
+    start = threading.Barrier(8)
+
+    def worker() -> None:
+        start.wait()
+        try:
+            numbers.append(_record(image_id, path))
+        except BaseException as exc:  # noqa: BLE001
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert sorted(numbers) == list(range(2, 10))
+    with SessionLocal() as db:
+        assert db.get(ImageAsset, image_id).current_version == 9
+        stored = db.query(ImageVersion.version).filter(ImageVersion.image_id == image_id).all()
+        assert sorted(version for (version,) in stored) == list(range(1, 10))
+
+
+def test_recording_for_a_deleted_image_raises_lookup_error():
+    with SessionLocal() as db, pytest.raises(LookupError):
+        restorer.record_version(db, 10**9, RestoreResult(path="blobs/x.png", operations_json="[]", content_hash=None))
+
+
+def test_process_numbers_versions_in_order(client, auth):
+    image_id = upload(client, auth, png_bytes(seed=1)).json()["id"]
+    for expected, contrast in ((2, 1.2), (3, 1.4)):
+        response = client.post(f"/api/images/{image_id}/process", json={"opencv": {"contrast": contrast}}, headers=auth)
+        assert response.status_code == 200
+        assert response.json()["version"] == expected
+
+
+def test_job_stats_only_count_the_callers_jobs(client, auth):
+    image_id = upload(client, auth, png_bytes(seed=2)).json()["id"]
+    assert client.post(f"/api/images/{image_id}/jobs", json={"opencv": {"gamma": 1.2}}, headers=auth).status_code == 202
+
+    _, other = register(client)
+    assert client.get("/api/jobs/stats", headers=other).json()["queued"] == 0
+    assert client.get("/api/jobs/stats", headers=auth).json()["queued"] >= 1
@@ -1,10 +1,10 @@
-const state = { token: localStorage.getItem("token") || "" };
+const state = { token: localStorage.getItem("token") || "", nextCursor: null };
 
 function setStatus(msg) {
   document.getElementById("auth-status").textContent = msg;
 }
 
-async function api(path, options = {}) {
+async function api(path, options = {}, onHeaders = null) {
   const headers = options.headers || {};
   if (state.token) headers.Authorization = `Bearer ${state.token}`;
   const response = await fetch(path, { ...options, headers });
@@ -16,6 +16,7 @@ async function api(path, options = {}) {
     } catch {}
     throw new Error(detail);
   }
+  if (onHeaders) onHeaders(response.headers);
   const contentType = response.headers.get("content-type") || "";
   if (contentType.includes("application/json")) return response.json();
   return response;
@@ -64,6 +65,26 @@ async function uploadImage() {
   await refreshImages();
 }
 
+async function watchProgress(path, signal) {
+  // Server-sent events over fetch so the bearer token can be sent.
+  const response = await api(path, { signal });
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) return;
+    buffer += value;
+    const blocks = buffer.split("\n\n");
+    buffer = blocks.pop();
+    for (const block of blocks) {
+      const line = block.split("\n").find((l) => l.startsWith("data: "));
+      if (!line) continue;
+      const event = JSON.parse(line.slice(6));
+      if (event.stage) setStatus(`Processing: ${event.stage} (${Math.round((event.overall || 0) * 100)}%)`);
+    }
+  }
+}
+
 async function processImage() {
   const imageId = Number(document.getElementById("image-id").value);
   const payload = {
@@ -78,24 +99,45 @@ async function processImage() {
       gamma: Number(document.getElementById("gamma").value),
     },
   };
-  const data = await api(`/api/images/${imageId}/process`, {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify(payload),
-  });
+  const progress = new AbortController();
+  watchProgress(`/api/images/${imageId}/progress`, progress.signal).catch(() => {});
+  let data;
+  try {
+    data = await api(`/api/images/${imageId}/process`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(payload),
+    });
+  } finally {
+    progress.abort();
+  }
   setStatus(`Processed image ${data.image_id} to version ${data.version}`);
   await refreshImages();
 }
 
 async function refreshImages() {
+  document.getElementById("images").innerHTML = "";
+  state.nextCursor = null;
+  await loadImages();
+}
+
+async function loadMoreImages() {
+  if (state.nextCursor) await loadImages(state.nextCursor);
+}
+
+async function loadImages(cursor = null) {
+  // One page per call; further pages are fetched only when asked for.
   const list = document.getElementById("images");
-  list.innerHTML = "";
-  const images = await api("/api/images");
+  const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+  const images = await api(`/api/images${params}`, {}, (headers) => {
+    state.nextCursor = headers.get("X-Next-Cursor");
+  });
   images.forEach((img) => {
     const li = document.createElement("li");
     li.textContent = `ID ${img.id} | ${img.original_name} | version ${img.current_version} | updated ${img.updated_at}`;
     list.appendChild(li);
   });
+  document.getElementById("more-btn").hidden = !state.nextCursor;
 }
 
 async function downloadImage() {
@@ -120,6 +162,7 @@ document.getElementById("logout-btn").addEventListener("click", () => logout().c
 document.getElementById("upload-btn").addEventListener("click", () => uploadImage().catch((e) => setStatus(e.message)));
 document.getElementById("process-btn").addEventListener("click", () => processImage().catch((e) => setStatus(e.message)));
 document.getElementById("refresh-btn").addEventListener("click", () => refreshImages().catch((e) => setStatus(e.message)));
+document.getElementById("more-btn").addEventListener("click", () => loadMoreImages().catch((e) => setStatus(e.message)));
 document.getElementById("download-btn").addEventListener("click", () => downloadImage().catch((e) => setStatus(e.message)));
 
 if (state.token) {
@@ -1,16 +1,155 @@
+# The enhancement engine is the backend's own module. The Node launchers put backend/ on
+# PYTHONPATH; by hand: PYTHONPATH=backend python scripts/opencv_enhance.py --input ... --output ...
 import argparse
+import json
+import os
+import socketserver
+import struct
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
-import numpy as np
+
+from app.services.enhance import enhance_image
+
+# Server frames: 4-byte big-endian length, then a UTF-8 JSON object.
+# Requests carry the CLI options plus an "id"; responses are {"id", "ok", "error"?}.
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_BYTES = 1024 * 1024
+
+
+class StreamDesynced(ValueError):
+    # The length header cannot be trusted, so neither can anything after it on this stream.
+    pass
 
 
-def parse_bool(value: str) -> bool:
+def parse_bool(value) -> bool:
     return str(value).lower() in {'1', 'true', 'yes', 'y'}
 
 
+def enhance_file(job: dict) -> None:
+    image = cv2.imread(str(job['input']), cv2.IMREAD_COLOR)
+    if image is None:
+      raise RuntimeError('Unable to read input image')
+
+    denoise_h = float(job.get('denoise_h') or 0.0)
+    if parse_bool(job.get('denoise', False)) and denoise_h <= 0:
+      denoise_h = 6.0
+
+    sharpen_amount = float(job.get('sharpen_amount') or 0.0)
+    if parse_bool(job.get('sharpen', False)) and sharpen_amount <= 0:
+      sharpen_amount = 1.0
+
+    out = enhance_image(
+      image,
+      contrast=float(job.get('contrast', 1.0)),
+      saturation=float(job.get('saturation', 1.0)),
+      gamma=float(job.get('gamma', 1.0)),
+      sharpen_amount=sharpen_amount,
+      denoise_h=denoise_h,
+      denoise_workers=int(job.get('denoise_workers') or 1),
+    )
+
+    if not cv2.imwrite(str(job['output']), out):
+      raise RuntimeError('Unable to write output image')
+
+
+def read_frame(stream):
+    # Returns the raw payload, or None at end of stream.
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+      return None
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_BYTES:
+      raise StreamDesynced(f'Frame of {length} bytes exceeds limit')
+    payload = stream.read(length)
+    if len(payload) < length:
+      return None
+    return payload
+
+
+def parse_job(payload: bytes) -> dict:
+    job = json.loads(payload.decode('utf-8'))
+    if not isinstance(job, dict):
+      raise ValueError('Frame is not a JSON object')
+    return job
+
+
+def write_frame(stream, lock: threading.Lock, message: dict) -> None:
+    payload = json.dumps(message).encode('utf-8')
+    with lock:
+      stream.write(FRAME_HEADER.pack(len(payload)) + payload)
+      stream.flush()
+
+
+def serve_stream(reader, writer, pool: ThreadPoolExecutor) -> None:
+    # Jobs on one stream run concurrently and answer out of order, matched by id. A bad job
+    # gets an error frame and the stream carries on; only a desynced stream is dropped.
+    lock = threading.Lock()
+
+    def reply(response: dict) -> None:
+      try:
+        write_frame(writer, lock, response)
+      except (BrokenPipeError, OSError):
+        pass
+
+    def run(job: dict) -> None:
+      try:
+        enhance_file(job)
+        response = {'id': job.get('id'), 'ok': True}
+      except Exception as exc:  # noqa: BLE001
+        response = {'id': job.get('id'), 'ok': False, 'error': str(exc) or exc.__class__.__name__}
+      reply(response)
+
+    while True:
+      try:
+        payload = read_frame(reader)
+      except StreamDesynced as exc:
+        reply({'id': None, 'ok': False, 'error': str(exc)})
+        return
+      if payload is None:
+        return
+      try:
+        job = parse_job(payload)
+      except ValueError as exc:
+        # The frame boundary held, so the next frame is still readable. Without a parsed
+        # object there is no id to answer; the client's own timeout covers that request.
+        reply({'id': None, 'ok': False, 'error': f'Malformed frame: {exc}'})
+        continue
+      pool.submit(run, job)
+
+
+def serve_stdio(workers: int) -> None:
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+      serve_stream(sys.stdin.buffer, sys.stdout.buffer, pool)
+
+
+def serve_socket(socket_path: str, workers: int) -> None:
+    pool = ThreadPoolExecutor(max_workers=workers)
+
+    class Handler(socketserver.StreamRequestHandler):
+      def handle(self) -> None:
+        serve_stream(self.rfile, self.wfile, pool)
+
+    if os.path.exists(socket_path):
+      os.unlink(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+      server.daemon_threads = True
+      try:
+        server.serve_forever()
+      finally:
+        pool.shutdown(wait=True)
+        os.unlink(socket_path)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
-    parser.add_argument('--input', required=True)
-    parser.add_argument('--output', required=True)
+    parser.add_argument('--serve', action='store_true', help='handle framed jobs on stdin/stdout')
+    parser.add_argument('--socket', help='handle framed jobs on this Unix socket')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--input')
+    parser.add_argument('--output')
     parser.add_argument('--contrast', type=float, default=1.0)
     parser.add_argument('--saturation', type=float, default=1.0)
     parser.add_argument('--gamma', type=float, default=1.0)
@@ -18,41 +157,19 @@ def main() -> None:
     parser.add_argument('--denoise', default='false')
     parser.add_argument('--sharpen_amount', type=float, default=0.0)
     parser.add_argument('--denoise_h', type=float, default=0.0)
+    parser.add_argument('--denoise_workers', type=int, default=1)
     args = parser.parse_args()
 
-    image = cv2.imread(args.input, cv2.IMREAD_COLOR)
-    if image is None:
-        raise RuntimeError('Unable to read input image')
-
-    out = image.copy()
-
-    denoise_h = float(args.denoise_h)
-    if parse_bool(args.denoise) and denoise_h <= 0:
-      denoise_h = 6.0
-    if denoise_h > 0:
-      out = cv2.fastNlMeansDenoisingColored(out, None, denoise_h, denoise_h, 7, 21)
-
-    sharpen_amount = float(args.sharpen_amount)
-    if parse_bool(args.sharpen) and sharpen_amount <= 0:
-      sharpen_amount = 1.0
-    if sharpen_amount > 0:
-      blur = cv2.GaussianBlur(out, (0, 0), 1.2)
-      out = cv2.addWeighted(out, 1.0 + sharpen_amount, blur, -sharpen_amount, 0)
-
-    if args.contrast != 1.0:
-      out = cv2.convertScaleAbs(out, alpha=args.contrast, beta=0)
-
-    if args.saturation != 1.0:
-      hsv = cv2.cvtColor(out, cv2.COLOR_BGR2HSV).astype(np.float32)
-      hsv[:, :, 1] = np.clip(hsv[:, :, 1] * args.saturation, 0, 255)
-      out = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
-
-    if args.gamma > 0 and args.gamma != 1.0:
-      inv = 1.0 / args.gamma
-      table = np.array([((i / 255.0) ** inv) * 255 for i in range(256)]).astype('uint8')
-      out = cv2.LUT(out, table)
+    if args.socket:
+      serve_socket(args.socket, args.workers)
+      return
+    if args.serve:
+      serve_stdio(args.workers)
+      return
+    if not args.input or not args.output:
+      parser.error('--input and --output are required')
 
-    cv2.imwrite(args.output, out)
+    enhance_file(vars(args))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+const { spawn } = require('child_process');
+const path = require('path');
+
+// Talks to `opencv_enhance.py --serve`: 4-byte big-endian length + JSON per frame,
+// responses matched back to requests by id so jobs can overlap.
+const SCRIPT = path.join(__dirname, '..', 'scripts', 'opencv_enhance.py');
+// The script imports the enhancement engine from the Python backend package.
+const BACKEND_DIR = path.join(__dirname, '..', 'backend');
+const JOB_TIMEOUT_MS = Number(process.env.OPENCV_WORKER_TIMEOUT_MS || 120_000);
+
+function pythonEnv() {
+  const extra = process.env.PYTHONPATH ? [BACKEND_DIR, process.env.PYTHONPATH] : [BACKEND_DIR];
+  return { ...process.env, PYTHONPATH: extra.join(path.delimiter) };
+}
+
+class OpenCVWorker {
+  constructor() {
+    this.child = null;
+    this.buffer = Buffer.alloc(0);
+    this.pending = new Map();
+    this.nextId = 1;
+  }
+
+  start() {
+    if (this.child) return this.child;
+    const python = process.env.PYTHON_BIN || 'python';
+    const args = [SCRIPT, '--serve'];
+    if (process.env.OPENCV_WORKER_THREADS) args.push('--workers', String(process.env.OPENCV_WORKER_THREADS));
+
+    const child = spawn(python, args, { stdio: ['pipe', 'pipe', 'pipe'], env: pythonEnv() });
+    this.child = child;
+    this.buffer = Buffer.alloc(0);
+    let stderr = '';
+
+    // A replaced child can still flush output; it must not land in the new child's buffer.
+    child.stdout.on('data', (chunk) => { if (this.child === child) this.onData(chunk); });
+    child.stderr.on('data', (chunk) => { stderr = (stderr + chunk.toString()).slice(-4096); });
+    child.stdin.on('error', () => {});
+    const onGone = (err) => {
+      if (this.child !== child) return;
+      this.child = null;
+      this.failAll(err || new Error(stderr || 'OpenCV worker exited'));
+    };
+    child.on('error', onGone);
+    child.on('exit', () => onGone());
+    return child;
+  }
+
+  onData(chunk) {
+    this.buffer = Buffer.concat([this.buffer, chunk]);
+    while (this.buffer.length >= 4) {
+      const length = this.buffer.readUInt32BE(0);
+      if (this.buffer.length < 4 + length) return;
+      const payload = this.buffer.subarray(4, 4 + length);
+      this.buffer = this.buffer.subarray(4 + length);
+
+      let message;
+      try {
+        message = JSON.parse(payload.toString('utf8'));
+      } catch (err) {
+        continue;
+      }
+      const job = this.pending.get(message.id);
+      if (!job) continue;
+      this.pending.delete(message.id);
+      clearTimeout(job.timer);
+      if (message.ok) job.resolve();
+      else job.reject(new Error(message.error || 'OpenCV enhancement failed'));
+    }
+  }
+
+  // The timed-out job may still be running, or the worker may be wedged; either way later jobs
+  // would queue behind it. Kill it, fail what it still owes, and let the next run respawn it.
+  restart(err) {
+    const { child } = this;
+    if (!child) return;
+    this.child = null;
+    child.kill('SIGKILL');
+    this.failAll(err);
+  }
+
+  failAll(err) {
+    for (const job of this.pending.values()) {
+      clearTimeout(job.timer);
+      job.reject(err);
+    }
+    this.pending.clear();
+  }
+
+  run(request) {
+    const child = this.start();
+    const id = this.nextId;
+    this.nextId += 1;
+
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        reject(new Error('OpenCV enhancement timed out'));
+        if (this.child === child) this.restart(new Error('OpenCV worker restarted after a timed-out job'));
+      }, JOB_TIMEOUT_MS);
+      this.pending.set(id, { resolve, reject, timer });
+
+      const payload = Buffer.from(JSON.stringify({ ...request, id }), 'utf8');
+      const header = Buffer.alloc(4);
+      header.writeUInt32BE(payload.length, 0);
+      child.stdin.write(Buffer.concat([header, payload]));
+    });
+  }
+
+  stop() {
+    if (!this.child) return;
+    this.child.stdin.end();
+    this.child = null;
+  }
+}
+
+const worker = new OpenCVWorker();
+
+module.exports = { OpenCVWorker, worker, SCRIPT, pythonEnv };
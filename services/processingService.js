@@ -3,10 +3,10 @@ const fs = require('fs');
 const fsp = require('fs/promises');
 const http = require('http');
 const https = require('https');
-const path = require('path');
 const axios = require('axios');
 const FormData = require('form-data');
 const sharp = require('sharp');
+const { worker: opencvWorker, SCRIPT: OPENCV_SCRIPT, pythonEnv } = require('./opencvWorker');
 
 const RESTORE_API_BASE = process.env.ESRGAN_URL || process.env.RESTORE_API_URL || '';
 
@@ -215,21 +215,36 @@ async function processViaRestoreApi(inputPath, outputPath, options = {}, onProgr
 }
 
 async function applyOpenCV(inputPath, outputPath, options = {}) {
+  const request = {
+    input: inputPath,
+    output: outputPath,
+    contrast: Number(options.contrast ?? 1.0),
+    saturation: Number(options.saturation ?? 1.0),
+    gamma: Number(options.gamma ?? 1.0),
+    sharpen_amount: Number(options.sharpen_amount ?? (options.sharpen ? 1 : 0)),
+    denoise_h: Math.max(0, Math.round(Number(options.denoise_h ?? (options.denoise ? 6 : 0))))
+  };
+
+  // The persistent worker keeps cv2/numpy loaded; OPENCV_WORKER=false restores one process per image.
+  if (String(process.env.OPENCV_WORKER || 'true').toLowerCase() !== 'false') {
+    await opencvWorker.run(request);
+    return;
+  }
+
   const python = process.env.PYTHON_BIN || 'python';
-  const script = path.join(__dirname, '..', 'scripts', 'opencv_enhance.py');
   const args = [
-    script,
-    '--input', inputPath,
-    '--output', outputPath,
-    '--contrast', String(options.contrast ?? 1.0),
-    '--saturation', String(options.saturation ?? 1.0),
-    '--gamma', String(options.gamma ?? 1.0),
-    '--sharpen_amount', String(Number(options.sharpen_amount ?? (options.sharpen ? 1 : 0))),
-    '--denoise_h', String(Math.max(0, Math.round(Number(options.denoise_h ?? (options.denoise ? 6 : 0)))))
+    OPENCV_SCRIPT,
+    '--input', request.input,
+    '--output', request.output,
+    '--contrast', String(request.contrast),
+    '--saturation', String(request.saturation),
+    '--gamma', String(request.gamma),
+    '--sharpen_amount', String(request.sharpen_amount),
+    '--denoise_h', String(request.denoise_h)
   ];
 
   await new Promise((resolve, reject) => {
-    const child = spawn(python, args, { stdio: ['ignore', 'pipe', 'pipe'] });
+    const child = spawn(python, args, { stdio: ['ignore', 'pipe', 'pipe'], env: pythonEnv() });
     let stderr = '';
     child.stderr.on('data', (chunk) => { stderr += chunk.toString(); });
     child.on('close', (code) => {